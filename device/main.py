@@ -5,7 +5,9 @@ Main MQTT Application
 from module.camera.camera_direct import CameraDirect
 from mqtt import MQTTClient, VoiceMQTT, GPSMQTT
 from log import setup_logger
-from module.voice_speaker import VoiceSpeaker
+from module.voice_speaker import get_speaker, find_device_index_by_name
+from module.audio_registry import get_audio_registry
+from module.audio_device import AudioDeviceManager
 from mcp_server.server import mcp
 from config import TOPICS
 from module.gps_manager import GPSManager
@@ -14,8 +16,16 @@ logger = setup_logger(__name__)
 from module.obstacle_detection import ObstacleDetectionSystem
 from module.lane_segmentation import LaneSegmentation
 
+try:
+    from config import AUDIO_SHARED_DEVICE
+except ImportError:
+    AUDIO_SHARED_DEVICE = False
+
 def main():
     """Main application loop"""
+    # Dò audio device một lần (đọc từ cache nếu không có hotplug)
+    get_audio_registry()
+
     # Initialize MQTT client
     
     mqtt_client = MQTTClient()
@@ -25,7 +35,15 @@ def main():
     # obstacle_system = ObstacleDetectionSystem()
     # obstacle_system.run()
     
-    speaker = VoiceSpeaker("USB Audio Device")
+    # Một stream duplex dùng chung cho mic / loa: VAD, cuộc gọi và TTS không phải
+    # đóng mở device khi chuyển trạng thái
+    audio_device = None
+    if AUDIO_SHARED_DEVICE:
+        speaker_index = find_device_index_by_name("USB Audio Device")
+        audio_device = AudioDeviceManager(input_device=speaker_index, output_device=speaker_index)
+        audio_device.start()
+
+    speaker = get_speaker("USB Audio Device")
 
     # Initialize services
     voice = VoiceMQTT(mqtt_client)
@@ -107,6 +125,8 @@ def main():
         # obstacle_system.stop()
         camera.stop()
         voice.stop()
+        if audio_device is not None:
+            audio_device.stop()
         mqtt_client.disconnect()
         # lane_segmentation.stop()
 
@@ -0,0 +1,107 @@
+"""
+Audio Buffers
+=============
+
+Các buffer numpy cấp phát trước, dùng cho xử lý audio theo chunk mà không
+phải cấp phát lại list / array ở mỗi chunk.
+"""
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    """
+    Ring buffer kích thước cố định, ghi đè dữ liệu cũ nhất khi đầy.
+
+    Dùng làm pre-roll: luôn giữ `capacity` mẫu gần nhất với chi phí O(chunk) mỗi lần ghi.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float32):
+        """
+        Args:
+            capacity: Số mẫu tối đa giữ lại
+            dtype: Kiểu dữ liệu mẫu
+        """
+        self.capacity = max(0, int(capacity))
+        self._data = np.zeros(self.capacity, dtype=dtype)
+        self._write_pos = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self):
+        self._write_pos = 0
+        self._size = 0
+
+    def write(self, samples: np.ndarray):
+        """Ghi mẫu vào buffer, ghi đè dữ liệu cũ nhất nếu vượt capacity"""
+        if self.capacity == 0:
+            return
+        samples = samples.reshape(-1)
+        n = samples.shape[0]
+        if n >= self.capacity:
+            self._data[:] = samples[n - self.capacity:]
+            self._write_pos = 0
+            self._size = self.capacity
+            return
+
+        first = min(n, self.capacity - self._write_pos)
+        self._data[self._write_pos:self._write_pos + first] = samples[:first]
+        if first < n:
+            self._data[:n - first] = samples[first:]
+        self._write_pos = (self._write_pos + n) % self.capacity
+        self._size = min(self.capacity, self._size + n)
+
+    def read_into(self, target: "GrowableAudioBuffer"):
+        """Chép toàn bộ nội dung (theo thứ tự thời gian) vào cuối target"""
+        if self._size == 0:
+            return
+        start = (self._write_pos - self._size) % self.capacity
+        if start + self._size <= self.capacity:
+            target.append(self._data[start:start + self._size])
+        else:
+            target.append(self._data[start:])
+            target.append(self._data[:self._write_pos])
+
+
+class GrowableAudioBuffer:
+    """
+    Buffer liên tục có thể mở rộng (nhân đôi capacity khi đầy).
+
+    Thay cho việc giữ list các array nhỏ rồi np.concatenate ở cuối.
+    """
+
+    def __init__(self, initial_capacity: int, dtype=np.float32):
+        """
+        Args:
+            initial_capacity: Số mẫu cấp phát ban đầu
+            dtype: Kiểu dữ liệu mẫu
+        """
+        self._data = np.zeros(max(1, int(initial_capacity)), dtype=dtype)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self):
+        self._size = 0
+
+    def append(self, samples: np.ndarray):
+        """Thêm mẫu vào cuối buffer"""
+        samples = samples.reshape(-1)
+        n = samples.shape[0]
+        needed = self._size + n
+        if needed > self._data.shape[0]:
+            capacity = self._data.shape[0]
+            while capacity < needed:
+                capacity *= 2
+            grown = np.zeros(capacity, dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = samples
+        self._size = needed
+
+    def view(self) -> np.ndarray:
+        """View (không copy) của dữ liệu hiện có - chỉ hợp lệ tới lần ghi / clear tiếp theo"""
+        return self._data[:self._size]
@@ -0,0 +1,172 @@
+"""
+Audio Codec
+===========
+
+Nén / giải nén giọng nói bằng Opus qua PyAV để giảm dung lượng truyền MQTT.
+
+Các Opus packet được nối với nhau bằng tiền tố độ dài 2 byte (big-endian)
+để có thể cắt thành các chunk MQTT tại ranh giới packet và giải mã độc lập.
+"""
+
+import fractions
+import struct
+from typing import Iterable, Iterator, List
+
+import av
+import numpy as np
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+# Opus chỉ hỗ trợ các sample rate này, rate khác sẽ được resample lên 48kHz
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_PACKET_PREFIX = struct.Struct("!H")
+
+
+def pack_opus_packets(packets: Iterable[bytes]) -> bytes:
+    """Nối các Opus packet với tiền tố độ dài"""
+    return b"".join(OPUS_PACKET_PREFIX.pack(len(p)) + p for p in packets)
+
+
+def iter_opus_packets(data: bytes) -> Iterator[bytes]:
+    """Tách chuỗi byte (đã đóng gói bởi pack_opus_packets) thành từng Opus packet"""
+    view = memoryview(data)
+    offset = 0
+    while offset + OPUS_PACKET_PREFIX.size <= len(view):
+        (length,) = OPUS_PACKET_PREFIX.unpack_from(view, offset)
+        offset += OPUS_PACKET_PREFIX.size
+        if offset + length > len(view):
+            logger.warning(f"Truncated Opus packet: need {length} bytes, have {len(view) - offset}")
+            return
+        yield bytes(view[offset:offset + length])
+        offset += length
+
+
+def chunk_opus_packets(packets: List[bytes], chunk_size: int) -> List[bytes]:
+    """
+    Gom các Opus packet thành các chunk không vượt quá chunk_size bytes
+
+    Mỗi chunk chỉ chứa packet nguyên vẹn nên có thể giải mã độc lập.
+    """
+    chunks = []
+    current = []
+    current_size = 0
+    for packet in packets:
+        size = OPUS_PACKET_PREFIX.size + len(packet)
+        if current and current_size + size > chunk_size:
+            chunks.append(pack_opus_packets(current))
+            current = []
+            current_size = 0
+        current.append(packet)
+        current_size += size
+    if current:
+        chunks.append(pack_opus_packets(current))
+    return chunks
+
+
+class OpusEncoder:
+    """Mã hoá PCM int16 mono thành các Opus packet"""
+
+    def __init__(self, sample_rate: int = 48000, bitrate: int = 24000, frame_ms: int = 20):
+        """
+        Args:
+            sample_rate: Tần số lấy mẫu của PCM đầu vào
+            bitrate: Bitrate mục tiêu của Opus (bps)
+            frame_ms: Độ dài mỗi Opus frame (ms)
+        """
+        self.input_rate = sample_rate
+        self.codec_rate = sample_rate if sample_rate in OPUS_SAMPLE_RATES else 48000
+        self._codec = av.CodecContext.create("libopus", "w")
+        self._codec.sample_rate = self.codec_rate
+        self._codec.layout = "mono"
+        self._codec.format = "s16"
+        self._codec.bit_rate = bitrate
+        self._codec.time_base = fractions.Fraction(1, self.codec_rate)
+        self._codec.options = {"application": "voip", "frame_duration": str(frame_ms)}
+        self._resampler = None
+        if self.codec_rate != self.input_rate:
+            self._resampler = av.audio.resampler.AudioResampler(
+                format="s16", layout="mono", rate=self.codec_rate)
+        self._pts = 0
+
+    def encode(self, pcm: bytes) -> List[bytes]:
+        """
+        Mã hoá một đoạn PCM int16 (có thể gọi nhiều lần liên tiếp cho streaming)
+
+        Returns:
+            List các Opus packet đã sẵn sàng
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if samples.size == 0:
+            return []
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = self.input_rate
+        frame.time_base = fractions.Fraction(1, self.input_rate)
+        frame.pts = self._pts
+        self._pts += samples.size
+        return self._encode_frames(self._resample(frame))
+
+    def flush(self) -> List[bytes]:
+        """Đẩy ra các packet còn lại trong encoder (gọi khi kết thúc stream)"""
+        packets = self._encode_frames(self._resample(None)) if self._resampler else []
+        packets.extend(bytes(p) for p in self._codec.encode(None))
+        return packets
+
+    def encode_all(self, pcm: bytes) -> List[bytes]:
+        """Mã hoá toàn bộ một đoạn PCM và flush encoder"""
+        return self.encode(pcm) + self.flush()
+
+    def _resample(self, frame):
+        if self._resampler is None:
+            return [frame]
+        return self._resampler.resample(frame)
+
+    def _encode_frames(self, frames) -> List[bytes]:
+        packets = []
+        for frame in frames:
+            if frame is None:
+                continue
+            packets.extend(bytes(p) for p in self._codec.encode(frame))
+        return packets
+
+
+class OpusDecoder:
+    """Giải mã các Opus packet thành PCM int16 mono"""
+
+    def __init__(self, sample_rate: int = 48000):
+        """
+        Args:
+            sample_rate: Tần số lấy mẫu của PCM đầu ra
+        """
+        self.sample_rate = sample_rate
+        self._codec = av.CodecContext.create("opus", "r")
+        self._codec.sample_rate = 48000
+        self._codec.layout = "mono"
+        self._resampler = av.audio.resampler.AudioResampler(
+            format="s16", layout="mono", rate=sample_rate)
+
+    def decode_packets(self, packets: Iterable[bytes]) -> bytes:
+        """Giải mã danh sách Opus packet thành PCM int16 bytes (có thể gọi nhiều lần cho streaming)"""
+        pcm = []
+        for packet in packets:
+            try:
+                frames = self._codec.decode(av.Packet(packet))
+            except Exception as e:
+                logger.warning(f"Opus decode error: {e}")
+                continue
+            for frame in frames:
+                pcm.extend(self._to_pcm(self._resampler.resample(frame)))
+        return b"".join(pcm)
+
+    def flush(self) -> bytes:
+        """Lấy các mẫu còn lại trong resampler (gọi khi kết thúc stream)"""
+        return b"".join(self._to_pcm(self._resampler.resample(None)))
+
+    def decode(self, data: bytes) -> bytes:
+        """Giải mã toàn bộ chuỗi packet có tiền tố độ dài thành PCM int16 bytes"""
+        return self.decode_packets(iter_opus_packets(data)) + self.flush()
+
+    @staticmethod
+    def _to_pcm(frames) -> List[bytes]:
+        return [f.to_ndarray().reshape(-1).astype(np.int16, copy=False).tobytes() for f in frames]
@@ -0,0 +1,124 @@
+"""
+Audio Cue Cache
+===============
+
+Nạp sẵn toàn bộ file `.wav` trong thư mục `audio/` (processing, stop,
+warning/*, ...) khi khởi động, chuyển về mono float32 ở sample rate gốc
+của loa, để khi cần cảnh báo chỉ việc đưa buffer ra loa - không đọc file,
+không resample trên đường phát.
+
+Resample dùng `resample_poly` (polyphase) thay cho FFT resample. Nếu có
+`cache_dir`, buffer đã resample được lưu ra file `.npy` và lần sau được
+memory-map thay vì decode lại.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def cue_name(path: str, audio_dir: str) -> str:
+    """Tên cue từ đường dẫn file: 'stop', 'warning/xe_may', ..."""
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(audio_dir))
+    name, _ = os.path.splitext(rel)
+    return name.replace(os.sep, "/")
+
+
+class AudioCueCache:
+    """Các cue audio đã decode và resample sẵn, tra theo tên"""
+
+    def __init__(self, audio_dir: str, sample_rate: int, cache_dir: Optional[str] = None):
+        """
+        Args:
+            audio_dir: Thư mục chứa file .wav (quét đệ quy)
+            sample_rate: Sample rate gốc của loa - cue được resample về rate này
+            cache_dir: Thư mục lưu buffer đã resample (.npy, memory-map); None = chỉ giữ trong RAM
+        """
+        self.audio_dir = audio_dir
+        self.sample_rate = int(sample_rate)
+        self.cache_dir = cache_dir
+        self._cues: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """Nạp toàn bộ cue, trả về số cue đã nạp"""
+        if not os.path.isdir(self.audio_dir):
+            logger.warning(f"⚠️ Audio cue directory not found: {self.audio_dir}")
+            return 0
+        loaded = 0
+        for root, _, files in os.walk(self.audio_dir):
+            for file_name in sorted(files):
+                if file_name.lower().endswith(".wav"):
+                    if self._load_file(os.path.join(root, file_name)) is not None:
+                        loaded += 1
+        logger.info(f"🔔 Audio cues loaded: {loaded} @ {self.sample_rate}Hz")
+        return loaded
+
+    def _cache_path(self, name: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{name.replace('/', '__')}.{self.sample_rate}.npy")
+
+    def _load_file(self, path: str) -> Optional[np.ndarray]:
+        name = cue_name(path, self.audio_dir)
+        cache_path = self._cache_path(name)
+        try:
+            if (cache_path and os.path.exists(cache_path)
+                    and os.path.getmtime(cache_path) >= os.path.getmtime(path)):
+                audio = np.load(cache_path, mmap_mode='r')
+            else:
+                audio = self._decode(path)
+                if cache_path:
+                    try:
+                        os.makedirs(self.cache_dir, exist_ok=True)
+                        np.save(cache_path, audio)
+                    except OSError as e:
+                        logger.warning(f"⚠️ Could not write cue cache {cache_path}: {e}")
+        except Exception as e:
+            logger.error(f"❌ Could not load audio cue {path}: {e}")
+            return None
+        with self._lock:
+            self._cues[name] = audio
+        return audio
+
+    def _decode(self, path: str) -> np.ndarray:
+        data, rate = sf.read(path, dtype='float32', always_2d=True)
+        audio = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+        if rate != self.sample_rate:
+            g = np.gcd(int(rate), self.sample_rate)
+            audio = signal.resample_poly(audio, self.sample_rate // g, int(rate) // g)
+        return np.ascontiguousarray(np.clip(audio, -1.0, 1.0), dtype=np.float32)
+
+    def get(self, name_or_path: str) -> Optional[np.ndarray]:
+        """
+        Buffer float32 mono của cue
+
+        Args:
+            name_or_path: Tên cue ('stop', 'warning/xe_may') hoặc đường dẫn file trong `audio_dir`
+        """
+        name = name_or_path
+        if name.lower().endswith(".wav"):
+            if os.path.isabs(name):
+                name = cue_name(name, self.audio_dir)
+            else:
+                name = os.path.splitext(name)[0]
+        cue = self._cues.get(name)
+        if (cue is None and os.path.isabs(name_or_path) and not name.startswith("..")
+                and os.path.exists(name_or_path)):
+            # File mới thêm vào thư mục audio sau khi khởi động: nạp một lần rồi giữ lại
+            cue = self._load_file(name_or_path)
+        return cue
+
+    def names(self) -> List[str]:
+        return sorted(self._cues)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
@@ -0,0 +1,372 @@
+"""
+Audio Device Manager
+====================
+
+Một owner duy nhất cho USB audio device: mở một stream full-duplex
+(sounddevice) và
+
+- Phân phối audio thu được cho các subscriber (VAD, WebRTC mic track, ...)
+- Trộn các nguồn phát (TTS, cảnh báo, audio cuộc gọi) theo độ ưu tiên:
+  nguồn ưu tiên cao nhất đang phát giữ nguyên âm lượng, các nguồn thấp hơn
+  bị giảm âm lượng (ducking)
+
+Chuyển sang cuộc gọi chỉ là đổi subscriber / nguồn phát, không phải đóng mở
+device (không cần pause_vad() + sleep + retry lỗi -9985).
+
+Callback của stream chạy trên thread PortAudio: subscriber callback phải
+nhanh, consumer nặng (VAD) dùng `CaptureReader` để đọc ở thread riêng.
+"""
+
+import queue
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import sounddevice as sd
+from scipy import signal
+
+from container import container
+from log import setup_logger
+from module.audio_playback import JitterBuffer
+
+logger = setup_logger(__name__)
+
+# Độ ưu tiên nguồn phát (cao hơn thắng)
+PRIORITY_TTS = 10
+PRIORITY_CALL = 20
+PRIORITY_WARNING = 30
+
+
+def get_audio_device() -> Optional["AudioDeviceManager"]:
+    """AudioDeviceManager dùng chung nếu đã được khởi tạo, None nếu không"""
+    try:
+        return container.get("audio_device")
+    except Exception:
+        return None
+
+
+class CaptureReader:
+    """
+    Subscriber đọc audio thu được theo block cố định ở thread của consumer.
+
+    Dữ liệu từ callback được copy vào hàng đợi; `read()` ghép thành block
+    `block_samples` mẫu. Hàng đợi đầy thì bỏ block cũ nhất.
+    """
+
+    def __init__(self, block_samples: int, max_blocks: int = 50):
+        self.block_samples = block_samples
+        self._queue: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=max_blocks)
+        self._block = np.zeros(block_samples, dtype=np.int16)
+        self._filled = 0
+        self._pending = None
+        self.overflows = 0
+
+    def _on_capture(self, pcm: np.ndarray, adc_time: float):
+        try:
+            self._queue.put_nowait(pcm.copy())
+        except queue.Full:
+            self.overflows += 1
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait(pcm.copy())
+            except (queue.Empty, queue.Full):
+                pass
+
+    def read(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Đọc một block `block_samples` mẫu int16
+
+        Returns:
+            Block (view của buffer nội bộ, hợp lệ tới lần đọc tiếp theo) hoặc None nếu timeout
+        """
+        while self._filled < self.block_samples:
+            if self._pending is None:
+                try:
+                    self._pending = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    return None
+            take = min(self.block_samples - self._filled, self._pending.shape[0])
+            self._block[self._filled:self._filled + take] = self._pending[:take]
+            self._filled += take
+            self._pending = self._pending[take:] if take < self._pending.shape[0] else None
+        self._filled = 0
+        return self._block
+
+
+class _ClipSource:
+    """Nguồn phát các đoạn audio hoàn chỉnh (TTS, cảnh báo) theo thứ tự"""
+
+    def __init__(self, name: str, priority: int):
+        self.name = name
+        self.priority = priority
+        self._clips = deque()  # (pcm int16, done_event)
+        self._cursor = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self._clips)
+
+    def add(self, pcm: np.ndarray) -> threading.Event:
+        done = threading.Event()
+        self._clips.append((pcm, done))
+        return done
+
+    def read_into(self, out: np.ndarray):
+        n = out.shape[0]
+        filled = 0
+        while filled < n and self._clips:
+            pcm, done = self._clips[0]
+            take = min(n - filled, pcm.shape[0] - self._cursor)
+            out[filled:filled + take] = pcm[self._cursor:self._cursor + take]
+            filled += take
+            self._cursor += take
+            if self._cursor >= pcm.shape[0]:
+                self._clips.popleft()
+                self._cursor = 0
+                done.set()
+        out[filled:] = 0
+
+    def clear(self):
+        while self._clips:
+            _, done = self._clips.popleft()
+            done.set()
+        self._cursor = 0
+
+
+class StreamSource:
+    """Nguồn phát realtime (audio cuộc gọi) qua jitter buffer, thay cho PlaybackEngine"""
+
+    def __init__(self, manager: "AudioDeviceManager", name: str, priority: int):
+        self._manager = manager
+        self.name = name
+        self.priority = priority
+        self.sample_rate = manager.sample_rate
+        self.jitter = JitterBuffer(manager.sample_rate, 1)
+
+    @property
+    def active(self) -> bool:
+        return len(self.jitter) > 0
+
+    def write(self, pcm: np.ndarray) -> int:
+        """Ghi PCM int16 mono ở sample rate của manager - không block"""
+        return self.jitter.write(pcm)
+
+    def read_into(self, out: np.ndarray):
+        self.jitter.read_into(out)
+
+    def get_stats(self) -> dict:
+        return self.jitter.get_stats()
+
+    def stop(self):
+        self._manager.remove_source(self.name)
+
+
+class AudioDeviceManager:
+    """Owner duy nhất của audio device: một stream full-duplex, nhiều subscriber / nguồn phát"""
+
+    def __init__(self, input_device=None, output_device=None, sample_rate: int = 48000,
+                 block_ms: int = 20, output_channels: int = 1, duck_gain: float = 0.2):
+        """
+        Args:
+            input_device: Index / tên device thu (None = mặc định)
+            output_device: Index / tên device phát (None = mặc định)
+            sample_rate: Tần số lấy mẫu chung cho thu và phát
+            block_ms: Kích thước block của stream (ms)
+            output_channels: Số kênh đầu ra (mono được nhân ra các kênh)
+            duck_gain: Hệ số âm lượng của nguồn ưu tiên thấp khi có nguồn cao hơn đang phát
+        """
+        self.input_device = input_device
+        self.output_device = output_device
+        self.sample_rate = sample_rate
+        self.blocksize = int(sample_rate * block_ms / 1000)
+        self.output_channels = output_channels
+        self.duck_gain = duck_gain
+
+        self._subscribers: Dict[str, Callable[[np.ndarray, float], None]] = {}
+        self._sources: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._stream = None
+
+        # Buffer trộn cấp phát sẵn
+        self._mix = np.zeros(self.blocksize, dtype=np.float32)
+        self._scratch = np.zeros(self.blocksize, dtype=np.int16)
+
+        self.callbacks = 0
+        self.status_errors = 0
+        self.subscriber_errors = 0
+
+        container.register("audio_device", self)
+
+    # ----- Lifecycle -----
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self._stream = sd.Stream(
+            device=(self.input_device, self.output_device),
+            samplerate=self.sample_rate,
+            blocksize=self.blocksize,
+            dtype='int16',
+            channels=(1, self.output_channels),
+            callback=self._callback,
+        )
+        self._stream.start()
+        logger.info(f"🎛️ Audio device started: in={self.input_device}, out={self.output_device}, "
+                    f"{self.sample_rate}Hz, block={self.blocksize}, out_ch={self.output_channels}")
+
+    def stop(self):
+        if self._stream is None:
+            return
+        try:
+            self._stream.stop()
+            self._stream.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing audio device: {e}")
+        self._stream = None
+        for source in list(self._sources.values()):
+            if isinstance(source, _ClipSource):
+                source.clear()
+        logger.info(f"🔒 Audio device stopped. Stats: {self.get_stats()}")
+
+    # ----- Capture -----
+
+    def subscribe(self, name: str, callback: Callable[[np.ndarray, float], None]):
+        """
+        Đăng ký nhận audio thu được
+
+        Args:
+            name: Tên subscriber (đăng ký lại cùng tên sẽ thay thế)
+            callback: callback(pcm int16 mono - view chỉ hợp lệ trong callback, adc_time)
+                chạy trên thread audio, phải nhanh
+        """
+        with self._lock:
+            subscribers = dict(self._subscribers)
+            subscribers[name] = callback
+            self._subscribers = subscribers
+        logger.info(f"🎛️ Capture subscriber added: {name}")
+
+    def subscribe_reader(self, name: str, block_samples: int) -> CaptureReader:
+        """Đăng ký subscriber đọc theo block ở thread riêng (dùng cho VAD)"""
+        reader = CaptureReader(block_samples)
+        self.subscribe(name, reader._on_capture)
+        return reader
+
+    def unsubscribe(self, name: str):
+        with self._lock:
+            if name not in self._subscribers:
+                return
+            subscribers = dict(self._subscribers)
+            subscribers.pop(name, None)
+            self._subscribers = subscribers
+        logger.info(f"🎛️ Capture subscriber removed: {name}")
+
+    # ----- Playback -----
+
+    def open_stream_source(self, name: str, priority: int = PRIORITY_CALL) -> StreamSource:
+        """Tạo nguồn phát realtime (ví dụ audio cuộc gọi WebRTC)"""
+        source = StreamSource(self, name, priority)
+        self._add_source(source)
+        return source
+
+    def play(self, audio: np.ndarray, sample_rate: int, priority: int = PRIORITY_TTS,
+             source: Optional[str] = None) -> threading.Event:
+        """
+        Phát một đoạn audio (không block)
+
+        Args:
+            audio: PCM int16 hoặc float [-1, 1], mono hoặc (samples, channels)
+            sample_rate: Tần số lấy mẫu của audio
+            priority: Độ ưu tiên (PRIORITY_*)
+            source: Tên nguồn phát (mặc định theo độ ưu tiên); các đoạn cùng nguồn phát nối tiếp
+
+        Returns:
+            Event được set khi phát xong (hoặc bị huỷ)
+        """
+        pcm = self._to_device_pcm(audio, sample_rate)
+        name = source or f"clip-{priority}"
+        with self._lock:
+            clip_source = self._sources.get(name)
+            if not isinstance(clip_source, _ClipSource):
+                clip_source = _ClipSource(name, priority)
+                sources = dict(self._sources)
+                sources[name] = clip_source
+                self._sources = sources
+        return clip_source.add(pcm)
+
+    def stop_source(self, name: str):
+        """Huỷ các đoạn đang chờ phát của một nguồn"""
+        source = self._sources.get(name)
+        if isinstance(source, _ClipSource):
+            source.clear()
+
+    def remove_source(self, name: str):
+        with self._lock:
+            if name not in self._sources:
+                return
+            sources = dict(self._sources)
+            source = sources.pop(name)
+            self._sources = sources
+        if isinstance(source, _ClipSource):
+            source.clear()
+
+    def _add_source(self, source):
+        with self._lock:
+            sources = dict(self._sources)
+            sources[source.name] = source
+            self._sources = sources
+
+    def _to_device_pcm(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Chuyển về int16 mono ở sample rate của device (chạy ở thread của caller)"""
+        audio = np.asarray(audio)
+        if audio.ndim == 2:
+            audio = audio.mean(axis=1) if audio.shape[1] <= audio.shape[0] else audio.mean(axis=0)
+        if audio.dtype == np.int16:
+            audio = audio.astype(np.float32) / 32768.0
+        else:
+            audio = audio.astype(np.float32, copy=False)
+        if sample_rate != self.sample_rate:
+            g = np.gcd(int(sample_rate), int(self.sample_rate))
+            audio = signal.resample_poly(audio, self.sample_rate // g, int(sample_rate) // g)
+        return (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+    # ----- Stream callback (thread PortAudio) -----
+
+    def _callback(self, indata, outdata, frames, time_info, status):
+        self.callbacks += 1
+        if status:
+            self.status_errors += 1
+
+        # Capture fan-out
+        pcm = indata[:, 0]
+        adc_time = getattr(time_info, 'inputBufferAdcTime', 0.0)
+        for callback in self._subscribers.values():
+            try:
+                callback(pcm, adc_time)
+            except Exception:
+                self.subscriber_errors += 1
+
+        # Playback mix
+        if frames != self._mix.shape[0]:
+            self._mix = np.zeros(frames, dtype=np.float32)
+            self._scratch = np.zeros(frames, dtype=np.int16)
+        mix = self._mix
+        mix[:] = 0.0
+        sources = [s for s in self._sources.values() if s.active]
+        if sources:
+            top = max(s.priority for s in sources)
+            for source in sources:
+                source.read_into(self._scratch)
+                gain = 1.0 if source.priority >= top else self.duck_gain
+                mix += self._scratch * np.float32(gain)
+            np.clip(mix, -32768.0, 32767.0, out=mix)
+        outdata[:] = mix[:, None].astype(np.int16)
+
+    def get_stats(self) -> dict:
+        return {
+            'callbacks': self.callbacks,
+            'status_errors': self.status_errors,
+            'subscriber_errors': self.subscriber_errors,
+            'subscribers': list(self._subscribers),
+            'sources': {name: getattr(s, 'priority', None) for name, s in self._sources.items()},
+        }
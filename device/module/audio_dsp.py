@@ -0,0 +1,126 @@
+"""
+Audio DSP Chain
+===============
+
+Chuỗi xử lý PCM int16 theo frame: gain, AGC, noise gate, compressor (tanh)
+và limiter.
+
+Buffer làm việc được cấp phát trước theo kích thước frame đã thương lượng;
+mọi bước dùng ufunc với `out=` nên không cấp phát mảng tạm nào mỗi frame.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+_INT16_SCALE = np.float32(1.0 / 32768.0)
+
+
+class AudioDSPChain:
+    """Gain / AGC / noise gate / compressor / limiter in-place cho PCM int16"""
+
+    def __init__(self, frame_size: int = 960, gain: float = 1.0,
+                 auto_gain: bool = False, target_rms: float = 5000.0,
+                 max_agc_gain: float = 2.0, max_total_gain: float = 3.0,
+                 agc_silence_rms: float = 200.0, noise_gate: int = 0,
+                 compressor_drive: float = 0.0, limiter: bool = True):
+        """
+        Args:
+            frame_size: Số mẫu (interleaved) mỗi frame, buffer được cấp phát theo giá trị này
+            gain: Gain cố định
+            auto_gain: Bật AGC (chỉ tăng, không giảm âm lượng)
+            target_rms: RMS mục tiêu của AGC (đơn vị int16)
+            max_agc_gain: Gain tối đa AGC được thêm vào
+            max_total_gain: Gain tổng tối đa (gain * AGC)
+            agc_silence_rms: Dưới RMS này coi là im lặng, AGC không tăng gain
+            noise_gate: Ngưỡng (int16, sau gain) dưới đó mẫu bị đưa về 0; 0 = tắt
+            compressor_drive: Độ mạnh soft compressor tanh; 0 = tắt
+            limiter: Clip về [-1, 1] trước khi chuyển về int16
+        """
+        self.gain = gain
+        self.auto_gain = auto_gain
+        self.target_rms = target_rms
+        self.max_agc_gain = max_agc_gain
+        self.max_total_gain = max_total_gain
+        self.agc_silence_rms = agc_silence_rms
+        self.noise_gate = noise_gate
+        self.compressor_drive = compressor_drive
+        self.limiter = limiter
+
+        self.applied_gain = gain
+        self._allocate(frame_size)
+
+    def _allocate(self, frame_size: int):
+        self.frame_size = frame_size
+        self._x = np.empty(frame_size, dtype=np.float32)
+        self._abs = np.empty(frame_size, dtype=np.float32)
+        self._mask = np.empty(frame_size, dtype=bool)
+        self._out = np.empty(frame_size, dtype=np.int16)
+
+    @property
+    def is_active(self) -> bool:
+        """Chain có thay đổi tín hiệu hay không (nếu không, process trả lại input)"""
+        return (self.gain != 1.0 or self.auto_gain or self.noise_gate > 0
+                or self.compressor_drive > 0.0)
+
+    def levels(self, pcm: np.ndarray) -> Tuple[float, int]:
+        """(RMS, peak) của frame int16 - dùng buffer làm việc, không cấp phát"""
+        n = pcm.shape[0]
+        if n > self.frame_size:
+            self._allocate(n)
+        x = self._x[:n]
+        np.multiply(pcm, np.float32(1.0), out=x)
+        rms = float(np.sqrt(np.dot(x, x) / max(n, 1)))
+        peak = int(max(pcm.max(), -int(pcm.min()))) if n else 0
+        return rms, peak
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        """
+        Xử lý một frame PCM int16 (1D, interleaved)
+
+        Returns:
+            Frame int16 đã xử lý. Là view của buffer nội bộ, chỉ hợp lệ tới lần gọi tiếp theo
+            (hoặc chính `pcm` nếu chain không làm gì).
+        """
+        if not self.is_active:
+            return pcm
+
+        n = pcm.shape[0]
+        if n > self.frame_size:
+            # Frame lớn hơn dự kiến (ví dụ resampler trả nhiều mẫu hơn): cấp phát lại một lần
+            self._allocate(n)
+        x = self._x[:n]
+        out = self._out[:n]
+
+        # Chuẩn hoá về float32 [-1, 1]
+        np.multiply(pcm, _INT16_SCALE, out=x)
+
+        applied_gain = float(self.gain)
+        if self.auto_gain and n:
+            rms = float(np.sqrt(np.dot(x, x) / n)) * 32768.0 + 1e-6
+            if rms > self.agc_silence_rms:
+                agc_gain = min(max(self.target_rms / rms, 1.0), self.max_agc_gain)
+                applied_gain = min(applied_gain * agc_gain, self.max_total_gain)
+        self.applied_gain = applied_gain
+
+        if applied_gain != 1.0:
+            np.multiply(x, np.float32(applied_gain), out=x)
+
+        if self.noise_gate > 0:
+            np.abs(x, out=self._abs[:n])
+            np.less(self._abs[:n], np.float32(self.noise_gate / 32768.0), out=self._mask[:n])
+            np.putmask(x, self._mask[:n], 0.0)
+
+        drive = float(self.compressor_drive)
+        if drive > 0.0:
+            # Soft compressor: tanh(drive * x) / tanh(drive)
+            np.multiply(x, np.float32(drive), out=x)
+            np.tanh(x, out=x)
+            np.multiply(x, np.float32(1.0 / np.tanh(drive)), out=x)
+
+        if self.limiter:
+            np.clip(x, -1.0, 1.0, out=x)
+
+        np.multiply(x, np.float32(32767.0), out=x)
+        np.copyto(out, x, casting='unsafe')
+        return out
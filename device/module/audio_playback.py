@@ -0,0 +1,240 @@
+"""
+Audio Playback
+==============
+
+Phát audio realtime (WebRTC) qua PortAudio callback với jitter buffer.
+
+Event loop (producer) chỉ ghi PCM vào ring buffer int16 cấp phát trước và
+không bao giờ block trên audio I/O; callback của PortAudio (consumer) đọc
+từ ring buffer theo nhịp của sound card.
+
+Ring buffer là single-producer / single-consumer: producer chỉ tăng
+`_write_pos`, consumer chỉ tăng `_read_pos`, nên không cần lock.
+"""
+
+import time
+from typing import Optional
+
+import numpy as np
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class JitterBuffer:
+    """
+    Jitter buffer int16 (SPSC ring) với độ sâu mục tiêu thích nghi.
+
+    - Chưa đủ độ sâu mục tiêu: phát im lặng (priming) để có đệm chống jitter
+    - Underrun: phát phần còn lại rồi fade-out về im lặng (che lỗi, tránh tiếng click),
+      tăng độ sâu mục tiêu
+    - Ổn định lâu: giảm dần độ sâu mục tiêu để giảm độ trễ
+    - Overrun (buffer đầy) hoặc trễ quá nhiều: bỏ dữ liệu để giữ độ trễ thấp
+    """
+
+    def __init__(self, sample_rate: int = 48000, channels: int = 1,
+                 capacity_ms: int = 1000, target_ms: int = 60,
+                 min_target_ms: int = 40, max_target_ms: int = 300,
+                 step_ms: int = 20, relax_after: float = 10.0, fade_samples: int = 64):
+        """
+        Args:
+            sample_rate: Tần số lấy mẫu
+            channels: Số kênh (dữ liệu interleaved)
+            capacity_ms: Dung lượng ring buffer
+            target_ms: Độ sâu mục tiêu ban đầu
+            min_target_ms / max_target_ms: Giới hạn độ sâu mục tiêu
+            step_ms: Bước tăng độ sâu khi underrun / bước giảm khi ổn định
+            relax_after: Số giây không underrun trước khi giảm độ sâu mục tiêu
+            fade_samples: Số mẫu fade-out khi underrun
+        """
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._samples_per_ms = sample_rate * channels / 1000.0
+        self.capacity = int(capacity_ms * self._samples_per_ms)
+        self._data = np.zeros(self.capacity, dtype=np.int16)
+        self._fade = np.linspace(1.0, 0.0, fade_samples, dtype=np.float32)
+
+        self.min_target = int(min_target_ms * self._samples_per_ms)
+        self.max_target = min(int(max_target_ms * self._samples_per_ms), self.capacity // 2)
+        self.target = int(target_ms * self._samples_per_ms)
+        self._step = int(step_ms * self._samples_per_ms)
+        self.relax_after = relax_after
+
+        # Chỉ producer ghi _write_pos, chỉ consumer ghi _read_pos (số tăng dần, không wrap)
+        self._write_pos = 0
+        self._read_pos = 0
+        self._primed = False
+        self._last_underrun = time.monotonic()
+
+        self.underruns = 0
+        self.overruns = 0
+        self.dropped_samples = 0
+        self.concealed_samples = 0
+
+    def __len__(self) -> int:
+        return self._write_pos - self._read_pos
+
+    # ----- Producer (event loop) -----
+
+    def write(self, pcm: np.ndarray) -> int:
+        """
+        Ghi PCM int16 interleaved, không bao giờ block
+
+        Returns:
+            Số mẫu đã ghi (phần vượt dung lượng bị bỏ và tính là overrun)
+        """
+        pcm = pcm.reshape(-1)
+        n = pcm.shape[0]
+        free = self.capacity - (self._write_pos - self._read_pos)
+        if n > free:
+            self.overruns += 1
+            self.dropped_samples += n - free
+            pcm = pcm[:free]
+            n = free
+        if n == 0:
+            return 0
+
+        start = self._write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = pcm[:first]
+        if first < n:
+            self._data[:n - first] = pcm[first:]
+        self._write_pos += n
+        return n
+
+    # ----- Consumer (PortAudio callback) -----
+
+    def read_into(self, out: np.ndarray):
+        """Đọc đúng out.shape[0] mẫu vào `out`, điền im lặng khi thiếu"""
+        n = out.shape[0]
+        available = self._write_pos - self._read_pos
+
+        if not self._primed:
+            if available < self.target:
+                out[:] = 0
+                return
+            self._primed = True
+
+        # Trễ quá xa độ sâu mục tiêu (ví dụ sau một đợt burst): bỏ bớt dữ liệu cũ
+        excess = available - (self.target * 2 + n)
+        if excess > 0:
+            self._read_pos += excess
+            self.dropped_samples += excess
+            self.overruns += 1
+            available -= excess
+
+        count = min(n, available)
+        start = self._read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        if first < count:
+            out[first:count] = self._data[:count - first]
+        self._read_pos += count
+
+        if count < n:
+            self._conceal(out, count)
+        elif time.monotonic() - self._last_underrun > self.relax_after and self.target > self.min_target:
+            # Ổn định lâu: giảm độ sâu mục tiêu để giảm độ trễ
+            self.target = max(self.min_target, self.target - self._step)
+            self._last_underrun = time.monotonic()
+
+    def _conceal(self, out: np.ndarray, valid: int):
+        """Underrun: fade-out phần dữ liệu cuối rồi phát im lặng, chờ priming lại"""
+        fade = min(valid, self._fade.shape[0])
+        if fade:
+            tail = out[valid - fade:valid]
+            tail[:] = (tail * self._fade[-fade:]).astype(np.int16)
+        out[valid:] = 0
+        self.concealed_samples += out.shape[0] - valid
+        self.underruns += 1
+        self.target = min(self.max_target, self.target + self._step)
+        self._last_underrun = time.monotonic()
+        self._primed = False
+
+    def clear(self):
+        """Chỉ gọi khi consumer đã dừng"""
+        self._read_pos = self._write_pos = 0
+        self._primed = False
+
+    def get_stats(self) -> dict:
+        return {
+            'level_ms': len(self) / self._samples_per_ms,
+            'target_ms': self.target / self._samples_per_ms,
+            'underruns': self.underruns,
+            'overruns': self.overruns,
+            'dropped_samples': self.dropped_samples,
+            'concealed_samples': self.concealed_samples,
+        }
+
+
+class PlaybackEngine:
+    """Output stream PortAudio (PyAudio callback mode) đọc từ JitterBuffer"""
+
+    def __init__(self, pa, sample_rate: int = 48000, channels: int = 1,
+                 frames_per_buffer: int = 960, device_index: Optional[int] = None, **jitter_kwargs):
+        """
+        Args:
+            pa: Instance pyaudio.PyAudio
+            sample_rate: Tần số lấy mẫu
+            channels: Số kênh
+            frames_per_buffer: Số frame mỗi lần callback
+            device_index: Output device index (None = mặc định)
+            jitter_kwargs: Tham số cho JitterBuffer
+        """
+        self._pa = pa
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.device_index = device_index
+        self.jitter = JitterBuffer(sample_rate, channels, **jitter_kwargs)
+        self._out = np.zeros(frames_per_buffer * channels, dtype=np.int16)
+        self._stream = None
+        self.callback_errors = 0
+
+    def start(self):
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        stream_kwargs = {
+            'format': pyaudio.paInt16,
+            'channels': self.channels,
+            'rate': self.sample_rate,
+            'output': True,
+            'frames_per_buffer': self.frames_per_buffer,
+            'stream_callback': self._callback,
+        }
+        if self.device_index is not None:
+            stream_kwargs['output_device_index'] = self.device_index
+        self._stream = self._pa.open(**stream_kwargs)
+        self._stream.start_stream()
+        logger.info(f"🔊 Playback engine started (rate={self.sample_rate}, channels={self.channels}, device={self.device_index})")
+
+    def write(self, pcm: np.ndarray) -> int:
+        """Ghi PCM int16 vào jitter buffer - an toàn để gọi từ event loop"""
+        return self.jitter.write(pcm)
+
+    def _callback(self, in_data, frame_count, time_info, status_flags):
+        try:
+            needed = frame_count * self.channels
+            if needed != self._out.shape[0]:
+                self._out = np.zeros(needed, dtype=np.int16)
+            self.jitter.read_into(self._out)
+        except Exception:
+            self.callback_errors += 1
+            self._out[:] = 0
+        return self._out.tobytes(), self._continue
+
+    def stop(self):
+        try:
+            if self._stream is not None:
+                self._stream.stop_stream()
+                self._stream.close()
+        except Exception:
+            pass
+        self._stream = None
+        logger.info(f"🔊 Playback engine stopped. Stats: {self.get_stats()}")
+
+    def get_stats(self) -> dict:
+        stats = self.jitter.get_stats()
+        stats['callback_errors'] = self.callback_errors
+        return stats
@@ -0,0 +1,292 @@
+"""
+Audio Device Registry
+=====================
+
+Dò audio device một lần khi khởi động và lưu kết quả (tên, index, số kênh,
+sample rate hỗ trợ) vào file cache JSON.
+
+- Khả năng của device (sample rate) được cache theo USB id
+  (`/proc/asound/cardN/usbid`), nên cắm lại cùng một device không phải dò lại
+- Danh sách device chỉ được làm mới khi có hotplug: chữ ký của `/proc/asound`
+  (danh sách card + USB id) thay đổi
+- Không khởi tạo lại PortAudio khi hotplug: `sd._terminate()` đóng mọi stream
+  đang mở (duplex stream dùng chung, stream VAD, TTS đang phát) và PyAudio cũng
+  giữ PortAudio. Danh sách PortAudio chỉ cập nhật khi khởi động lại process,
+  nên device mới cắm sẽ được log là cần restart
+- Tra cứu khi thiết lập cuộc gọi chỉ đọc từ bộ nhớ, không enumerate PortAudio
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+import time
+from typing import Iterable, List, Optional, Union
+
+import sounddevice as sd
+
+from container import container
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+try:
+    from config import AUDIO_DEVICE_CACHE
+except ImportError:
+    try:
+        from config import BASE_DIR
+        AUDIO_DEVICE_CACHE = os.path.join(BASE_DIR, "cache", "audio_devices.json")
+    except ImportError:
+        AUDIO_DEVICE_CACHE = None
+
+CACHE_VERSION = 1
+PROBE_RATES = (8000, 16000, 22050, 44100, 48000, 96000)
+ASOUND_DIR = "/proc/asound"
+
+
+def get_audio_registry() -> "AudioDeviceRegistry":
+    """Registry dùng chung (tạo và dò device ở lần gọi đầu tiên)"""
+    try:
+        registry = container.get("audio_registry")
+    except Exception:
+        registry = None
+    if registry is None:
+        registry = AudioDeviceRegistry()
+        container.register("audio_registry", registry)
+    return registry
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _card_usb_ids() -> dict:
+    """{card number: USB id 'vvvv:pppp'} của các card ALSA là USB device"""
+    usb_ids = {}
+    for path in glob.glob(os.path.join(ASOUND_DIR, "card*", "usbid")):
+        match = re.search(r"card(\d+)", path)
+        usb_id = _read_text(path)
+        if match and usb_id:
+            usb_ids[int(match.group(1))] = usb_id
+    return usb_ids
+
+
+def hotplug_signature() -> str:
+    """Chữ ký trạng thái card âm thanh - thay đổi khi cắm / rút device"""
+    cards = _read_text(os.path.join(ASOUND_DIR, "cards"))
+    usb_ids = _card_usb_ids()
+    return cards + "|" + ",".join(f"{card}={usb_ids[card]}" for card in sorted(usb_ids))
+
+
+class AudioDeviceRegistry:
+    """Danh sách audio device và khả năng của chúng, cache ra file theo USB id"""
+
+    def __init__(self, cache_path: Optional[str] = AUDIO_DEVICE_CACHE,
+                 probe_rates: Iterable[int] = PROBE_RATES, check_interval: float = 2.0):
+        """
+        Args:
+            cache_path: File cache JSON (None = chỉ cache trong bộ nhớ)
+            probe_rates: Các sample rate cần dò
+            check_interval: Khoảng thời gian tối thiểu giữa hai lần kiểm tra hotplug (giây)
+        """
+        self.cache_path = cache_path
+        self.probe_rates = tuple(probe_rates)
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._devices: List[dict] = []
+        # Khả năng device theo USB id (hoặc tên với device không phải USB)
+        self._capabilities: dict = {}
+        self._signature = None
+        self._last_check = 0.0
+
+        self.probes = 0
+        self.refreshes = 0
+        self.restart_required = False  # Có hotplug mà PortAudio chưa thấy
+        self._load()
+
+    # ----- Tra cứu -----
+
+    def devices(self) -> List[dict]:
+        self.refresh_if_changed()
+        return list(self._devices)
+
+    def device(self, index: int) -> Optional[dict]:
+        self.refresh_if_changed()
+        for dev in self._devices:
+            if dev['index'] == index:
+                return dev
+        return None
+
+    def find(self, keywords: Union[str, Iterable[str]], kind: str = 'output') -> Optional[int]:
+        """
+        Tìm index device đầu tiên có tên chứa một trong các từ khoá
+
+        Args:
+            keywords: Từ khoá (không phân biệt hoa thường), ví dụ "USB Audio Device" hoặc ("USB Audio Device", "hw:3,0")
+            kind: 'input' hoặc 'output'
+        """
+        if isinstance(keywords, str):
+            keywords = (keywords,)
+        keywords = [k.lower() for k in keywords]
+        channels_key = 'max_input_channels' if kind == 'input' else 'max_output_channels'
+        for dev in self.devices():
+            name = dev['name'].lower()
+            if dev[channels_key] > 0 and any(k in name for k in keywords):
+                return dev['index']
+        return None
+
+    def supported_rates(self, index: int, kind: str = 'input') -> List[int]:
+        dev = self.device(index)
+        if dev is None:
+            return []
+        return list(dev['input_rates' if kind == 'input' else 'output_rates'])
+
+    def supports_rate(self, index: int, rate: int, kind: str = 'input') -> bool:
+        return rate in self.supported_rates(index, kind)
+
+    # ----- Làm mới -----
+
+    def refresh_if_changed(self) -> bool:
+        """Làm mới danh sách nếu có hotplug (kiểm tra tối đa mỗi `check_interval` giây)"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        signature = hotplug_signature()
+        if signature == self._signature:
+            return False
+        logger.info("🔌 Audio hotplug detected - refreshing device registry")
+        self.refresh(signature, hotplug=True)
+        return True
+
+    def refresh(self, signature: Optional[str] = None, hotplug: bool = False):
+        """
+        Enumerate lại device; chỉ dò sample rate cho device chưa có trong cache
+
+        Không khởi tạo lại PortAudio (sẽ đóng các stream đang mở), nên chỉ thấy
+        device đã có lúc PortAudio khởi tạo.
+
+        Args:
+            signature: Chữ ký hotplug hiện tại (None = đọc lại)
+            hotplug: Gọi sau hotplug - kiểm tra danh sách PortAudio có còn khớp với card hiện tại
+        """
+        with self._lock:
+            if signature is None:
+                signature = hotplug_signature()
+
+            usb_ids = _card_usb_ids()
+            devices = []
+            for index, info in enumerate(sd.query_devices()):
+                name = info['name']
+                match = re.search(r"hw:(\d+),", name)
+                card = int(match.group(1)) if match else None
+                usb_id = usb_ids.get(card) if card is not None else None
+                dev = {
+                    'index': index,
+                    'name': name,
+                    'card': card,
+                    'usb_id': usb_id,
+                    'max_input_channels': info['max_input_channels'],
+                    'max_output_channels': info['max_output_channels'],
+                    'default_samplerate': info['default_samplerate'],
+                }
+                dev.update(self._capabilities_for(dev))
+                devices.append(dev)
+
+            if hotplug:
+                self._check_stale(devices, usb_ids)
+            self._devices = devices
+            self._signature = signature
+            self._last_check = time.monotonic()
+            self.refreshes += 1
+            self._save()
+        logger.info(f"🎚️ Audio registry: {len(devices)} devices ({self.probes} capability probes)")
+
+    def _check_stale(self, devices: List[dict], usb_ids: dict):
+        """PortAudio giữ danh sách lúc khởi tạo: card mới cắm chưa có, card đã rút vẫn còn"""
+        added = sorted(card for card in usb_ids if not any(dev['card'] == card for dev in devices))
+        removed = sorted({dev['card'] for dev in devices if dev['card'] is not None
+                          and not os.path.exists(os.path.join(ASOUND_DIR, f"card{dev['card']}"))})
+        if added or removed:
+            self.restart_required = True
+            logger.warning(f"⚠️ Audio cards changed (added: {added}, removed: {removed}) - "
+                           f"PortAudio device list is stale until the service restarts")
+
+    def _capabilities_for(self, dev: dict) -> dict:
+        key = f"usb:{dev['usb_id']}:{dev['name']}" if dev['usb_id'] else f"name:{dev['name']}"
+        caps = self._capabilities.get(key)
+        if caps is None:
+            caps = {
+                'input_rates': self._probe(dev['index'], 'input') if dev['max_input_channels'] > 0 else [],
+                'output_rates': self._probe(dev['index'], 'output') if dev['max_output_channels'] > 0 else [],
+            }
+            self._capabilities[key] = caps
+        return caps
+
+    def _probe(self, index: int, kind: str) -> List[int]:
+        """Kiểm tra định dạng qua PortAudio (không mở stream thật)"""
+        self.probes += 1
+        check = sd.check_input_settings if kind == 'input' else sd.check_output_settings
+        rates = []
+        for rate in self.probe_rates:
+            try:
+                check(device=index, channels=1, dtype='int16', samplerate=rate)
+                rates.append(rate)
+            except Exception:
+                pass
+        return rates
+
+    # ----- Cache file -----
+
+    def _load(self):
+        signature = hotplug_signature()
+        cache = None
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Ignoring unreadable audio device cache: {e}")
+        if cache and cache.get('version') == CACHE_VERSION:
+            self._capabilities = cache.get('capabilities', {})
+            if cache.get('signature') == signature and cache.get('devices'):
+                self._devices = cache['devices']
+                self._signature = signature
+                self._last_check = time.monotonic()
+                logger.info(f"🎚️ Audio registry loaded from cache: {len(self._devices)} devices")
+                return
+        self.refresh(signature)
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        data = {
+            'version': CACHE_VERSION,
+            # Danh sách cũ của PortAudio không được dùng lại sau restart
+            'signature': None if self.restart_required else self._signature,
+            'devices': self._devices,
+            'capabilities': self._capabilities,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write audio device cache: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            'devices': len(self._devices),
+            'cached_capabilities': len(self._capabilities),
+            'probes': self.probes,
+            'refreshes': self.refreshes,
+            'restart_required': self.restart_required,
+        }
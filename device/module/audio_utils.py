@@ -5,36 +5,70 @@ Audio Utilities
 
 import sounddevice as sd
 import numpy as np
+from fractions import Fraction
 from typing import List, Tuple
 
+from module.audio_registry import get_audio_registry
+
 
 def get_supported_sample_rates(device_id: int) -> List[int]:
     """
     Lấy danh sách sample rates được hỗ trợ bởi device
 
+    Kết quả lấy từ AudioDeviceRegistry (dò một lần, cache theo USB id),
+    không mở stream thử cho từng rate.
+
     Args:
         device_id: ID của audio device
 
     Returns:
         List các sample rates được hỗ trợ
     """
-    supported_rates = []
-    test_rates = [8000, 16000, 22050, 44100, 48000, 96000]
-
-    for rate in test_rates:
-        try:
-            with sd.InputStream(
-                device=device_id,
-                channels=1,
-                samplerate=rate,
-                dtype='int16',
-                blocksize=1024
-            ) as stream:
-                supported_rates.append(rate)
-        except:
-            pass
-
-    return supported_rates
+    return get_audio_registry().supported_rates(device_id, kind='input')
+
+
+class StreamResampler:
+    """
+    Resample PCM int16 mono theo kiểu streaming (PyAV, có trạng thái giữa các lần gọi)
+    nên có thể resample và phát từng đoạn mà không bị lỗi ở ranh giới đoạn.
+    """
+
+    def __init__(self, sample_rate: int, target_rate: int):
+        self.sample_rate = int(sample_rate)
+        self.target_rate = int(target_rate)
+        self._pts = 0
+        self._resampler = None
+        if self.sample_rate != self.target_rate:
+            import av
+            self._resampler = av.audio.resampler.AudioResampler(
+                format="s16", layout="mono", rate=self.target_rate)
+            self._time_base = Fraction(1, self.sample_rate)
+
+    def resample(self, pcm: np.ndarray) -> np.ndarray:
+        """Resample một đoạn PCM int16 mono; có thể trả về ít / nhiều mẫu hơn tỉ lệ do độ trễ bộ lọc"""
+        if self._resampler is None or pcm.shape[0] == 0:
+            return pcm
+        import av
+        frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(pcm, dtype=np.int16).reshape(1, -1),
+                                           format="s16", layout="mono")
+        frame.sample_rate = self.sample_rate
+        frame.time_base = self._time_base
+        frame.pts = self._pts
+        self._pts += pcm.shape[0]
+        return self._to_pcm(self._resampler.resample(frame))
+
+    def flush(self) -> np.ndarray:
+        """Xả các mẫu còn lại trong bộ lọc (gọi khi kết thúc stream)"""
+        if self._resampler is None:
+            return np.empty(0, dtype=np.int16)
+        return self._to_pcm(self._resampler.resample(None))
+
+    @staticmethod
+    def _to_pcm(frames) -> np.ndarray:
+        chunks = [f.to_ndarray().reshape(-1) for f in frames]
+        if not chunks:
+            return np.empty(0, dtype=np.int16)
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
 
 
 def get_best_sample_rate(device_id: int) -> int:
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import asyncio
 import threading
 import time
 from typing import Optional
@@ -6,31 +7,108 @@ import numpy as np
 
 import cv2
 from log import setup_logger
+from .frame_views import FrameViews, PIXEL_FORMAT_BGR
 
 logger = setup_logger(__name__)
 
+def _resolve_waiter(future: "asyncio.Future", views: FrameViews):
+    if not future.done():
+        future.set_result(views)
+
+
 class Camera(ABC):
     """
     Lớp trừu tượng cho camera với khả năng đọc frame liên tục trong background thread.
     """
     
-    def __init__(self, pipeline: str):
+    def __init__(self, pipeline: str, pixel_format: str = PIXEL_FORMAT_BGR):
         """
         Khởi tạo camera với GStreamer pipeline.
         
         Args:
             pipeline: GStreamer pipeline string
+            pixel_format: Định dạng frame appsink trả về (PIXEL_FORMAT_*)
             
         Raises:
             ValueError: Nếu không thể mở camera
         """
-        self._latest_frame = [None]
+        self._init_frame_state(pixel_format)
         self._stop_event = threading.Event()
         self._thread = None
         self._is_running = False
         self.cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
         if not self.cap.isOpened():
             raise ValueError("Failed to open camera")
+    
+    def _init_frame_state(self, pixel_format: str = PIXEL_FORMAT_BGR):
+        """Khởi tạo trạng thái frame mới nhất (dùng chung cho các lớp con)."""
+        self.pixel_format = pixel_format
+        self._latest_views = [None]
+        self._frame_seq = 0
+        self._frame_cond = threading.Condition()
+        self._async_waiters = []  # [(loop, future)] đang chờ frame mới
+    
+    def _publish_frame(self, frame: np.ndarray) -> FrameViews:
+        """
+        Đưa frame mới capture vào làm frame mới nhất và đánh thức các consumer đang chờ.
+        
+        Các view dẫn xuất (RGB 640x480, thumbnail, JPEG, BGR với frame YUV) được tính lười
+        và cache theo frame.
+        """
+        with self._frame_cond:
+            self._frame_seq += 1
+            views = FrameViews(frame, seq=self._frame_seq, pixel_format=self.pixel_format)
+            self._latest_views[0] = views
+            waiters, self._async_waiters = self._async_waiters, []
+            self._frame_cond.notify_all()
+        
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, future, views)
+            except RuntimeError:
+                pass  # Event loop đã đóng
+        return views
+    
+    @property
+    def frame_seq(self) -> int:
+        """Sequence number của frame mới nhất (0 = chưa có frame)."""
+        return self._frame_seq
+    
+    def wait_for_frame(self, after_seq: int, timeout: Optional[float] = None) -> Optional[FrameViews]:
+        """
+        Block tới khi có frame với sequence > after_seq.
+        
+        Returns:
+            FrameViews của frame mới nhất hoặc None nếu timeout
+        """
+        with self._frame_cond:
+            if not self._frame_cond.wait_for(lambda: self._frame_seq > after_seq, timeout):
+                return None
+            return self._latest_views[0]
+    
+    async def wait_for_frame_async(self, after_seq: int, timeout: Optional[float] = None) -> Optional[FrameViews]:
+        """
+        Phiên bản asyncio của wait_for_frame(): không chiếm thread của executor.
+        
+        Returns:
+            FrameViews của frame mới nhất hoặc None nếu timeout
+        """
+        loop = asyncio.get_running_loop()
+        with self._frame_cond:
+            if self._frame_seq > after_seq:
+                return self._latest_views[0]
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._async_waiters.append(waiter)
+        
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._frame_cond:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
         
     def run(self):
         """Bắt đầu thread đọc frame từ camera."""
@@ -46,7 +124,7 @@ class Camera(ABC):
                         logger.warning("[Camera] Không đọc được frame")
                         time.sleep(0.1)
                         continue    
-                    self._latest_frame[0] = frame  
+                    self._publish_frame(frame)
                     
                 except Exception as e:
                     logger.error(f"[Camera] Lỗi nhận frame: {e}", exc_info=True)
@@ -62,9 +140,19 @@ class Camera(ABC):
         Lấy frame mới nhất từ camera.
         
         Returns:
-            Frame dưới dạng numpy array hoặc None nếu chưa có frame
+            Frame BGR dưới dạng numpy array hoặc None nếu chưa có frame
+        """
+        views = self._latest_views[0]
+        return views.bgr if views is not None else None
+    
+    def get_latest_views(self) -> Optional[FrameViews]:
+        """
+        Lấy frame mới nhất cùng các view dẫn xuất đã cache.
+        
+        Returns:
+            FrameViews hoặc None nếu chưa có frame
         """
-        return self._latest_frame[0] 
+        return self._latest_views[0]
     
     def is_running(self) -> bool:
         """Kiểm tra xem camera có đang chạy không."""
@@ -6,16 +6,31 @@ import cv2
 
 from log import setup_logger
 from .camera_base import Camera
+from .frame_bus import FrameBus
+from .frame_views import PIXEL_FORMAT_BGR, PIXEL_FORMAT_YUYV
 from container import container
 logger = setup_logger(__name__)
 
+try:
+    from config import CAMERA_FRAME_BUS
+except ImportError:
+    CAMERA_FRAME_BUS = None  # Tên shared memory segment, None = tắt frame bus
+try:
+    from config import CAMERA_FRAME_BUS_SLOTS
+except ImportError:
+    CAMERA_FRAME_BUS_SLOTS = 4
+try:
+    from config import CAMERA_CAPTURE_FORMAT
+except ImportError:
+    CAMERA_CAPTURE_FORMAT = PIXEL_FORMAT_BGR  # "bgr" hoặc "yuyv" (YUV thô, không convert sang BGR)
+
 class CameraDirect(Camera):
     """
     Lớp camera sử dụng OpenCV trực tiếp thay vì qua GStreamer.
     Hỗ trợ reconnection tự động và FPS control.
     """
     def __init__(self, camera_id=0, width=1920, height=1080, fps=30, 
-                 auto_reconnect=True, reconnect_delay=5.0):
+                 auto_reconnect=True, reconnect_delay=5.0, pixel_format=CAMERA_CAPTURE_FORMAT):
         """
         Khởi tạo camera với OpenCV.
         
@@ -26,9 +41,15 @@ class CameraDirect(Camera):
             fps: Frames per second mục tiêu
             auto_reconnect: Tự động kết nối lại khi mất kết nối
             reconnect_delay: Thời gian chờ giữa các lần thử kết nối lại (giây)
+            pixel_format: "bgr" (OpenCV convert sẵn) hoặc "yuyv" (giữ YUV thô của V4L2,
+                BGR chỉ được convert khi có consumer cần)
         """
+        if pixel_format not in (PIXEL_FORMAT_BGR, PIXEL_FORMAT_YUYV):
+            logger.warning(f"[Camera Direct] Định dạng '{pixel_format}' không hỗ trợ qua OpenCV V4L2, dùng BGR")
+            pixel_format = PIXEL_FORMAT_BGR
+        
         # Khởi tạo các biến thành viên
-        self._latest_frame = [None]
+        self._init_frame_state(pixel_format)
         self._stop_event = threading.Event()
         self._thread = None
         self._is_running = False
@@ -42,6 +63,7 @@ class CameraDirect(Camera):
         self._last_frame_time = 0
         self._frame_count = 0
         self._error_count = 0
+        self.frame_bus = None
         
         # Mở camera
         self._open_camera()
@@ -62,12 +84,19 @@ class CameraDirect(Camera):
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
         self.cap.set(cv2.CAP_PROP_FPS, self.target_fps)
         
+        if self.pixel_format == PIXEL_FORMAT_YUYV:
+            # Lấy YUYV thô từ driver, bỏ bước convert sang BGR của OpenCV
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
+            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        
         # Lấy độ phân giải thực tế
         actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         actual_fps = self.cap.get(cv2.CAP_PROP_FPS)
         
-        logger.info(f"[Camera Direct] Camera đã mở: {actual_width}x{actual_height} @ {actual_fps} FPS")
+        self._frame_size = (actual_width, actual_height)
+        
+        logger.info(f"[Camera Direct] Camera đã mở: {actual_width}x{actual_height} @ {actual_fps} FPS ({self.pixel_format})")
         
         # Thiết lập các thông số khác nếu cần
         # self.cap.set(cv2.CAP_PROP_BRIGHTNESS, 150)
@@ -75,6 +104,17 @@ class CameraDirect(Camera):
         # self.cap.set(cv2.CAP_PROP_SATURATION, 50)
         # self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Giảm buffer để giảm độ trễ
         container.register("camera", self)
+        
+        # Frame bus shared memory cho consumer ở process khác (chỉ tạo một lần, giữ qua reconnect)
+        if CAMERA_FRAME_BUS and self.frame_bus is None:
+            try:
+                channels = 2 if self.pixel_format == PIXEL_FORMAT_YUYV else 3
+                self.frame_bus = FrameBus(CAMERA_FRAME_BUS, actual_width, actual_height,
+                                          channels=channels, num_slots=CAMERA_FRAME_BUS_SLOTS,
+                                          pixel_format=self.pixel_format)
+                container.register("frame_bus", self.frame_bus)
+            except Exception as e:
+                logger.error(f"[Camera Direct] Không tạo được frame bus: {e}")
     
     def _reconnect(self):
         """Thử kết nối lại camera."""
@@ -126,7 +166,12 @@ class CameraDirect(Camera):
                     
                     # Reset error counter khi đọc thành công
                     consecutive_errors = 0
-                    self._latest_frame[0] = frame
+                    if self.pixel_format == PIXEL_FORMAT_YUYV and frame.ndim != 3:
+                        # Một số backend trả về buffer thô 1 hàng
+                        frame = frame.reshape(self._frame_size[1], self._frame_size[0], 2)
+                    self._publish_frame(frame)
+                    if self.frame_bus is not None:
+                        self.frame_bus.publish(frame)
                     self._frame_count += 1
                     self._last_frame_time = time.time()
                     
@@ -140,15 +185,6 @@ class CameraDirect(Camera):
         self._is_running = True
         logger.info("[Camera Direct] Đã khởi động camera thread")
     
-    def get_latest_frame(self) -> Optional[np.ndarray]:
-        """
-        Lấy frame mới nhất từ camera.
-        
-        Returns:
-            Frame dưới dạng numpy array hoặc None nếu chưa có frame
-        """
-        return self._latest_frame[0]
-    
     def get_stats(self) -> dict:
         """
         Lấy thống kê về camera.
@@ -158,10 +194,13 @@ class CameraDirect(Camera):
         """
         return {
             'frame_count': self._frame_count,
+            'frame_seq': self._frame_seq,
             'error_count': self._error_count,
             'is_running': self.is_running(),
             'target_fps': self.target_fps,
-            'camera_id': self.camera_id
+            'camera_id': self.camera_id,
+            'pixel_format': self.pixel_format,
+            'frame_bus_seq': self.frame_bus.latest_seq if self.frame_bus is not None else None
         }
     
     def is_running(self) -> bool:
@@ -188,6 +227,10 @@ class CameraDirect(Camera):
         if self.cap:
             self.cap.release()
             logger.info(f"[Camera Direct] Đã giải phóng camera. Stats: {self.get_stats()}")
+        
+        if self.frame_bus is not None:
+            self.frame_bus.close()
+            self.frame_bus = None
     
     def __enter__(self):
         """Context manager entry."""
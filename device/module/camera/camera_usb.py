@@ -3,19 +3,31 @@ import cv2
 
 from log import setup_logger
 from .camera_base import Camera
+from .frame_views import PIXEL_FORMAT_BGR, PIXEL_FORMAT_I420
 
 logger = setup_logger(__name__)
 
+try:
+    from config import CAMERA_CAPTURE_FORMAT
+except ImportError:
+    CAMERA_CAPTURE_FORMAT = PIXEL_FORMAT_BGR  # "bgr" hoặc "i420"
+
 class CameraUSB(Camera):
-    def __init__(self):
+    def __init__(self, pixel_format=CAMERA_CAPTURE_FORMAT):
         try:
+            if pixel_format == PIXEL_FORMAT_I420:
+                # jpegdec xuất YUV sẵn: giữ I420 tới WebRTC, BGR chỉ convert khi cần
+                output = "video/x-raw,format=I420"
+            else:
+                pixel_format = PIXEL_FORMAT_BGR
+                output = "video/x-raw,format=BGR"
             pipeline = (
                 "v4l2src device=/dev/video0 ! "
                 "image/jpeg,width=1280,height=720,framerate=30/1 ! "
-                "jpegdec ! videoconvert ! video/x-raw,format=BGR ! "
+                f"jpegdec ! videoconvert ! {output} ! "
                 "appsink drop=true max-buffers=1 sync=false"
             )
-            super().__init__(pipeline)
+            super().__init__(pipeline, pixel_format)
             self.run()
         except Exception as e:
             logger.warning(f"[Camera USB] Lỗi khởi tạo camera với GStreamer: {e}", exc_info=True)
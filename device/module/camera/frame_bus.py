@@ -0,0 +1,370 @@
+"""
+Frame Bus
+=========
+
+Bus chia sẻ frame camera qua shared memory giữa các process mà không cần
+pickle hay copy.
+
+Shared memory gồm một ring các slot cấp phát trước, mỗi slot có sequence
+number riêng (seqlock):
+
+    [header: write_seq, slot_size, num_slots][slot meta x N][slot data x N]
+
+- Writer ghi seq = 0 vào slot trước khi ghi dữ liệu, ghi seq thật sau khi xong,
+  rồi cập nhật write_seq và notify condition.
+- Reader map slot thành numpy view (không copy). Sau khi dùng xong view, gọi
+  `is_valid(seq)` để chắc chắn slot chưa bị ghi đè (ring quay vòng sau N frame).
+- Reader có thể block trên "frame tiếp theo sau seq N" bằng `wait_next()`.
+
+Reader được tạo bằng `FrameBus.reader()` và có thể truyền sang process con
+(multiprocessing.Process args) vì condition được kế thừa khi tạo process.
+Process độc lập có thể dùng `FrameBusReader.attach(name)` thay cho đường
+ZMQ + pickle của module/camera.py. Reader này được đánh thức qua một Unix
+datagram socket cùng tên với segment (abstract namespace, Linux): reader gửi
+đăng ký tới socket của writer, mỗi lần publish writer gửi 1 byte tới từng
+reader đã đăng ký.
+"""
+
+import multiprocessing as mp
+import select
+import socket
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+from log import setup_logger
+
+from .frame_views import PIXEL_FORMAT_BGR, PIXEL_FORMATS
+
+logger = setup_logger(__name__)
+
+SLOT_META_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("timestamp", "<f8"),
+    ("height", "<u4"),
+    ("width", "<u4"),
+    ("channels", "<u4"),
+    ("reserved", "<u4"),
+])
+HEADER_DTYPE = np.dtype([
+    ("write_seq", "<u8"),
+    ("slot_size", "<u8"),
+    ("num_slots", "<u4"),
+    ("pixel_format", "<u4"),  # 1 + index trong PIXEL_FORMATS
+])
+_HEADER_SIZE = 64  # header + padding (giữ các vùng sau căn theo cache line)
+
+_SUBSCRIBE = b"+"
+_UNSUBSCRIBE = b"-"
+_WAKEUP = b"!"
+_RESUBSCRIBE_INTERVAL = 1.0  # Reader đăng ký lại khi đang chờ (writer có thể vừa khởi động lại)
+
+
+def _notify_address(name: str) -> str:
+    """Địa chỉ socket thông báo của writer (abstract namespace: không tạo file, mất khi process thoát)"""
+    return f"\0frame_bus/{name}"
+
+
+def _layout(num_slots: int, slot_size: int) -> Tuple[int, int, int]:
+    """Trả về (meta_offset, data_offset, total_size)"""
+    meta_offset = _HEADER_SIZE
+    data_offset = meta_offset + num_slots * SLOT_META_DTYPE.itemsize
+    data_offset = (data_offset + 63) // 64 * 64
+    return meta_offset, data_offset, data_offset + num_slots * slot_size
+
+
+class _FrameBusView:
+    """Phần dùng chung giữa writer và reader: map shared memory thành numpy views"""
+
+    def __init__(self, name: str, num_slots: int, slot_size: int, create: bool):
+        self.name = name
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        meta_offset, data_offset, total_size = _layout(num_slots, slot_size)
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=total_size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._untrack()
+        buf = self._shm.buf
+        self._header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=buf, offset=0)
+        self._write_seq = self._header["write_seq"]
+        self._meta = np.ndarray((num_slots,), dtype=SLOT_META_DTYPE, buffer=buf, offset=meta_offset)
+        self._data = np.ndarray((num_slots, slot_size), dtype=np.uint8, buffer=buf, offset=data_offset)
+
+    def _untrack(self):
+        # Python < 3.13: resource_tracker của process reader sẽ unlink segment khi
+        # process kết thúc, dù writer vẫn đang dùng. Chỉ writer được unlink.
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+
+    @property
+    def latest_seq(self) -> int:
+        return int(self._write_seq[0])
+
+    def is_valid(self, seq: int) -> bool:
+        """Slot của seq chưa bị ghi đè"""
+        return seq > 0 and int(self._meta[seq % self.num_slots]["seq"]) == seq
+
+    def view(self, seq: int) -> Optional[np.ndarray]:
+        """
+        Numpy view (không copy) của frame có sequence `seq`, hoặc None nếu slot đã bị ghi đè.
+        View chỉ đáng tin khi `is_valid(seq)` vẫn đúng sau khi dùng xong.
+        """
+        if not self.is_valid(seq):
+            return None
+        meta = self._meta[seq % self.num_slots]
+        h, w, c = int(meta["height"]), int(meta["width"]), int(meta["channels"])
+        frame = self._data[seq % self.num_slots, :h * w * c].reshape(h, w, c)
+        return frame if c > 1 else frame.reshape(h, w)
+
+    def timestamp(self, seq: int) -> Optional[float]:
+        if not self.is_valid(seq):
+            return None
+        return float(self._meta[seq % self.num_slots]["timestamp"])
+
+    def close(self):
+        self._header = self._write_seq = self._meta = self._data = None
+        try:
+            self._shm.close()
+        except Exception:
+            pass
+
+
+class FrameBus(_FrameBusView):
+    """Phía ghi (camera capture thread) của frame bus"""
+
+    def __init__(self, name: str, width: int, height: int, channels: int = 3, num_slots: int = 4,
+                 pixel_format: str = PIXEL_FORMAT_BGR):
+        """
+        Args:
+            name: Tên shared memory segment (ví dụ "blind_helper_camera")
+            width, height, channels: Kích thước frame tối đa mỗi slot
+            num_slots: Số slot trong ring - reader có N-1 frame thời gian để dùng view
+            pixel_format: Định dạng pixel của frame (PIXEL_FORMAT_*), ghi vào header cho reader
+        """
+        self.width = width
+        self.height = height
+        self.channels = channels
+        try:
+            super().__init__(name, num_slots, width * height * channels, create=True)
+        except FileExistsError:
+            # Segment còn sót lại từ lần chạy trước bị crash
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            super().__init__(name, num_slots, width * height * channels, create=True)
+        self._write_seq[0] = 0
+        self._header["slot_size"] = self.slot_size
+        self._header["num_slots"] = num_slots
+        self._header["pixel_format"] = PIXEL_FORMATS.index(pixel_format) + 1
+        self._meta["seq"] = 0
+        self._cond = mp.Condition()
+        self._subscribers = set()
+        self._notify_sock = None
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(_notify_address(name))
+            sock.setblocking(False)
+            self._notify_sock = sock
+        except OSError as e:
+            logger.warning(f"[FrameBus] Không tạo được socket thông báo, reader attach theo tên sẽ poll: {e}")
+        logger.info(f"[FrameBus] Created '{name}': {num_slots} slots x {width}x{height}x{channels}")
+
+    def publish(self, frame: np.ndarray, timestamp: Optional[float] = None) -> int:
+        """
+        Ghi frame vào slot tiếp theo và đánh thức các reader đang chờ
+
+        Returns:
+            Sequence number của frame, hoặc 0 nếu frame lớn hơn slot
+        """
+        if frame.nbytes > self.slot_size:
+            logger.warning(f"[FrameBus] Frame {frame.shape} lớn hơn slot ({self.slot_size} bytes), bỏ qua")
+            return 0
+
+        seq = self.latest_seq + 1
+        slot = seq % self.num_slots
+        meta = self._meta[slot:slot + 1]
+        meta["seq"] = 0  # Đánh dấu đang ghi
+        self._data[slot, :frame.nbytes].reshape(frame.shape)[...] = frame
+        h, w = frame.shape[:2]
+        meta["timestamp"] = timestamp if timestamp is not None else time.time()
+        meta["height"] = h
+        meta["width"] = w
+        meta["channels"] = frame.shape[2] if frame.ndim == 3 else 1
+        meta["seq"] = seq
+
+        with self._cond:
+            self._write_seq[0] = seq
+            self._cond.notify_all()
+        self._notify_subscribers()
+        return seq
+
+    def _notify_subscribers(self):
+        """Đánh thức các reader attach theo tên (xử lý đăng ký mới trước)"""
+        sock = self._notify_sock
+        if sock is None:
+            return
+        while True:
+            try:
+                message, address = sock.recvfrom(16)
+            except OSError:  # BlockingIOError: hết message
+                break
+            if message == _SUBSCRIBE:
+                self._subscribers.add(address)
+            elif message == _UNSUBSCRIBE:
+                self._subscribers.discard(address)
+        for address in list(self._subscribers):
+            try:
+                sock.sendto(_WAKEUP, address)
+            except BlockingIOError:
+                pass  # Reader chưa đọc thông báo trước đó - vẫn sẽ thức dậy
+            except OSError:
+                # ConnectionRefusedError: reader đã thoát mà không hủy đăng ký
+                self._subscribers.discard(address)
+
+    def reader(self) -> "FrameBusReader":
+        """Tạo reader (có thể truyền sang process con qua multiprocessing.Process args)"""
+        return FrameBusReader(self.name, self.num_slots, self.slot_size, self._cond)
+
+    def close(self, unlink: bool = True):
+        """Đóng bus; writer chịu trách nhiệm unlink segment"""
+        if self._notify_sock is not None:
+            self._notify_sock.close()
+            self._notify_sock = None
+        self._subscribers.clear()
+        super().close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        logger.info(f"[FrameBus] Closed '{self.name}'")
+
+
+class FrameBusReader(_FrameBusView):
+    """Phía đọc của frame bus - dùng được trong cùng process hoặc process khác"""
+
+    def __init__(self, name: str, num_slots: int, slot_size: int, cond=None):
+        super().__init__(name, num_slots, slot_size, create=False)
+        self._cond = cond
+        self._notify_sock = None
+        self._subscribed_at = None
+
+    @property
+    def pixel_format(self) -> str:
+        code = int(self._header["pixel_format"][0])
+        return PIXEL_FORMATS[code - 1] if 0 < code <= len(PIXEL_FORMATS) else PIXEL_FORMAT_BGR
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameBusReader":
+        """
+        Attach vào bus chỉ bằng tên (process không được tạo từ process camera).
+        Reader này không có condition: `wait_next()` chờ trên socket thông báo của writer.
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf, offset=0)
+            num_slots, slot_size = int(header["num_slots"][0]), int(header["slot_size"][0])
+            del header
+        finally:
+            shm.close()
+        return cls(name, num_slots, slot_size)
+
+    def __getstate__(self):
+        return {"name": self.name, "num_slots": self.num_slots,
+                "slot_size": self.slot_size, "cond": self._cond}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], state["num_slots"], state["slot_size"], state["cond"])
+
+    def _subscribe(self) -> bool:
+        """Đăng ký nhận thông báo từ writer; False nếu writer chưa có socket"""
+        if self._notify_sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind("")  # Linux autobind: địa chỉ abstract ngẫu nhiên để writer gửi lại
+            sock.setblocking(False)
+            self._notify_sock = sock
+        try:
+            self._notify_sock.sendto(_SUBSCRIBE, _notify_address(self.name))
+        except OSError:
+            self._subscribed_at = None
+            return False
+        self._subscribed_at = time.monotonic()
+        return True
+
+    def _drain_notifications(self):
+        while True:
+            try:
+                self._notify_sock.recv(64)
+            except OSError:
+                break
+
+    def _wait_notified(self, after_seq: int, timeout: Optional[float]) -> bool:
+        """Chờ qua socket thông báo (reader attach theo tên); False nếu timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.latest_seq <= after_seq:
+            now = time.monotonic()
+            remaining = _RESUBSCRIBE_INTERVAL if deadline is None else deadline - now
+            if remaining <= 0:
+                return False
+            if self._subscribed_at is None or now - self._subscribed_at >= _RESUBSCRIBE_INTERVAL:
+                self._subscribe()
+            if self._subscribed_at is None:
+                # Writer chưa chạy / không có socket: kiểm tra lại sau
+                time.sleep(min(remaining, 0.05))
+                continue
+            # Đăng ký trước khi kiểm tra write_seq nên thông báo của frame mới không bị lỡ
+            if self.latest_seq > after_seq:
+                break
+            readable, _, _ = select.select([self._notify_sock], [], [], min(remaining, _RESUBSCRIBE_INTERVAL))
+            if readable:
+                self._drain_notifications()
+        return True
+
+    def wait_next(self, after_seq: int, timeout: Optional[float] = None) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Block tới khi có frame với seq > after_seq
+
+        Returns:
+            (seq, view) của frame mới nhất, hoặc (after_seq, None) nếu timeout
+        """
+        if self.latest_seq <= after_seq:
+            if self._cond is None:
+                if not self._wait_notified(after_seq, timeout):
+                    return after_seq, None
+            else:
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self.latest_seq > after_seq, timeout):
+                        return after_seq, None
+        seq = self.latest_seq
+        return seq, self.view(seq)
+
+    def get_latest_frame(self) -> Optional[np.ndarray]:
+        """Copy frame mới nhất - cùng API với Camera.get_latest_frame() cho consumer ở process khác"""
+        for _ in range(3):
+            seq = self.latest_seq
+            frame = self.view(seq)
+            if frame is None:
+                if seq == 0:
+                    return None
+                continue
+            copy = frame.copy()
+            if self.is_valid(seq):
+                return copy
+        return None
+
+    def close(self):
+        if self._notify_sock is not None:
+            try:
+                self._notify_sock.sendto(_UNSUBSCRIBE, _notify_address(self.name))
+            except OSError:
+                pass
+            self._notify_sock.close()
+            self._notify_sock = None
+        super().close()
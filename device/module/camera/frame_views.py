@@ -0,0 +1,153 @@
+"""
+Frame Views
+===========
+
+Các view dẫn xuất từ một frame camera (RGB 640x480 cho WebRTC, thumbnail
+xám 64x64 để phát hiện thay đổi, JPEG để upload).
+
+Mỗi view được tính lười (lazy) và cache theo frame: dù bao nhiêu consumer
+yêu cầu, mỗi view chỉ được tính tối đa một lần cho mỗi frame.
+
+Frame gốc có thể ở dạng BGR (mặc định của OpenCV) hoặc YUV thô từ camera
+(PIXEL_FORMAT_YUYV, PIXEL_FORMAT_I420). Với YUV, video frame cho WebRTC được
+tạo trực tiếp ở yuv420p, còn BGR chỉ được convert khi có consumer cần.
+"""
+
+import threading
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from config import CAMERA_JPEG_QUALITY
+except ImportError:
+    CAMERA_JPEG_QUALITY = 95  # Giống mặc định của cv2.imencode
+
+WEBRTC_SIZE = (640, 480)
+THUMBNAIL_SIZE = (64, 64)
+
+# Định dạng pixel của frame gốc
+PIXEL_FORMAT_BGR = "bgr"    # (h, w, 3)
+PIXEL_FORMAT_YUYV = "yuyv"  # (h, w, 2) - YUYV 4:2:2 packed (V4L2 với CAP_PROP_CONVERT_RGB=0)
+PIXEL_FORMAT_I420 = "i420"  # (h * 3 / 2, w) - planar 4:2:0 (GStreamer video/x-raw,format=I420)
+PIXEL_FORMATS = (PIXEL_FORMAT_BGR, PIXEL_FORMAT_YUYV, PIXEL_FORMAT_I420)
+
+_AV_FORMATS = {
+    PIXEL_FORMAT_BGR: "bgr24",
+    PIXEL_FORMAT_YUYV: "yuyv422",
+    PIXEL_FORMAT_I420: "yuv420p",
+}
+_BGR_CONVERSIONS = {
+    PIXEL_FORMAT_YUYV: cv2.COLOR_YUV2BGR_YUYV,
+    PIXEL_FORMAT_I420: cv2.COLOR_YUV2BGR_I420,
+}
+
+
+class FrameViews:
+    """Frame gốc từ camera cùng các view dẫn xuất được cache"""
+
+    def __init__(self, raw: np.ndarray, seq: int = 0, timestamp: Optional[float] = None,
+                 jpeg_quality: int = CAMERA_JPEG_QUALITY, pixel_format: str = PIXEL_FORMAT_BGR):
+        """
+        Args:
+            raw: Frame gốc từ camera (không bị sửa đổi)
+            seq: Sequence number của frame
+            timestamp: Thời điểm capture
+            jpeg_quality: Chất lượng JPEG (0-100) cho view `jpeg()`
+            pixel_format: Định dạng của frame gốc (PIXEL_FORMAT_*)
+        """
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format '{pixel_format}'")
+        self.raw = raw
+        self.pixel_format = pixel_format
+        self.seq = seq
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.jpeg_quality = jpeg_quality
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height) của frame gốc"""
+        height, width = self.raw.shape[:2]
+        if self.pixel_format == PIXEL_FORMAT_I420:
+            height = height * 2 // 3
+        return width, height
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """Frame BGR đầy đủ độ phân giải (với frame YUV chỉ convert khi được yêu cầu)"""
+        if self.pixel_format == PIXEL_FORMAT_BGR:
+            return self.raw
+        return self._cached("bgr", lambda: cv2.cvtColor(self.raw, _BGR_CONVERSIONS[self.pixel_format]))
+
+    def _luma(self) -> np.ndarray:
+        """Kênh độ sáng (Y) - với YUV lấy trực tiếp, không convert"""
+        if self.pixel_format == PIXEL_FORMAT_YUYV:
+            return self.raw[:, :, 0]
+        if self.pixel_format == PIXEL_FORMAT_I420:
+            return self.raw[:self.size[1]]
+        return cv2.cvtColor(self.raw, cv2.COLOR_BGR2GRAY)
+
+    def _cached(self, key, compute):
+        view = self._cache.get(key)
+        if view is not None:
+            return view
+        # Lock riêng cho từng view: compute() có thể gọi view khác (video_frame -> rgb -> bgr),
+        # giữ một lock chung ở đây sẽ tự deadlock
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Kiểm tra lại trong lock: consumer khác có thể vừa tính xong
+            view = self._cache.get(key)
+            if view is None:
+                view = compute()
+                self._cache[key] = view
+            return view
+
+    def rgb(self, size: Tuple[int, int] = WEBRTC_SIZE) -> np.ndarray:
+        """Frame RGB đã resize (mặc định 640x480 cho WebRTC)"""
+        def compute():
+            frame = self.bgr
+            if self.size != size:
+                # Resize trước rồi mới đổi màu: ít pixel phải convert hơn
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return self._cached(("rgb", size), compute)
+
+    def video_frame(self, size: Tuple[int, int] = WEBRTC_SIZE):
+        """
+        av.VideoFrame yuv420p đã resize, sẵn sàng cho encoder VP8/H264.
+
+        Frame YUV được đưa thẳng vào libswscale (resize + đổi định dạng trong một
+        lần), không đi qua BGR/RGB. Frame BGR đi theo đường rgb24 như cũ.
+        """
+        def compute():
+            # Import lười: module camera không bắt buộc phải có PyAV
+            import av
+            if self.pixel_format == PIXEL_FORMAT_BGR:
+                return av.VideoFrame.from_ndarray(self.rgb(size), format="rgb24")
+            frame = av.VideoFrame.from_ndarray(self.raw, format=_AV_FORMATS[self.pixel_format])
+            if self.size == size and self.pixel_format == PIXEL_FORMAT_I420:
+                return frame
+            return frame.reformat(width=size[0], height=size[1], format="yuv420p")
+        return self._cached(("video_frame", size), compute)
+
+    def gray_thumbnail(self) -> np.ndarray:
+        """Thumbnail xám 64x64 dùng để so sánh khác biệt giữa các frame"""
+        def compute():
+            if self.pixel_format == PIXEL_FORMAT_BGR:
+                small = cv2.resize(self.raw, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+                return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            return cv2.resize(self._luma(), THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        return self._cached("gray_thumbnail", compute)
+
+    def jpeg(self) -> Optional[bytes]:
+        """Frame gốc mã hoá JPEG, None nếu mã hoá lỗi"""
+        def compute():
+            success, buffer = cv2.imencode('.jpg', self.bgr, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            return buffer.tobytes() if success else b""
+        return self._cached("jpeg", compute) or None
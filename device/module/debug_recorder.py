@@ -0,0 +1,126 @@
+"""
+Debug Audio Recorder
+====================
+
+Ghi file WAV debug (audio mic, audio TTS từ server, ...) chỉ khi được bật
+(`DEBUG_AUDIO_DUMP`) và tối đa một file mỗi `DEBUG_AUDIO_DUMP_INTERVAL` giây
+cho mỗi tên, để không ghi thẻ SD mỗi câu nói.
+
+Việc ghi file chạy trên thread riêng: caller chỉ xếp hàng, không bao giờ chờ I/O.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import soundfile as sf
+
+from container import container
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+try:
+    from config import DEBUG_AUDIO_DUMP
+except ImportError:
+    DEBUG_AUDIO_DUMP = False
+
+try:
+    from config import DEBUG_AUDIO_DUMP_INTERVAL
+except ImportError:
+    DEBUG_AUDIO_DUMP_INTERVAL = 60.0
+
+try:
+    from config import DEBUG_AUDIO_DIR
+except ImportError:
+    from config import BASE_DIR
+    DEBUG_AUDIO_DIR = os.path.join(BASE_DIR, "debug")
+
+
+def get_debug_recorder() -> "DebugAudioRecorder":
+    """Recorder dùng chung (tạo ở lần gọi đầu tiên)"""
+    try:
+        recorder = container.get("debug_recorder")
+    except Exception:
+        recorder = None
+    if recorder is None:
+        recorder = DebugAudioRecorder()
+        container.register("debug_recorder", recorder)
+    return recorder
+
+
+class DebugAudioRecorder:
+    """Ghi WAV debug opt-in, giới hạn tần suất theo tên file"""
+
+    def __init__(self, directory: str = DEBUG_AUDIO_DIR, enabled: bool = DEBUG_AUDIO_DUMP,
+                 min_interval: float = DEBUG_AUDIO_DUMP_INTERVAL, max_pending: int = 4):
+        """
+        Args:
+            directory: Thư mục lưu file
+            enabled: Bật ghi file
+            min_interval: Khoảng cách tối thiểu giữa hai lần ghi cùng một tên (giây)
+            max_pending: Số file tối đa chờ ghi; đầy thì bỏ
+        """
+        self.directory = directory
+        self.enabled = enabled
+        self.min_interval = min_interval
+        self._last_write: Dict[str, float] = {}
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.written = 0
+        self.skipped = 0
+
+    def record(self, name: str, audio: np.ndarray, sample_rate: int) -> bool:
+        """
+        Xếp hàng ghi `<directory>/<name>.wav` nếu được bật và đủ thời gian từ lần ghi trước
+
+        Args:
+            name: Tên file (không có đuôi), ví dụ "audio_mic"
+            audio: PCM int16 hoặc float [-1, 1]; được copy trước khi xếp hàng
+            sample_rate: Sample rate của audio
+
+        Returns:
+            True nếu đã xếp hàng ghi
+        """
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_write.get(name)
+            if last is not None and now - last < self.min_interval:
+                self.skipped += 1
+                return False
+            try:
+                self._queue.put_nowait((name, np.array(audio, copy=True), sample_rate))
+            except queue.Full:
+                self.skipped += 1
+                return False
+            self._last_write[name] = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name="debug-audio", daemon=True)
+                self._thread.start()
+        return True
+
+    def _writer(self):
+        while True:
+            name, audio, sample_rate = self._queue.get()
+            file_path = os.path.join(self.directory, f"{name}.wav")
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                sf.write(file_path, audio, sample_rate, subtype='PCM_16')
+                self.written += 1
+                logger.debug(f"💾 Đã lưu file âm thanh: {file_path}")
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi lưu file âm thanh: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'written': self.written,
+            'skipped': self.skipped,
+        }
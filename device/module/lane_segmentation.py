@@ -9,10 +9,19 @@ import numpy as np
 from config import BASE_DIR, SERVER_HTTP_BASE, DIFF_THRESHOLD, SEND_INTERVAL_MIN, SEND_INTERVAL_MAX
 from container import container
 from module.camera.camera_base import Camera
+from module.camera.frame_bus import FrameBusReader
+from module.camera.frame_views import FrameViews
 from module.voice_speaker import VoiceSpeaker
+from module.audio_device import PRIORITY_WARNING
 
 from log import setup_logger
 logger = setup_logger(__name__)
+
+try:
+    from config import CAMERA_FRAME_BUS
+except ImportError:
+    CAMERA_FRAME_BUS = None  # Tên shared memory segment của camera, None = đọc trực tiếp từ camera
+
 class LaneSegmentation:
     def __init__(self):
         self.running = False
@@ -22,24 +31,24 @@ class LaneSegmentation:
         container.register("lane_segmentation", self)
         logger.info("[LaneSegmentation] Đã khởi động")
         
-    def frames_are_different(self, frame1, frame2, threshold):
-        if frame1 is None or frame2 is None:
+    def frames_are_different(self, views1: FrameViews, views2: FrameViews, threshold):
+        if views1 is None or views2 is None:
             return True
-        # Resize nhỏ lại để so sánh nhanh hơn, giảm nhiễu
-        small1 = cv2.resize(frame1, (64, 64))
-        small2 = cv2.resize(frame2, (64, 64))
-        diff = cv2.absdiff(small1, small2)
+        if views1 is views2:
+            return False
+        # So sánh thumbnail 64x64 (camera cache sẵn theo frame) để nhanh hơn, giảm nhiễu
+        diff = cv2.absdiff(views1.gray_thumbnail(), views2.gray_thumbnail())
         mean_diff = np.mean(diff)
         return mean_diff > threshold
 
-    def send_image_to_api(self, frame):
+    def send_image_to_api(self, views: FrameViews):
         try:
-            success, buffer = cv2.imencode('.jpg', frame)
-            if not success:
+            jpeg = views.jpeg()
+            if jpeg is None:
                 logger.error("[API] Lỗi mã hóa ảnh.")
                 return
             files = {
-                'image': ('obstacle.jpg', buffer.tobytes(), 'image/jpeg')
+                'image': ('obstacle.jpg', jpeg, 'image/jpeg')
             }
             
             # Gửi request với timeout
@@ -74,11 +83,9 @@ class LaneSegmentation:
                     # Đường dẫn đến file audio trong thư mục warning
                     audio_path = os.path.join(BASE_DIR, "audio", "warning", f"{audio_file}.wav")
                     
-                    # Kiểm tra file tồn tại
-                    if os.path.exists(audio_path):
-                        logger.info(f"[API] Phát cảnh báo: {audio_path}")
-                        speaker.play_file(audio_path)
-                    else:
+                    # Cue nạp sẵn khi khởi động - phát ngay, không chờ đọc file / resample
+                    logger.info(f"[API] Phát cảnh báo: {audio_path}")
+                    if not speaker.play_cue(audio_path, priority=PRIORITY_WARNING):
                         logger.warning(f"[API] Không tìm thấy file audio: {audio_path}")
                 else:
                     # Không có audio_file nhưng không an toàn
@@ -96,21 +103,77 @@ class LaneSegmentation:
         except Exception as e:
             logger.error(f"[API] Lỗi gửi ảnh: {e}", exc_info=True)
 
+    def _open_frame_bus(self):
+        """Reader của frame bus: bus trong process (condition) hoặc attach theo tên; None nếu không có bus"""
+        try:
+            bus = container.get("frame_bus")
+        except Exception:
+            bus = None
+        if bus is not None:
+            return bus.reader()
+        if CAMERA_FRAME_BUS:
+            try:
+                return FrameBusReader.attach(CAMERA_FRAME_BUS)
+            except FileNotFoundError:
+                logger.warning(f"[LaneSegmentation] Frame bus '{CAMERA_FRAME_BUS}' chưa có, đọc từ camera")
+        return None
+
+    @staticmethod
+    def _wait_views(reader: FrameBusReader, after_seq: int, timeout: float = 1.0):
+        """Chờ frame mới trên bus và copy ra FrameViews; (after_seq, None) nếu timeout / slot bị ghi đè"""
+        seq, frame = reader.wait_next(after_seq, timeout=timeout)
+        if frame is None:
+            return after_seq, None
+        raw = frame.copy()
+        timestamp = reader.timestamp(seq)
+        if not reader.is_valid(seq):
+            return after_seq, None
+        return seq, FrameViews(raw, seq=seq, timestamp=timestamp, pixel_format=reader.pixel_format)
+
+    def _check_and_send(self, prev_views: FrameViews, latest_views: FrameViews, now: float, last_sent_time: float) -> float:
+        """So sánh hai frame, gửi ảnh nếu khác biệt lớn; trả về thời điểm gửi gần nhất"""
+        if self.frames_are_different(latest_views, prev_views, DIFF_THRESHOLD):  # nếu khác biệt lớn
+            self.adaptive_interval = max(SEND_INTERVAL_MIN, self.adaptive_interval * 0.8)
+            self.send_image_to_api(latest_views)
+            return now
+        self.adaptive_interval = min(SEND_INTERVAL_MAX, self.adaptive_interval * 1.2)
+        return last_sent_time
+
     def api_sender_thread(self):
+        reader = self._open_frame_bus()
+        if reader is None:
+            self._camera_sender_loop()
+            return
+        logger.info(f"[LaneSegmentation] Đọc frame từ frame bus '{reader.name}'")
+        try:
+            self._bus_sender_loop(reader)
+        finally:
+            reader.close()
+
+    def _bus_sender_loop(self, reader: FrameBusReader):
+        """Chờ frame mới trên frame bus (không poll), so sánh với frame ~1s trước"""
+        last_sent_time = 0
+        seq, prev_views = 0, None
+        while not self._stop_event.is_set():
+            seq, views = self._wait_views(reader, seq)
+            if views is None:
+                continue
+            now = time.time()
+            if prev_views is not None and now - last_sent_time >= self.adaptive_interval:
+                last_sent_time = self._check_and_send(prev_views, views, now, last_sent_time)
+            prev_views = views
+            self._stop_event.wait(1)
+
+    def _camera_sender_loop(self):
         last_sent_time = 0
         while not self._stop_event.is_set():
             now = time.time()
             camera: Camera = container.get("camera")
-            prev_frame = camera.get_latest_frame()
+            prev_frame = camera.get_latest_views()
             time.sleep(1)
-            latest_frame = camera.get_latest_frame()
+            latest_frame = camera.get_latest_views()
             if prev_frame is not None and latest_frame is not None and (now - last_sent_time >= self.adaptive_interval):
-                if self.frames_are_different(latest_frame, prev_frame, DIFF_THRESHOLD):  # nếu khác biệt lớn
-                    self.adaptive_interval = max(SEND_INTERVAL_MIN, self.adaptive_interval * 0.8)
-                    self.send_image_to_api(latest_frame)
-                    last_sent_time = now
-                else:  
-                    self.adaptive_interval = min(SEND_INTERVAL_MAX, self.adaptive_interval * 1.2)
+                last_sent_time = self._check_and_send(prev_frame, latest_frame, now, last_sent_time)
     def run(self):
         if self.running:
             logger.warning("[LaneSegmentation] Đã đang chạy rồi!")
@@ -11,6 +11,7 @@ import time
 from config import SERVER_HTTP_BASE, BASE_DIR
 from container import container
 from module.voice_speaker import VoiceSpeaker
+from module.audio_device import PRIORITY_WARNING
 import os
 from log import setup_logger
 from module.camera.camera_base import Camera
@@ -78,14 +79,14 @@ class ObstacleDetectionSystem:
             print(f"Lỗi khi khởi tạo các cảm biến: {e}")
             self.sensors = []
 
-    def send_image_to_api_async(self, frame):
+    def send_image_to_api_async(self, views):
         try:
-            success, buffer = cv2.imencode('.jpg', frame)
-            if not success:
+            jpeg = views.jpeg()
+            if jpeg is None:
                 print("[API] Lỗi mã hóa ảnh.")
                 return
             files = {
-                'image': ('obstacle.jpg', buffer.tobytes(), 'image/jpeg')
+                'image': ('obstacle.jpg', jpeg, 'image/jpeg')
             }
             response = requests.post(f"{SERVER_HTTP_BASE}/detect", files=files)
             data = response.json()
@@ -93,7 +94,7 @@ class ObstacleDetectionSystem:
             message = data.get("data", {}).get(
                 "data", "Không phát hiện vật cản")
             speaker: VoiceSpeaker = container.get("speaker")
-            speaker.play_file(WARNING_SOUND_FILE)
+            speaker.play_cue(WARNING_SOUND_FILE, priority=PRIORITY_WARNING)
         except Exception as e:
             print(f"[API] Lỗi gửi ảnh: {e}")
 
@@ -112,24 +113,24 @@ class ObstacleDetectionSystem:
                 logger.info("[ObstacleDetection] Phát hiện vật cản trong phạm vi 1–1.5m!")
                 
                 speaker: VoiceSpeaker = container.get("speaker")
-                speaker.play_file(WARNING_SOUND_FILE)
+                speaker.play_cue(WARNING_SOUND_FILE, priority=PRIORITY_WARNING)
                 
                 # Lấy ảnh từ camera
                 camera: Camera = container.get("camera")
-                frame = camera.get_latest_frame()
+                views = camera.get_latest_views()
                 
-                if frame is not None:
+                if views is not None:
                     logger.info(f"[ObstacleDetection] Ảnh đã chụp thành công")
                     try:
-                        # Mã hóa ảnh
-                        success, buffer = cv2.imencode('.jpg', frame)
-                        if not success:
+                        # JPEG được cache theo frame, dùng chung với các consumer khác
+                        jpeg = views.jpeg()
+                        if jpeg is None:
                             logger.error("[ObstacleDetection] Lỗi mã hóa ảnh.")
                             return
                         
                         # Gửi ảnh đến API
                         files = {
-                            'image': ('obstacle.jpg', buffer.tobytes(), 'image/jpeg')
+                            'image': ('obstacle.jpg', jpeg, 'image/jpeg')
                         }
                         response = requests.post(f"{SERVER_HTTP_BASE}/detect", files=files, timeout=10)
                         data = response.json()
@@ -139,7 +140,7 @@ class ObstacleDetectionSystem:
                             if audio_file:
                                 audio_file_path = os.path.join(BASE_AUDIO_PATH, f'{audio_file}.wav')
                                 logger.info(f"[ObstacleDetection] Phát âm thanh: {audio_file_path}")
-                                speaker.play_file(audio_file_path)
+                                speaker.play_cue(audio_file_path, priority=PRIORITY_WARNING)
                             else:
                                 logger.warning("[ObstacleDetection] Không có file audio trong response")
                         else:
@@ -0,0 +1,369 @@
+"""
+Streaming TTS Player
+====================
+
+Phát audio TTS từ server ngay khi đủ một lượng prefetch (ví dụ 300 ms) các
+chunk liên tiếp, thay vì chờ nhận hết stream.
+
+- Chunk được giải mã (PCM16 / Opus) và đưa ra loa theo đúng thứ tự
+- Chunk bị thiếu quá `gap_timeout` trong khi đã nhận chunk sau nó được thay
+  bằng khoảng lặng có độ dài ước lượng
+- Các stream được phát lần lượt trên một thread riêng
+- Bộ nhớ có giới hạn như StreamReassembler: tổng byte chunk chưa phát
+  (`max_bytes`) và số stream (`max_streams`); vượt quá thì bỏ stream đang chờ
+  ít được cập nhật gần đây nhất (LRU), chunk vẫn không vừa thì bị bỏ. Stream
+  đang chờ không nhận thêm chunk nào trong `stream_timeout` bị bỏ
+- Metric: time-to-first-audio (từ lúc nhận chunk đầu tới lúc bắt đầu phát)
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from log import setup_logger
+from module.audio_codec import OpusDecoder, iter_opus_packets
+from module.audio_device import PRIORITY_TTS
+from module.debug_recorder import get_debug_recorder
+
+logger = setup_logger(__name__)
+
+try:
+    from config import TTS_PREFETCH_MS
+except ImportError:
+    TTS_PREFETCH_MS = 300
+
+try:
+    from config import TTS_GAP_TIMEOUT
+except ImportError:
+    TTS_GAP_TIMEOUT = 0.5
+
+
+class _TTSStream:
+    """Trạng thái một stream TTS: chunk đã nhận, vị trí phát, bộ giải mã"""
+
+    def __init__(self, stream_id: str, format_audio: str, sample_rate: int):
+        self.stream_id = stream_id
+        self.format = format_audio
+        self.sample_rate = sample_rate
+        self.chunks: Dict[int, bytes] = {}
+        self.next_index = 0
+        self.last_index: Optional[int] = None  # Index chunk cuối khi đã biết
+        self.created = time.monotonic()
+        self.last_arrival = self.created
+        self.gap_since: Optional[float] = None
+        self.aborted = False
+        self.received_chunks = 0
+        self.buffered_bytes = 0  # Byte chunk đã nhận nhưng chưa giải mã
+        self.concealed_chunks = 0
+        self.decoded_samples = 0
+        self.decoded_chunks = 0
+        self._decoder = OpusDecoder(sample_rate) if format_audio == "opus" else None
+        self._carry = b""
+
+    @property
+    def complete(self) -> bool:
+        return self.last_index is not None and self.next_index > self.last_index
+
+    def has_later_chunks(self) -> bool:
+        """Đã nhận chunk sau chunk đang chờ (chunk đang chờ bị thiếu / đến sai thứ tự)"""
+        return any(i > self.next_index for i in self.chunks)
+
+    def decode(self, data: bytes) -> np.ndarray:
+        if self._decoder is not None:
+            pcm = self._decoder.decode_packets(iter_opus_packets(data))
+        else:
+            # Chunk PCM có thể bị cắt lẻ byte: giữ byte thừa cho chunk sau
+            data = self._carry + data
+            usable = len(data) - (len(data) % 2)
+            pcm, self._carry = data[:usable], data[usable:]
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        self.decoded_samples += samples.shape[0]
+        self.decoded_chunks += 1
+        return samples
+
+    def flush(self) -> np.ndarray:
+        if self._decoder is not None:
+            return np.frombuffer(self._decoder.flush(), dtype=np.int16)
+        return np.empty(0, dtype=np.int16)
+
+    def silence(self) -> np.ndarray:
+        """Khoảng lặng thay cho một chunk bị thiếu (độ dài trung bình các chunk đã nhận)"""
+        if self.decoded_chunks:
+            samples = self.decoded_samples // self.decoded_chunks
+        else:
+            samples = self.sample_rate // 10
+        return np.zeros(samples, dtype=np.int16)
+
+
+class StreamingTTSPlayer:
+    """Phát các stream TTS theo kiểu progressive qua `VoiceSpeaker.open_pcm_stream`"""
+
+    def __init__(self, speaker, prefetch_ms: int = TTS_PREFETCH_MS,
+                 gap_timeout: float = TTS_GAP_TIMEOUT, stream_timeout: float = 15.0,
+                 max_bytes: int = 8 * 1024 * 1024, max_streams: int = 16):
+        """
+        Args:
+            speaker: VoiceSpeaker
+            prefetch_ms: Lượng audio liên tiếp cần có trước khi bắt đầu phát
+            gap_timeout: Thời gian chờ một chunk bị thiếu trước khi thay bằng khoảng lặng (giây)
+            stream_timeout: Không nhận thêm chunk nào trong khoảng này thì kết thúc stream (giây)
+            max_bytes: Tổng byte chunk chưa phát tối đa của mọi stream
+            max_streams: Số stream (đang phát + đang chờ) tối đa
+        """
+        self.speaker = speaker
+        self.prefetch_ms = prefetch_ms
+        self.gap_timeout = gap_timeout
+        self.stream_timeout = stream_timeout
+        self.max_bytes = max_bytes
+        self.max_streams = max_streams
+
+        self._cond = threading.Condition()
+        self._streams: "OrderedDict[str, _TTSStream]" = OrderedDict()  # Thứ tự LRU
+        self._pending = deque()
+        self._playing: Optional[str] = None
+        self._bytes = 0
+        self._finished = deque(maxlen=64)  # Stream đã phát xong: bỏ qua chunk đến muộn
+        self._thread: Optional[threading.Thread] = None
+
+        self.streams_played = 0
+        self.concealed_chunks = 0
+        self.late_chunks = 0
+        self.evicted = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.last_ttfa: Optional[float] = None
+        self._ttfa_count = 0
+        self._ttfa_total = 0.0
+        self._ttfa_min: Optional[float] = None
+        self._ttfa_max: Optional[float] = None
+
+    # ----- Producer (MQTT thread) -----
+
+    def add_chunk(self, stream_id, chunk_index: int, total_chunks: int, is_last: bool,
+                  format_audio: str, sample_rate: int, data: bytes):
+        """Nhận một chunk của stream (total_chunks = 0 nếu chưa biết tổng số chunk)"""
+        key = f"{stream_id}"
+        with self._cond:
+            self._expire_pending(time.monotonic())
+            if key in self._finished:
+                self.late_chunks += 1
+                return
+            stream = self._streams.get(key)
+            if stream is not None and (chunk_index < stream.next_index or chunk_index in stream.chunks):
+                # Chunk đến sau khi đã bị thay bằng khoảng lặng, hoặc bị gửi lặp
+                self.late_chunks += 1
+                return
+            if not self._make_room(key, len(data), new_stream=stream is None):
+                self.rejected += 1
+                logger.warning(f"TTS buffer full ({self._bytes} bytes, {len(self._streams)} streams) - "
+                               f"dropping chunk {chunk_index} of stream {key}")
+                return
+            if stream is None:
+                stream = _TTSStream(key, format_audio, sample_rate)
+                self._streams[key] = stream
+                self._pending.append(stream)
+                self._ensure_thread()
+            else:
+                self._streams.move_to_end(key)
+            stream.chunks[chunk_index] = data
+            stream.buffered_bytes += len(data)
+            self._bytes += len(data)
+            stream.received_chunks += 1
+            stream.last_arrival = time.monotonic()
+            if total_chunks:
+                stream.last_index = total_chunks - 1
+            if is_last:
+                stream.last_index = chunk_index
+            self._cond.notify_all()
+
+    def abort(self, stream_id):
+        """Huỷ stream (server báo aborted): dừng phát ngay"""
+        with self._cond:
+            stream = self._streams.get(f"{stream_id}")
+            if stream is not None:
+                stream.aborted = True
+                self._cond.notify_all()
+
+    def _make_room(self, keep: str, size: int, new_stream: bool) -> bool:
+        """
+        Bỏ stream đang chờ (LRU) cho tới khi chunk mới vừa giới hạn (gọi khi giữ lock).
+        Không bỏ stream đang phát hay stream của chunk mới; False nếu vẫn không vừa.
+        """
+        def over():
+            return (self._bytes + size > self.max_bytes
+                    or len(self._streams) + (1 if new_stream else 0) > self.max_streams)
+
+        evictable = [key for key in self._streams if key != keep and key != self._playing]
+        if self._bytes - sum(self._streams[key].buffered_bytes for key in evictable) + size > self.max_bytes:
+            return False  # Bỏ hết stream đang chờ cũng không vừa: giữ chúng, bỏ chunk mới
+        for key in evictable:
+            if not over():
+                break
+            stream = self._drop(key)
+            self.evicted += 1
+            logger.warning(f"Evicted TTS stream {key} ({stream.received_chunks} chunks, "
+                           f"{stream.buffered_bytes} bytes) - buffer budget exceeded")
+        return not over()
+
+    def _expire_pending(self, now: float):
+        """Bỏ stream đang chờ phát đã quá `stream_timeout` không nhận thêm chunk (gọi khi giữ lock)"""
+        for key, stream in list(self._streams.items()):
+            if key != self._playing and now - stream.last_arrival >= self.stream_timeout:
+                self._drop(key)
+                self.timed_out += 1
+                logger.warning(f"TTS stream {key} expired before playback with {stream.received_chunks} chunks")
+
+    def _drop(self, key: str) -> _TTSStream:
+        """Bỏ stream khỏi buffer, chunk đến sau bị bỏ qua (gọi khi giữ lock)"""
+        stream = self._streams.pop(key)
+        self._bytes -= stream.buffered_bytes
+        stream.chunks.clear()
+        try:
+            self._pending.remove(stream)
+        except ValueError:
+            pass
+        self._finished.append(key)
+        return stream
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="tts-player", daemon=True)
+            self._thread.start()
+
+    # ----- Consumer (thread phát) -----
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                stream = self._pending.popleft()
+                self._playing = stream.stream_id
+            try:
+                self._play(stream)
+            except Exception as e:
+                logger.error(f"❌ Lỗi phát TTS stream {stream.stream_id}: {e}", exc_info=True)
+            finally:
+                with self._cond:
+                    self._playing = None
+                    if self._streams.get(stream.stream_id) is stream:
+                        self._drop(stream.stream_id)
+
+    def _next_chunk(self, stream: _TTSStream) -> Tuple[str, Optional[bytes]]:
+        """
+        Chờ chunk kế tiếp (gọi khi giữ lock)
+
+        Returns:
+            ('chunk', data) | ('missing', None) | ('end', None) | ('abort', None)
+        """
+        while True:
+            if stream.aborted:
+                return "abort", None
+            data = stream.chunks.pop(stream.next_index, None)
+            if data is not None:
+                stream.buffered_bytes -= len(data)
+                self._bytes -= len(data)
+                stream.next_index += 1
+                stream.gap_since = None
+                return "chunk", data
+            if stream.complete:
+                return "end", None
+
+            now = time.monotonic()
+            if stream.has_later_chunks():
+                if stream.gap_since is None:
+                    stream.gap_since = now
+                elif now - stream.gap_since >= self.gap_timeout:
+                    logger.warning(f"Missing chunk {stream.next_index} in stream {stream.stream_id} from server")
+                    stream.next_index += 1
+                    stream.gap_since = None
+                    return "missing", None
+            if now - stream.last_arrival >= self.stream_timeout:
+                logger.warning(f"TTS stream {stream.stream_id} timed out with {stream.received_chunks} chunks")
+                return "end", None
+            # Thread phát thức dậy định kỳ khi chờ chunk: dọn luôn các stream đang chờ đã hết hạn
+            self._expire_pending(now)
+            self._cond.wait(timeout=0.05)
+
+    def _play(self, stream: _TTSStream):
+        prefetch_samples = int(stream.sample_rate * self.prefetch_ms / 1000)
+        pending = []
+        pending_samples = 0
+        output = None
+        recorder = get_debug_recorder()
+        recorded = [] if recorder.enabled else None
+
+        while True:
+            with self._cond:
+                action, data = self._next_chunk(stream)
+            if action == "abort":
+                if output is not None:
+                    output.abort()
+                logger.info(f"TTS stream {stream.stream_id} aborted")
+                return
+
+            if action == "chunk":
+                pcm = stream.decode(data)
+            elif action == "missing":
+                pcm = stream.silence()
+                stream.concealed_chunks += 1
+                self.concealed_chunks += 1
+            else:
+                pcm = stream.flush()
+
+            if pcm.shape[0]:
+                if recorded is not None:
+                    recorded.append(pcm)
+                if output is None:
+                    pending.append(pcm)
+                    pending_samples += pcm.shape[0]
+                else:
+                    output.write(pcm)
+
+            if output is None and pending and (pending_samples >= prefetch_samples or action == "end"):
+                output = self.speaker.open_pcm_stream(stream.sample_rate, priority=PRIORITY_TTS)
+                self._record_ttfa(stream)
+                for chunk in pending:
+                    output.write(chunk)
+                pending = []
+
+            if action == "end":
+                break
+
+        if output is not None:
+            output.close()
+        self.streams_played += 1
+        logger.info(f"🔊 TTS stream {stream.stream_id} played: {stream.received_chunks} chunks, "
+                    f"{stream.concealed_chunks} concealed, "
+                    f"{stream.decoded_samples / max(stream.sample_rate, 1):.1f}s audio")
+        if recorded:
+            recorder.record("audio_response_from_server", np.concatenate(recorded), stream.sample_rate)
+
+    def _record_ttfa(self, stream: _TTSStream):
+        ttfa = time.monotonic() - stream.created
+        self.last_ttfa = ttfa
+        self._ttfa_count += 1
+        self._ttfa_total += ttfa
+        self._ttfa_min = ttfa if self._ttfa_min is None else min(self._ttfa_min, ttfa)
+        self._ttfa_max = ttfa if self._ttfa_max is None else max(self._ttfa_max, ttfa)
+        logger.info(f"⏱️ TTS time-to-first-audio: {ttfa * 1000:.0f} ms (stream: {stream.stream_id})")
+
+    def get_stats(self) -> dict:
+        started = self._ttfa_count > 0
+        return {
+            'streams_played': self.streams_played,
+            'active_streams': len(self._streams),
+            'concealed_chunks': self.concealed_chunks,
+            'late_chunks': self.late_chunks,
+            'buffered_bytes': self._bytes,
+            'evicted': self.evicted,
+            'timed_out': self.timed_out,
+            'rejected': self.rejected,
+            'ttfa_last_ms': self.last_ttfa * 1000 if self.last_ttfa is not None else None,
+            'ttfa_avg_ms': self._ttfa_total / self._ttfa_count * 1000 if started else None,
+            'ttfa_min_ms': self._ttfa_min * 1000 if started else None,
+            'ttfa_max_ms': self._ttfa_max * 1000 if started else None,
+        }
@@ -1,32 +1,42 @@
 import time
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from config import MAX_AMP
+from module.audio_buffers import AudioRingBuffer, GrowableAudioBuffer
+from module.vad_engine import VADEngine, RMSVADEngine
 
 
 class VoiceActivityDetector:
     """Phát hiện hoạt động giọng nói (Voice Activity Detection)"""
 
     def __init__(self, sample_rate: int = 48000, silence_threshold: float = 0.02,
-                 silence_duration: float = 5.0, min_speech_duration: float = 0.5):
+                 silence_duration: float = 5.0, min_speech_duration: float = 0.5,
+                 pre_roll_duration: float = 0.5, engine: Optional[VADEngine] = None):
         """
         Args:
             sample_rate: Tần số lấy mẫu
             silence_threshold: Ngưỡng âm lượng để coi là im lặng (0.0-1.0)
             silence_duration: Thời gian im lặng để kết thúc thu âm (giây)
             min_speech_duration: Thời gian nói tối thiểu để bắt đầu thu âm (giây)
+            pre_roll_duration: Thời gian âm thanh trước khi phát hiện giọng nói được
+                giữ lại và ghép vào đầu câu nói, tránh mất âm tiết đầu (giây)
+            engine: Engine quyết định speech / non-speech (mặc định: ngưỡng RMS)
         """
         self.sample_rate = sample_rate
         self.silence_threshold = silence_threshold
         self.silence_duration = silence_duration
         self.min_speech_duration = min_speech_duration
+        self.engine = engine or RMSVADEngine(sample_rate, threshold=silence_threshold)
 
         # Trạng thái
         self.is_speaking = False
         self.speech_start_time = None
         self.silence_start_time = None
-        self.audio_buffer = []
+
+        # Pre-roll ring buffer (cấp phát trước) và buffer liên tục cho câu nói
+        self.pre_roll = AudioRingBuffer(int(sample_rate * pre_roll_duration), dtype=np.float32)
+        self.capture = GrowableAudioBuffer(int(sample_rate * 10), dtype=np.float32)
 
     def process_audio_chunk(self, audio_chunk: np.ndarray) -> Dict[str, Any]:
         """
@@ -36,26 +46,45 @@ class VoiceActivityDetector:
             audio_chunk: Chunk âm thanh (numpy array)
 
         Returns:
-            Dict với thông tin trạng thái
+            Dict với thông tin trạng thái. `action` là một trong:
+            'listening', 'speech_start', 'speaking', 'speech_complete', 'speech_discarded'.
+            `captured` là đoạn âm thanh vừa được thêm vào câu nói (None nếu không có),
+            với 'speech_start' bao gồm cả pre-roll. Đây là view, chỉ hợp lệ tới lần gọi tiếp theo.
         """
-        # Tính RMS (Root Mean Square) để đo âm lượng
-        rms = np.sqrt(np.mean(audio_chunk.astype(np.float32) ** 2))
+        samples = audio_chunk.reshape(-1)
+        is_voice, rms = self.engine.process(samples)
 
         current_time = time.time()
 
+        # Âm thanh được thêm vào câu nói trong lần gọi này (dùng cho streaming upload)
+        captured = None
+
         # Phát hiện giọng nói
-        if rms > self.silence_threshold:
+        if is_voice:
             if not self.is_speaking:
                 # Bắt đầu nói
                 self.is_speaking = True
                 self.speech_start_time = current_time
                 self.silence_start_time = None
-                self.audio_buffer = [audio_chunk]
+                # Ghép pre-roll vào đầu câu nói để không mất âm tiết đầu
+                self.capture.clear()
+                self.pre_roll.read_into(self.capture)
+                self.pre_roll.clear()
+                self.capture.append(samples)
+                captured = self.capture.view()
                 print(f"��️ Bắt đầu phát hiện giọng nói (RMS: {rms:.4f})")
+                return {
+                    'action': 'speech_start',
+                    'is_speaking': True,
+                    'rms': rms,
+                    'speech_duration': 0,
+                    'captured': captured
+                }
             else:
                 # Đang nói - thêm vào buffer
-                self.audio_buffer.append(audio_chunk)
+                self.capture.append(samples)
                 self.silence_start_time = None
+                captured = samples
         else:
             # Im lặng
             if self.is_speaking:
@@ -66,21 +95,8 @@ class VoiceActivityDetector:
                     speech_duration = current_time - self.speech_start_time
                     if speech_duration >= self.min_speech_duration:
                         # Có đủ thời gian nói
-                        # Chuẩn hóa biên độ âm thanh trước khi nối
-                        normalized_buffers = []
-                        for chunk in self.audio_buffer:
-                            # Chuẩn hóa biên độ để tránh tiếng rè
-                            # max_val = np.max(np.abs(chunk))
-                            # if max_val > MAX_AMP:  # Nếu biên độ quá lớn
-                            #     chunk = chunk * (MAX_AMP / max_val)
-                            normalized_buffers.append(chunk)
-
-                        audio_data = np.concatenate(normalized_buffers)
-
-                        # Đảm bảo audio_data là mảng 1 chiều trước khi áp dụng bộ lọc
-                        if len(audio_data.shape) > 1:
-                            # Nếu là mảng nhiều chiều, chỉ lấy kênh đầu tiên
-                            audio_data = audio_data.flatten()
+                        # Copy ra khỏi capture buffer vì buffer sẽ được dùng lại cho câu sau
+                        audio_data = self.capture.view().copy()
 
                         # max_amp = np.max(np.abs(audio_data))
                         # if max_amp > MAX_AMP:
@@ -89,7 +105,7 @@ class VoiceActivityDetector:
                         self.is_speaking = False
                         self.speech_start_time = None
                         self.silence_start_time = None
-                        self.audio_buffer = []
+                        self.capture.clear()
 
                         print(f"✅ Hoàn tất thu âm ({speech_duration:.1f}s)")
                         return {
@@ -105,17 +121,21 @@ class VoiceActivityDetector:
                         self.is_speaking = False
                         self.speech_start_time = None
                         self.silence_start_time = None
-                        self.audio_buffer = []
+                        self.capture.clear()
+                        return {
+                            'action': 'speech_discarded',
+                            'is_speaking': False,
+                            'rms': rms,
+                            'duration': speech_duration
+                        }
             else:
-                # Đang im lặng - thêm vào buffer để phát hiện
-                if len(self.audio_buffer) < 10:  # Giữ buffer nhỏ
-                    self.audio_buffer.append(audio_chunk)
-                else:
-                    self.audio_buffer = self.audio_buffer[1:] + [audio_chunk]
+                # Đang im lặng - giữ lại trong pre-roll để ghép vào đầu câu nói
+                self.pre_roll.write(samples)
 
         return {
             'action': 'listening' if not self.is_speaking else 'speaking',
             'is_speaking': self.is_speaking,
             'rms': rms,
-            'speech_duration': current_time - self.speech_start_time if self.is_speaking else 0
+            'speech_duration': current_time - self.speech_start_time if self.is_speaking else 0,
+            'captured': captured
         }
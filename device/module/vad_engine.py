@@ -0,0 +1,186 @@
+"""
+VAD Engines
+===========
+
+Các engine quyết định speech / non-speech cho VoiceActivityDetector.
+
+Mỗi chunk (thường 100 ms) được chia thành các sub-frame 10-30 ms và đặc trưng
+được tính vector hoá trên toàn bộ sub-frame cùng lúc (numpy 2D).
+"""
+
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+import numpy as np
+
+
+class VADEngine(ABC):
+    """Interface cho engine phát hiện giọng nói"""
+
+    name = "base"
+
+    def __init__(self, sample_rate: int = 48000, frame_ms: int = 20):
+        """
+        Args:
+            sample_rate: Tần số lấy mẫu
+            frame_ms: Độ dài mỗi sub-frame (ms), nên trong khoảng 10-30 ms
+        """
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_len = max(1, int(sample_rate * frame_ms / 1000))
+
+    def _frames(self, samples: np.ndarray) -> np.ndarray:
+        """Chia chunk thành ma trận (n_frames, frame_len) - view, không copy"""
+        samples = samples.reshape(-1)
+        n = samples.shape[0] // self.frame_len
+        if n == 0:
+            # Chunk ngắn hơn một sub-frame: coi cả chunk là một frame
+            return samples.reshape(1, -1)
+        return samples[:n * self.frame_len].reshape(n, self.frame_len)
+
+    @abstractmethod
+    def process(self, samples: np.ndarray) -> Tuple[bool, float]:
+        """
+        Quyết định chunk có chứa giọng nói hay không
+
+        Args:
+            samples: Chunk âm thanh float32 trong khoảng [-1, 1]
+
+        Returns:
+            (is_speech, rms) - rms của cả chunk để log / hiển thị
+        """
+
+    def reset(self):
+        """Xoá trạng thái thích nghi (nếu có)"""
+
+
+class RMSVADEngine(VADEngine):
+    """Engine mặc định: một ngưỡng RMS cố định cho cả chunk"""
+
+    name = "rms"
+
+    def __init__(self, sample_rate: int = 48000, threshold: float = 0.02, frame_ms: int = 20):
+        """
+        Args:
+            threshold: Ngưỡng RMS để coi là giọng nói (0.0-1.0)
+        """
+        super().__init__(sample_rate, frame_ms)
+        self.threshold = threshold
+
+    def process(self, samples: np.ndarray) -> Tuple[bool, float]:
+        frames = self._frames(samples)
+        # Năng lượng từng sub-frame, RMS của chunk = sqrt(trung bình năng lượng)
+        energy = np.einsum("ij,ij->i", frames, frames) / frames.shape[1]
+        rms = float(np.sqrt(energy.mean()))
+        return rms > self.threshold, rms
+
+
+class SpectralVADEngine(VADEngine):
+    """
+    Engine theo frame dùng năng lượng, zero-crossing rate và spectral flatness.
+
+    - Năng lượng so với noise floor thích nghi (ước lượng từ các frame không phải giọng nói)
+    - Spectral flatness trong dải 100-4000 Hz: giọng nói có cấu trúc hài (flatness thấp),
+      tiếng xe cộ / gió gần với nhiễu phẳng
+    - Zero-crossing rate loại bỏ tiếng rít tần số cao
+    - Hangover giữ trạng thái speech thêm vài frame để không cắt giữa các âm tiết
+    """
+
+    name = "spectral"
+
+    def __init__(self, sample_rate: int = 48000, frame_ms: int = 20,
+                 energy_margin_db: float = 9.0, min_energy_db: float = -55.0,
+                 flatness_max: float = 0.45, zcr_max: float = 0.35,
+                 noise_adapt_rate: float = 0.05, hangover_ms: int = 200,
+                 min_speech_ratio: float = 0.4):
+        """
+        Args:
+            energy_margin_db: Năng lượng phải cao hơn noise floor bao nhiêu dB
+            min_energy_db: Năng lượng tối thiểu tuyệt đối (dBFS) để coi là giọng nói
+            flatness_max: Spectral flatness tối đa của frame giọng nói (0-1)
+            zcr_max: Zero-crossing rate tối đa của frame giọng nói (0-1)
+            noise_adapt_rate: Tốc độ cập nhật noise floor trên frame không phải giọng nói
+            hangover_ms: Thời gian giữ trạng thái speech sau frame giọng nói cuối cùng
+            min_speech_ratio: Tỉ lệ sub-frame speech tối thiểu để chunk là speech
+        """
+        super().__init__(sample_rate, frame_ms)
+        self.energy_margin_db = energy_margin_db
+        self.min_energy_db = min_energy_db
+        self.flatness_max = flatness_max
+        self.zcr_max = zcr_max
+        self.noise_adapt_rate = noise_adapt_rate
+        self.hangover_frames = max(0, int(hangover_ms / frame_ms))
+        self.min_speech_ratio = min_speech_ratio
+
+        self._window = np.hanning(self.frame_len).astype(np.float32)
+        freqs = np.fft.rfftfreq(self.frame_len, d=1.0 / sample_rate)
+        self._band = (freqs >= 100) & (freqs <= 4000)
+        self.reset()
+
+    def reset(self):
+        self.noise_floor_db = None
+        self._hangover = 0
+
+    def process(self, samples: np.ndarray) -> Tuple[bool, float]:
+        frames = self._frames(samples)
+        n, length = frames.shape
+        eps = 1e-10
+
+        # Đặc trưng vector hoá trên tất cả sub-frame
+        energy = np.einsum("ij,ij->i", frames, frames) / length
+        energy_db = 10.0 * np.log10(energy + eps)
+        zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / length
+
+        if length == self.frame_len:
+            spectrum = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2
+            band = spectrum[:, self._band] + eps
+            flatness = np.exp(np.mean(np.log(band), axis=1)) / np.mean(band, axis=1)
+        else:
+            flatness = np.zeros(n, dtype=np.float32)
+
+        if self.noise_floor_db is None:
+            self.noise_floor_db = float(np.min(energy_db))
+
+        loud = (energy_db > self.noise_floor_db + self.energy_margin_db) & (energy_db > self.min_energy_db)
+        voiced = (flatness < self.flatness_max) & (zcr < self.zcr_max)
+        frame_speech = loud & voiced
+
+        # Noise floor và hangover là trạng thái tuần tự theo frame
+        speech_frames = 0
+        for i in range(n):
+            if frame_speech[i]:
+                self._hangover = self.hangover_frames
+                speech_frames += 1
+                continue
+            if self._hangover > 0:
+                self._hangover -= 1
+                speech_frames += 1
+            e = float(energy_db[i])
+            if e < self.noise_floor_db:
+                # Theo dõi nhanh khi nhiễu giảm
+                self.noise_floor_db = e
+            elif not self._hangover:
+                self.noise_floor_db += self.noise_adapt_rate * (e - self.noise_floor_db)
+
+        rms = float(np.sqrt(energy.mean()))
+        return speech_frames >= self.min_speech_ratio * n, rms
+
+
+VAD_ENGINES = {
+    RMSVADEngine.name: RMSVADEngine,
+    SpectralVADEngine.name: SpectralVADEngine,
+}
+
+
+def create_vad_engine(name: str, sample_rate: int = 48000, silence_threshold: float = 0.02) -> VADEngine:
+    """
+    Tạo VAD engine theo tên ("rms" hoặc "spectral")
+
+    Raises:
+        ValueError: Nếu tên engine không tồn tại
+    """
+    if name == RMSVADEngine.name:
+        return RMSVADEngine(sample_rate, threshold=silence_threshold)
+    if name not in VAD_ENGINES:
+        raise ValueError(f"Unknown VAD engine '{name}', available: {', '.join(VAD_ENGINES)}")
+    return VAD_ENGINES[name](sample_rate)
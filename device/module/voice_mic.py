@@ -13,12 +13,20 @@ import soundfile as sf
 import numpy as np
 
 from module.vad import VoiceActivityDetector
+from module.vad_engine import create_vad_engine
 from module.voice_speaker import VoiceSpeaker
+from module.audio_device import get_audio_device
+from module.debug_recorder import get_debug_recorder
 from config import SILENCE_THRESHOLD, SILENCE_DURATION, MIN_SPEECH_DURATION
 from log import setup_logger
 from config import BASE_DIR, MAX_AMP
 logger = setup_logger(__name__)
 
+try:
+    from config import VAD_ENGINE
+except ImportError:
+    VAD_ENGINE = "rms"  # "rms" hoặc "spectral"
+
 
 class VoiceStreamer:
     """Class để ghi âm và gửi âm thanh qua MQTT hoặc HTTP"""
@@ -42,30 +50,36 @@ class VoiceStreamer:
             sample_rate=sample_rate,
             silence_threshold=SILENCE_THRESHOLD,  # Điều chỉnh theo môi trường
             silence_duration=SILENCE_DURATION,
-            min_speech_duration=MIN_SPEECH_DURATION
+            min_speech_duration=MIN_SPEECH_DURATION,
+            engine=create_vad_engine(VAD_ENGINE, sample_rate, SILENCE_THRESHOLD)
         )
 
         # Callback functions
         self.on_speech_start = None
         self.on_speech_complete = None
         self.on_speech_data = None
+        self.on_speech_discarded = None
 
         print(f"🎤 VoiceStreamer initialized - Mic index: {self.mic_index}")
 
     def set_callbacks(self, on_speech_start: Callable = None,
                       on_speech_complete: Callable = None,
-                      on_speech_data: Callable = None):
+                      on_speech_data: Callable = None,
+                      on_speech_discarded: Callable = None):
         """
         Thiết lập callback functions
 
         Args:
             on_speech_start: Gọi khi bắt đầu phát hiện giọng nói
             on_speech_complete: Gọi khi hoàn tất thu âm (audio_data, duration)
-            on_speech_data: Gọi mỗi chunk âm thanh (audio_chunk, timestamp, status)
+            on_speech_data: Chunk sink cho streaming - gọi với mỗi đoạn âm thanh giọng nói
+                (audio_chunk int16, timestamp, status) ngay trong khi người dùng đang nói
+            on_speech_discarded: Gọi khi câu nói bị bỏ qua vì quá ngắn (duration)
         """
         self.on_speech_start = on_speech_start
         self.on_speech_complete = on_speech_complete
         self.on_speech_data = on_speech_data
+        self.on_speech_discarded = on_speech_discarded
 
     def start_listening(self):
         """Bắt đầu lắng nghe liên tục"""
@@ -88,21 +102,36 @@ class VoiceStreamer:
     def _listening_loop(self):
         """Vòng lặp lắng nghe liên tục"""
         stream = None
+        reader = None
+        audio_device = get_audio_device()
         try:
-            stream = sd.InputStream(
-                device=self.mic_index,
-                channels=1,
-                samplerate=self.sample_rate,
-                dtype='int16',
-                blocksize=self.chunk_samples
-            )
-            stream.start()
-            print("🎧 Đang lắng nghe... (nói gì đó để bắt đầu thu âm)")
+            if audio_device is not None and audio_device.sample_rate == self.sample_rate:
+                # Device dùng chung: chỉ đăng ký subscriber, không mở InputStream riêng
+                reader = audio_device.subscribe_reader("vad", self.chunk_samples)
+                print("🎧 Đang lắng nghe (shared audio device)... (nói gì đó để bắt đầu thu âm)")
+            else:
+                if audio_device is not None:
+                    logger.warning(f"⚠️ Shared audio device chạy {audio_device.sample_rate}Hz, "
+                                   f"VAD cần {self.sample_rate}Hz - mở InputStream riêng")
+                stream = sd.InputStream(
+                    device=self.mic_index,
+                    channels=1,
+                    samplerate=self.sample_rate,
+                    dtype='int16',
+                    blocksize=self.chunk_samples
+                )
+                stream.start()
+                print("🎧 Đang lắng nghe... (nói gì đó để bắt đầu thu âm)")
 
             while self.is_listening:
-                audio_chunk, overflowed = stream.read(self.chunk_samples)
-                if overflowed:
-                    print("⚠️ Audio buffer overflow!")
+                if reader is not None:
+                    audio_chunk = reader.read(timeout=0.5)
+                    if audio_chunk is None:
+                        continue
+                else:
+                    audio_chunk, overflowed = stream.read(self.chunk_samples)
+                    if overflowed:
+                        print("⚠️ Audio buffer overflow!")
 
                 if len(audio_chunk) > 0:
                     # Chuyển đổi sang float32 cho VAD và áp dụng chuẩn hóa biên độ
@@ -110,13 +139,18 @@ class VoiceStreamer:
 
                     # Xử lý VAD
                     vad_result = self.vad.process_audio_chunk(audio_float)
+                    action = vad_result['action']
 
                     # Gọi callbacks
-                    if self.on_speech_data:
-                        self.on_speech_data(audio_chunk, int(
+                    if action == 'speech_start' and self.on_speech_start:
+                        self.on_speech_start()
+
+                    captured = vad_result.get('captured')
+                    if captured is not None and self.on_speech_data:
+                        self.on_speech_data((captured * 32768.0).astype(np.int16), int(
                             time.time() * 1000), vad_result)
 
-                    if vad_result['action'] == 'speech_complete':
+                    if action == 'speech_complete':
                         if self.on_speech_complete:
                             # Chuyển đổi từ float32 về int16 để đảm bảo định dạng nhất quán với record_audio
                             audio_data = vad_result['audio_data']
@@ -124,27 +158,19 @@ class VoiceStreamer:
                                 audio_data * 32768.0).astype(np.int16).tobytes()
                             self.on_speech_complete(
                                 int16_audio, vad_result['duration'])
-                            save_dir = "debug"
-                            os.makedirs(save_dir, exist_ok=True)
-                            file_path = os.path.join(
-                                BASE_DIR, save_dir, f"audio_mic.wav")
-                            try:
-                                sf.write(
-                                    file_path, vad_result['audio_data'], self.sample_rate, subtype='PCM_16')
-                                logger.debug(
-                                    f"💾 Đã lưu file âm thanh: {file_path}")
-                            except Exception as e:
-                                logger.error(
-                                    f"❌ Lỗi khi lưu file âm thanh: {e}")
-                    elif vad_result['action'] == 'speaking' and not self.vad.is_speaking:
-                        if self.on_speech_start:
-                            self.on_speech_start()
+                            get_debug_recorder().record(
+                                "audio_mic", vad_result['audio_data'], self.sample_rate)
+                    elif action == 'speech_discarded':
+                        if self.on_speech_discarded:
+                            self.on_speech_discarded(vad_result['duration'])
 
         except Exception as e:
             print(f"❌ Lỗi lắng nghe: {e}")
             import traceback
             traceback.print_exc()
         finally:
+            if reader is not None:
+                audio_device.unsubscribe("vad")
             # ✅ Đảm bảo close stream để giải phóng USB mic device
             if stream is not None:
                 try:
@@ -2,23 +2,98 @@ import soundfile as sf
 import os
 import sounddevice as sd
 import numpy as np
-import tempfile
 from scipy import signal
 from container import container
 from log import setup_logger
 import queue
 import threading
+from module.audio_device import PRIORITY_TTS, get_audio_device
+from module.audio_registry import get_audio_registry
+from module.audio_cues import AudioCueCache
+from module.audio_utils import StreamResampler
 
 logger = setup_logger(__name__)
 
+try:
+    from config import AUDIO_CUE_DIR
+except ImportError:
+    from config import BASE_DIR
+    AUDIO_CUE_DIR = os.path.join(BASE_DIR, "audio")
+
+try:
+    from config import AUDIO_CUE_CACHE_DIR
+except ImportError:
+    AUDIO_CUE_CACHE_DIR = None  # Ví dụ: os.path.join(BASE_DIR, "cache", "cues")
+
 
 def find_device_index_by_name(keyword, kind='output'):
-    devices = sd.query_devices()
-    for i, dev in enumerate(devices):
-        if keyword.lower() in dev['name'].lower():
-            if kind == 'output' and dev['max_output_channels'] > 0:
-                return i
-    return None
+    # Tra cứu trong registry (đã dò sẵn, chỉ làm mới khi có hotplug)
+    return get_audio_registry().find(keyword, kind=kind)
+
+
+def get_speaker(speaker_name: str = "USB Audio Device") -> "VoiceSpeaker":
+    """VoiceSpeaker dùng chung trong container, tạo mới nếu chưa có"""
+    try:
+        speaker = container.get("speaker")
+    except Exception:
+        speaker = None
+    return speaker if speaker is not None else VoiceSpeaker(speaker_name)
+
+
+class PCMOutput:
+    """
+    Đầu ra PCM int16 mono kiểu streaming: mỗi đoạn được resample (có trạng thái)
+    về sample rate của loa và phát ngay, không chờ toàn bộ audio.
+
+    Dùng device chung nếu có (nguồn phát "tts" trong bộ trộn), nếu không thì
+    mở OutputStream blocking-write riêng.
+    """
+
+    SOURCE_NAME = "tts"
+
+    def __init__(self, speaker: "VoiceSpeaker", sample_rate: int, priority: int = PRIORITY_TTS):
+        self._device = get_audio_device()
+        self.output_rate = self._device.sample_rate if self._device is not None else speaker.cues.sample_rate
+        self._resampler = StreamResampler(sample_rate, self.output_rate)
+        self._priority = priority
+        self._done = None
+        self._stream = None
+        if self._device is None:
+            self._stream = sd.OutputStream(device=speaker.speaker_index, samplerate=self.output_rate,
+                                           channels=1, dtype='int16')
+            self._stream.start()
+
+    def write(self, pcm: np.ndarray):
+        """Ghi một đoạn PCM int16 mono (block khi buffer của OutputStream đầy)"""
+        self._emit(self._resampler.resample(pcm))
+
+    def _emit(self, pcm: np.ndarray):
+        if pcm.shape[0] == 0:
+            return
+        if self._device is not None:
+            self._done = self._device.play(pcm, self.output_rate, priority=self._priority,
+                                           source=self.SOURCE_NAME)
+        else:
+            self._stream.write(pcm.reshape(-1, 1))
+
+    def close(self):
+        """Phát nốt phần còn lại và chờ phát xong"""
+        self._emit(self._resampler.flush())
+        if self._device is not None:
+            if self._done is not None:
+                self._done.wait()
+        else:
+            # stop() chờ phát hết dữ liệu đã ghi
+            self._stream.stop()
+            self._stream.close()
+
+    def abort(self):
+        """Dừng ngay, bỏ phần chưa phát"""
+        if self._device is not None:
+            self._device.stop_source(self.SOURCE_NAME)
+        else:
+            self._stream.abort()
+            self._stream.close()
 
 
 class VoiceSpeaker:
@@ -37,14 +112,83 @@ class VoiceSpeaker:
         self._stream_blocksize = None
         self._stream_lock = threading.Lock()
 
-    def play_file(self, file_path: str):
+        # Cue cảnh báo / phản hồi: decode + resample một lần về sample rate gốc của loa
+        audio_device = get_audio_device()
+        if audio_device is not None:
+            cue_rate = audio_device.sample_rate
+        else:
+            device_info = get_audio_registry().device(self.speaker_index) or {}
+            cue_rate = int(device_info.get('default_samplerate') or 48000)
+        self.cues = AudioCueCache(AUDIO_CUE_DIR, cue_rate, cache_dir=AUDIO_CUE_CACHE_DIR)
+        self.cues.load()
+        self._cue_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=16)
+        self._cue_thread = threading.Thread(target=self._cue_worker, name="cue-player", daemon=True)
+        self._cue_thread.start()
+
+    def play_cue(self, name: str, priority: int = PRIORITY_TTS) -> bool:
+        """
+        Phát cue đã nạp sẵn, không block
+
+        Args:
+            name: Tên cue ('processing', 'stop', 'warning/<audio_file>') hoặc đường dẫn .wav trong thư mục audio
+            priority: Độ ưu tiên khi dùng device chung (PRIORITY_*)
+
+        Returns:
+            False nếu không có cue này
+        """
+        cue = self.cues.get(name)
+        if cue is None:
+            logger.warning(f"⚠️ Audio cue not found: {name}")
+            return False
+        audio_device = get_audio_device()
+        if audio_device is not None:
+            # Buffer đã ở sample rate của device: chỉ xếp vào bộ trộn, phát ở block kế tiếp
+            audio_device.play(cue, self.cues.sample_rate, priority=priority)
+            return True
+        try:
+            self._cue_queue.put_nowait((name, cue))
+        except queue.Full:
+            logger.warning(f"⚠️ Cue queue full, dropping cue: {name}")
+            return False
+        return True
+
+    def _cue_worker(self):
+        """Phát lần lượt các cue trên thread riêng để caller không phải chờ"""
+        while True:
+            name, cue = self._cue_queue.get()
+            try:
+                sd.play(cue, samplerate=self.cues.sample_rate, device=self.speaker_index, latency='low')
+                sd.wait()
+            except Exception as e:
+                logger.error(f"⚠️ Lỗi khi phát cue {name}: {e}", exc_info=True)
+
+    def play_file(self, file_path: str, priority: int = PRIORITY_TTS):
         """Phát âm thanh từ file (wav, flac, ogg, mp3 nếu có soundfile hỗ trợ)."""
         if not os.path.exists(file_path):
             logger.error(f"❌ File không tồn tại: {file_path}", exc_info=True)
             return
 
+        cue = self.cues.get(file_path)
+        if cue is not None:
+            # File trong thư mục audio: dùng buffer đã nạp sẵn, không decode / resample lại
+            try:
+                audio_device = get_audio_device()
+                if audio_device is not None:
+                    audio_device.play(cue, self.cues.sample_rate, priority=priority).wait()
+                else:
+                    sd.play(cue, samplerate=self.cues.sample_rate, device=self.speaker_index)
+                    sd.wait()
+            except Exception as e:
+                logger.error(f"⚠️ Lỗi khi phát file: {e}", exc_info=True)
+            return
+
         try:
             data, samplerate = sf.read(file_path, dtype='float32')
+            audio_device = get_audio_device()
+            if audio_device is not None:
+                # Device dùng chung: trộn theo độ ưu tiên, không mở stream riêng
+                audio_device.play(data, samplerate, priority=priority).wait()
+                return
             # Đảm bảo samplerate phù hợp với thiết bị
             if samplerate != 44100:
                 logger.info(f"Chuyển đổi sample rate từ {samplerate} sang 44100Hz")
@@ -59,7 +203,7 @@ class VoiceSpeaker:
         except Exception as e:
             logger.error(f"⚠️ Lỗi khi phát file: {e}", exc_info=True)
 
-    def play_audio_data(self, audio_data: bytes, sample_rate: int = 44100):
+    def play_audio_data(self, audio_data: bytes, sample_rate: int = 44100, priority: int = PRIORITY_TTS):
         """
         Phát âm thanh từ dữ liệu raw
         """
@@ -69,22 +213,27 @@ class VoiceSpeaker:
             else:
                 audio_array = audio_data
 
-            # Tạo file WAV tạm với soundfile
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                # Lưu với soundfile để có header WAV đúng
-                sf.write(temp_file.name, audio_array,
-                        sample_rate, subtype='PCM_16')
-                temp_file.flush()
+            if audio_array.dtype != np.int16:
+                audio_array = (np.clip(audio_array, -1.0, 1.0) * 32767.0).astype(np.int16)
+            if audio_array.ndim == 2:
+                audio_array = audio_array[:, 0]
 
-                self.play_file(temp_file.name)
-
-                # Cleanup
-                os.unlink(temp_file.name)
+            # Phát trực tiếp từ bộ nhớ: resample từng chunk, chunk đầu được phát
+            # trong khi các chunk sau còn đang resample
+            output = self.open_pcm_stream(sample_rate, priority=priority)
+            chunk_samples = max(1, sample_rate // 10)
+            for start in range(0, audio_array.shape[0], chunk_samples):
+                output.write(audio_array[start:start + chunk_samples])
+            output.close()
 
             logger.info(
                 f"🔊 Phát âm thanh thành công - {len(audio_data)} bytes với sample rate {sample_rate}")
         except Exception as e:
             logger.error(f"❌ Lỗi phát âm thanh: {e}", exc_info=True)
+
+    def open_pcm_stream(self, sample_rate: int, priority: int = PRIORITY_TTS) -> "PCMOutput":
+        """Mở đầu ra PCM streaming (ghi dần từng đoạn, phát ngay) ở sample rate gốc của loa"""
+        return PCMOutput(self, sample_rate, priority=priority)
     
     def play_audio_array(self, audio_array: np.ndarray, sample_rate: int = 44100, channels: int = 1):
         """
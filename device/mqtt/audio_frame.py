@@ -0,0 +1,207 @@
+"""
+Binary Audio Framing
+====================
+
+Định dạng frame nhị phân cho audio qua MQTT trên các topic `.../audio/bin`.
+
+Thay vì bọc mỗi chunk PCM trong JSON + base64 (tăng ~33% dung lượng và tốn
+json.dumps/json.loads + b64 cho mỗi chunk), mỗi message gồm một header cố định
+theo sau là raw payload bytes:
+
+    offset  size  field
+    0       2     magic (b"AF")
+    2       1     version
+    3       1     codec (CODEC_*)
+    4       8     stream id (uint64)
+    12      4     chunk index (uint32)
+    16      4     total chunks (uint32, 0 = chưa biết)
+    20      4     sample rate (uint32)
+    24      2     flags (FLAG_*)
+    26      ...   payload
+
+Tất cả các trường dùng network byte order (big-endian).
+"""
+
+import struct
+import time
+from typing import NamedTuple, Tuple
+
+AUDIO_FRAME_MAGIC = b"AF"
+AUDIO_FRAME_VERSION = 1
+AUDIO_FRAME_HEADER = struct.Struct("!2sBBQIIIH")
+
+# Codec ids
+CODEC_PCM16LE = 0
+CODEC_OPUS = 1
+
+CODEC_NAMES = {
+    CODEC_PCM16LE: "pcm16le",
+    CODEC_OPUS: "opus",
+}
+CODEC_IDS = {name: codec for codec, name in CODEC_NAMES.items()}
+
+# Flags
+FLAG_LAST = 0x0001
+FLAG_ABORTED = 0x0002  # Stream bị huỷ (ví dụ câu nói quá ngắn), server bỏ dữ liệu đã nhận
+
+BINARY_TOPIC_SUFFIX = "/bin"
+
+
+class AudioFrameHeader(NamedTuple):
+    """Header đã giải mã của một binary audio frame"""
+    codec: int
+    stream_id: int
+    chunk_index: int
+    total_chunks: int
+    sample_rate: int
+    flags: int
+
+    @property
+    def is_last(self) -> bool:
+        return bool(self.flags & FLAG_LAST)
+
+    @property
+    def is_aborted(self) -> bool:
+        return bool(self.flags & FLAG_ABORTED)
+
+    @property
+    def format(self) -> str:
+        return CODEC_NAMES.get(self.codec, "unknown")
+
+
+def binary_topic(topic: str) -> str:
+    """Trả về topic nhị phân tương ứng (`.../audio` -> `.../audio/bin`)"""
+    return topic + BINARY_TOPIC_SUFFIX
+
+
+def is_binary_topic(topic: str) -> bool:
+    """Kiểm tra topic có mang binary audio frame hay không"""
+    return topic.endswith(BINARY_TOPIC_SUFFIX)
+
+
+def new_stream_id() -> int:
+    """Tạo stream id dạng số (timestamp ms) cho binary frame"""
+    return int(time.time() * 1000)
+
+
+def pack_audio_frame(stream_id: int, chunk_index: int, total_chunks: int,
+                     sample_rate: int, payload: bytes, codec: int = CODEC_PCM16LE,
+                     is_last: bool = False, is_aborted: bool = False) -> bytes:
+    """
+    Đóng gói một chunk audio thành binary frame
+
+    Args:
+        stream_id: ID số của stream
+        chunk_index: Thứ tự chunk trong stream
+        total_chunks: Tổng số chunk (0 nếu chưa biết)
+        sample_rate: Tần số lấy mẫu của audio
+        payload: Dữ liệu audio thô
+        codec: Codec của payload (CODEC_*)
+        is_last: Đánh dấu chunk cuối cùng
+        is_aborted: Đánh dấu stream bị huỷ
+
+    Returns:
+        bytes: Header + payload
+    """
+    header = AUDIO_FRAME_HEADER.pack(
+        AUDIO_FRAME_MAGIC,
+        AUDIO_FRAME_VERSION,
+        codec,
+        stream_id,
+        chunk_index,
+        total_chunks,
+        sample_rate,
+        (FLAG_LAST if is_last else 0) | (FLAG_ABORTED if is_aborted else 0),
+    )
+    return header + payload
+
+
+def unpack_audio_frame(data: bytes) -> Tuple[AudioFrameHeader, memoryview]:
+    """
+    Giải mã binary frame
+
+    Args:
+        data: Payload MQTT nhận được
+
+    Returns:
+        (header, payload) - payload là memoryview, không copy dữ liệu
+
+    Raises:
+        ValueError: Nếu frame quá ngắn, sai magic hoặc sai version
+    """
+    if len(data) < AUDIO_FRAME_HEADER.size:
+        raise ValueError(f"Audio frame too short: {len(data)} bytes")
+
+    magic, version, codec, stream_id, chunk_index, total_chunks, sample_rate, flags = \
+        AUDIO_FRAME_HEADER.unpack_from(data)
+    if magic != AUDIO_FRAME_MAGIC:
+        raise ValueError(f"Bad audio frame magic: {magic!r}")
+    if version != AUDIO_FRAME_VERSION:
+        raise ValueError(f"Unsupported audio frame version: {version}")
+
+    header = AudioFrameHeader(codec, stream_id, chunk_index, total_chunks, sample_rate, flags)
+    return header, memoryview(data)[AUDIO_FRAME_HEADER.size:]
+
+
+# ----- MQTT v5: metadata trong properties, payload là audio thô -----
+#
+# Content Type: "audio/<codec>;rate=<sample rate>"
+# User Property: s = stream id, i = chunk index, n = total chunks, f = flags
+
+AUDIO_CONTENT_TYPE_PREFIX = "audio/"
+
+
+def audio_content_type(codec: int, sample_rate: int) -> str:
+    return f"{AUDIO_CONTENT_TYPE_PREFIX}{CODEC_NAMES[codec]};rate={sample_rate}"
+
+
+def audio_frame_properties(stream_id: int, chunk_index: int, total_chunks: int, sample_rate: int,
+                           codec: int = CODEC_PCM16LE, is_last: bool = False, is_aborted: bool = False):
+    """
+    Properties PUBLISH (MQTT v5) thay cho header của binary frame
+
+    Returns:
+        paho `Properties` với ContentType và UserProperty
+    """
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+
+    flags = (FLAG_LAST if is_last else 0) | (FLAG_ABORTED if is_aborted else 0)
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = audio_content_type(codec, sample_rate)
+    properties.UserProperty = [("s", str(stream_id)), ("i", str(chunk_index)),
+                               ("n", str(total_chunks)), ("f", str(flags))]
+    return properties
+
+
+def is_audio_properties(properties) -> bool:
+    """Message v5 có mang audio thô (metadata trong properties) không"""
+    content_type = getattr(properties, "ContentType", None)
+    return bool(content_type) and content_type.startswith(AUDIO_CONTENT_TYPE_PREFIX)
+
+
+def header_from_properties(properties) -> AudioFrameHeader:
+    """
+    Giải mã metadata audio từ properties MQTT v5
+
+    Raises:
+        ValueError: Nếu thiếu / sai content type hoặc user property
+    """
+    content_type = getattr(properties, "ContentType", "") or ""
+    if not content_type.startswith(AUDIO_CONTENT_TYPE_PREFIX):
+        raise ValueError(f"Not an audio content type: {content_type!r}")
+    codec_name, _, params = content_type[len(AUDIO_CONTENT_TYPE_PREFIX):].partition(";")
+    if codec_name not in CODEC_IDS:
+        raise ValueError(f"Unknown audio codec: {codec_name!r}")
+    sample_rate = 0
+    for param in params.split(";"):
+        key, _, value = param.strip().partition("=")
+        if key == "rate":
+            sample_rate = int(value)
+
+    values = dict(getattr(properties, "UserProperty", None) or [])
+    try:
+        return AudioFrameHeader(CODEC_IDS[codec_name], int(values["s"]), int(values["i"]),
+                                int(values.get("n", 0)), sample_rate, int(values.get("f", 0)))
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Bad audio user properties: {values}") from e
@@ -0,0 +1,216 @@
+"""
+Video Quality Controller
+========================
+
+Điều chỉnh độ phân giải / FPS của video call theo chất lượng đường truyền.
+
+Đọc `pc.getStats()` định kỳ (remote-inbound-rtp từ RTCP receiver report: RTT,
+tỉ lệ mất gói), rồi bước lên / xuống theo một "ladder" có hysteresis:
+
+    640x480@30  ->  480x360@15  ->  320x240@10  ->  audio-only
+
+Trên đường GPRS / 4G yếu, video được hạ xuống trước để audio không bị nghẽn.
+
+Quyết định chỉ dựa trên mất gói và RTT. Bitrate mục tiêu của encoder không
+được dùng: aiortc không đưa nó vào getStats(), và khi phía nhận không gửi REMB
+(chỉ transport-cc) nó đứng yên ở giá trị mặc định 500 kbps, không phản ánh
+đường truyền. Bitrate video thực gửi (từ outbound-rtp) chỉ để theo dõi.
+"""
+
+import asyncio
+import time
+from typing import List, NamedTuple, Optional
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class QualityStep(NamedTuple):
+    """Một bậc chất lượng video"""
+    name: str
+    width: int
+    height: int
+    fps: int
+    video_enabled: bool = True
+
+
+QUALITY_LADDER: List[QualityStep] = [
+    QualityStep("high", 640, 480, 30),
+    QualityStep("medium", 480, 360, 15),
+    QualityStep("low", 320, 240, 10),
+    # Chỉ gửi frame đen rất nhỏ 1 fps để giữ track, nhường băng thông cho audio
+    QualityStep("audio_only", 160, 120, 1, video_enabled=False),
+]
+
+
+class LinkSample(NamedTuple):
+    """Số liệu đường truyền tại một thời điểm"""
+    rtt: Optional[float]                # giây
+    fraction_lost: Optional[float]      # 0-1
+    outgoing_bitrate: Optional[int]     # bps video thực gửi (chỉ để theo dõi)
+
+
+class VideoQualityController:
+    """Bộ điều khiển bậc chất lượng video cho một RTCPeerConnection"""
+
+    def __init__(self, pc, video_track, ladder: List[QualityStep] = QUALITY_LADDER,
+                 interval: float = 2.0,
+                 loss_high: float = 0.08, loss_low: float = 0.02,
+                 rtt_high: float = 0.6, rtt_low: float = 0.3,
+                 degrade_samples: int = 2, upgrade_samples: int = 5,
+                 min_hold: float = 10.0):
+        """
+        Args:
+            pc: RTCPeerConnection
+            video_track: Track có `set_quality(step)` (CameraVideoTrack)
+            ladder: Các bậc chất lượng, từ cao xuống thấp
+            interval: Chu kỳ đọc stats (giây)
+            loss_high / loss_low: Ngưỡng mất gói để hạ / cho phép nâng bậc
+            rtt_high / rtt_low: Ngưỡng RTT (giây) để hạ / cho phép nâng bậc
+            degrade_samples: Số mẫu xấu liên tiếp trước khi hạ bậc
+            upgrade_samples: Số mẫu tốt liên tiếp trước khi nâng bậc
+            min_hold: Thời gian tối thiểu giữ một bậc trước khi nâng lại (giây)
+        """
+        self.pc = pc
+        self.video_track = video_track
+        self.ladder = ladder
+        self.interval = interval
+        self.loss_high = loss_high
+        self.loss_low = loss_low
+        self.rtt_high = rtt_high
+        self.rtt_low = rtt_low
+        self.degrade_samples = degrade_samples
+        self.upgrade_samples = upgrade_samples
+        self.min_hold = min_hold
+
+        self.step_index = 0
+        self._bad_count = 0
+        self._good_count = 0
+        self._last_change = time.monotonic()
+        self._last_sample: Optional[LinkSample] = None
+        self._last_bytes_sent = None
+        self._last_bytes_time = None
+        self._step_changes = 0
+        self._task = None
+
+    @property
+    def current_step(self) -> QualityStep:
+        return self.ladder[self.step_index]
+
+    def start(self):
+        """Bắt đầu vòng đọc stats (gọi trong event loop của WebRTC)"""
+        if self._task is None:
+            self._apply(self.step_index)
+            self._task = asyncio.ensure_future(self._run())
+            logger.info(f"📶 Video quality controller started at {self.current_step.name}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                if self.pc.connectionState != "connected":
+                    continue
+                try:
+                    sample = await self._sample()
+                except Exception as e:
+                    logger.debug(f"Could not read WebRTC stats: {e}")
+                    continue
+                self._last_sample = sample
+                self._evaluate(sample)
+        except asyncio.CancelledError:
+            pass
+
+    async def _sample(self) -> LinkSample:
+        report = await self.pc.getStats()
+        rtt = None
+        fraction_lost = None
+        bytes_sent = None
+        for stats in report.values():
+            if stats.type == "remote-inbound-rtp":
+                # Lấy giá trị xấu nhất giữa audio và video: cùng một đường truyền
+                if stats.roundTripTime is not None:
+                    rtt = max(rtt or 0.0, stats.roundTripTime)
+                if stats.fractionLost is not None:
+                    # aiortc trả nguyên giá trị 8 bit của RTCP receiver report (0-255, đơn vị 1/256)
+                    fraction_lost = max(fraction_lost or 0.0, stats.fractionLost / 256.0)
+            elif stats.type == "outbound-rtp" and stats.kind == "video":
+                bytes_sent = stats.bytesSent
+
+        now = time.monotonic()
+        outgoing = None
+        if bytes_sent is not None:
+            if self._last_bytes_sent is not None and now > self._last_bytes_time:
+                outgoing = int((bytes_sent - self._last_bytes_sent) * 8 / (now - self._last_bytes_time))
+            self._last_bytes_sent = bytes_sent
+            self._last_bytes_time = now
+
+        return LinkSample(rtt, fraction_lost, outgoing)
+
+    def _is_bad(self, sample: LinkSample) -> bool:
+        if sample.fraction_lost is not None and sample.fraction_lost > self.loss_high:
+            return True
+        return sample.rtt is not None and sample.rtt > self.rtt_high
+
+    def _is_good(self, sample: LinkSample) -> bool:
+        if self.step_index == 0:
+            return False
+        # Chưa có receiver report thì chưa đủ căn cứ để nâng bậc
+        if sample.fraction_lost is None or sample.rtt is None:
+            return False
+        return sample.fraction_lost <= self.loss_low and sample.rtt <= self.rtt_low
+
+    def _evaluate(self, sample: LinkSample):
+        if self._is_bad(sample):
+            self._bad_count += 1
+            self._good_count = 0
+        elif self._is_good(sample):
+            self._good_count += 1
+            self._bad_count = 0
+        else:
+            self._bad_count = 0
+            self._good_count = 0
+
+        if self._bad_count >= self.degrade_samples and self.step_index < len(self.ladder) - 1:
+            self._change(self.step_index + 1, sample)
+        elif (self._good_count >= self.upgrade_samples
+              and time.monotonic() - self._last_change >= self.min_hold):
+            self._change(self.step_index - 1, sample)
+
+    def _change(self, index: int, sample: LinkSample):
+        old = self.current_step
+        self._apply(index)
+        self._bad_count = 0
+        self._good_count = 0
+        self._last_change = time.monotonic()
+        self._step_changes += 1
+        arrow = "⬇️" if index > self.ladder.index(old) else "⬆️"
+        logger.info(f"{arrow} Video quality {old.name} -> {self.current_step.name} "
+                    f"(rtt={sample.rtt}, loss={sample.fraction_lost}, outgoing={sample.outgoing_bitrate})")
+
+    def _apply(self, index: int):
+        self.step_index = index
+        try:
+            self.video_track.set_quality(self.current_step)
+        except Exception as e:
+            logger.error(f"Could not apply video quality {self.current_step.name}: {e}")
+
+    def get_stats(self) -> dict:
+        """Metric của bộ điều khiển, gồm bậc chất lượng hiện tại"""
+        sample = self._last_sample
+        return {
+            'step_index': self.step_index,
+            'step_name': self.current_step.name,
+            'width': self.current_step.width,
+            'height': self.current_step.height,
+            'fps': self.current_step.fps,
+            'step_changes': self._step_changes,
+            'rtt': sample.rtt if sample else None,
+            'fraction_lost': sample.fraction_lost if sample else None,
+            'outgoing_bitrate': sample.outgoing_bitrate if sample else None,
+        }
@@ -5,40 +5,142 @@ MQTT Client
 
 import json
 import time
+from typing import Optional
 import paho.mqtt.client as mqtt
 from config import DEVICE_ID, BROKER_TRANSPORT, BROKER_HOST, BROKER_PORT, BROKER_USE_TLS, BROKER_WS_PATH, MQTT_USER, MQTT_PASS, TOPICS
 from .handlers import MessageHandler
+from .audio_frame import binary_topic, is_binary_topic, is_audio_properties, header_from_properties, pack_audio_frame
+from .dispatcher import MessageDispatcher
+from .publisher import PublishPipeline, CLASS_SAFETY, CLASS_TELEMETRY, CLASS_BULK
+from .outbox import MQTTOutbox, MQTT_OUTBOX_DIR
+from .connection import ConnectionManager
+from .router import PayloadLogSampler
 from container import container
 from log import setup_logger
 logger = setup_logger(__name__)
 
+try:
+    from config import MQTT_PUBLISH_MAX_BYTES
+except ImportError:
+    MQTT_PUBLISH_MAX_BYTES = 2 * 1024 * 1024
+
+try:
+    from config import MQTT_PUBLISH_WINDOW
+except ImportError:
+    MQTT_PUBLISH_WINDOW = 16
+
+try:
+    from config import MQTT_OUTBOX_ENABLED
+except ImportError:
+    MQTT_OUTBOX_ENABLED = True
+
+try:
+    from config import MQTT_SESSION_EXPIRY
+except ImportError:
+    MQTT_SESSION_EXPIRY = 3600  # Giây, chỉ dùng với MQTT v5
+
+try:
+    from config import MQTT_PROTOCOL
+except ImportError:
+    MQTT_PROTOCOL = "3.1.1"  # "3.1.1" hoặc "5" (topic alias, metadata audio trong properties)
+
+MQTT_V5 = str(MQTT_PROTOCOL).lower().lstrip("v") in ("5", "5.0")
+
+# Lớp message được ghi vào outbox khi mất kết nối (signaling / audio hết giá trị sau khi mất mạng)
+OUTBOX_CLASSES = (CLASS_SAFETY, CLASS_TELEMETRY)
+
+
+def _publish_topic_classes() -> dict:
+    """Lớp ưu tiên của các topic device publish (WebRTC signaling được nhận ra theo topic)"""
+    classes = {}
+    for key, topic_class in (("device_obstacle", CLASS_SAFETY), ("device_gps", CLASS_TELEMETRY),
+                             ("device_ping", CLASS_TELEMETRY), ("device_stt", CLASS_BULK)):
+        topic = TOPICS.get(key)
+        if topic:
+            classes[topic] = topic_class
+            if topic_class == CLASS_BULK:
+                classes[binary_topic(topic)] = topic_class
+    return classes
+
+
+def _alias_topics() -> list:
+    """Topic publish tần suất cao được dùng topic alias (MQTT v5)"""
+    stt = TOPICS.get("device_stt")
+    return [
+        f"device/{DEVICE_ID}/webrtc/candidate",
+        TOPICS.get("device_gps"),
+        stt,
+        binary_topic(stt) if stt else None,
+    ]
+
 
 class MQTTClient:
     """MQTT Client wrapper with connection management"""
 
     def __init__(self):
         self.client = None
+        self.v5 = MQTT_V5
+        self.topic_aliases = None
+        # Log payload ở DEBUG, lấy mẫu - không format SDP nhiều KB cho mỗi message
+        self._payload_log = PayloadLogSampler(logger)
         self._setup_client()
+        # Hàng đợi publish theo ưu tiên: safety > signaling > telemetry > bulk
+        self.publisher = PublishPipeline(
+            self.client,
+            topic_classes=_publish_topic_classes(),
+            coalesce_topics=[t for t in (TOPICS.get("device_gps"),) if t],
+            max_bytes=MQTT_PUBLISH_MAX_BYTES,
+            window=MQTT_PUBLISH_WINDOW,
+            topic_aliases=self.topic_aliases,
+        )
+        self.client.on_publish = self.publisher.on_publish
+        # Outbox trên đĩa cho GPS / cảnh báo / SOS khi mất kết nối, drain lại khi kết nối
+        self.outbox = None
+        if MQTT_OUTBOX_ENABLED and MQTT_OUTBOX_DIR:
+            try:
+                self.outbox = MQTTOutbox(coalesce_topics=[t for t in (TOPICS.get("device_gps"),) if t])
+                self.outbox.start_drain(self._send_outbox_record)
+            except OSError as e:
+                logger.warning(f"⚠️ MQTT outbox disabled: {e}")
         # Pass MQTT client to handler for WebRTC signaling
         self.handler = MessageHandler(mqtt_client=self)
+        # Xử lý message trên worker queue theo lớp topic, không chiếm network thread của paho
+        self.dispatcher = MessageDispatcher(self.handler.handle_message, self.handler.handle_binary_message)
+        # Network thread + reconnect có backoff; subscribe một gói cho mọi topic của handler
+        self.connection = ConnectionManager(
+            self.client, BROKER_HOST, BROKER_PORT, keepalive=120,
+            subscriptions=[(topic, qos) for topic, qos, _ in self.handler.subscriptions],
+            session_expiry=MQTT_SESSION_EXPIRY,
+            on_connected=self._on_connected,
+            on_disconnected=self._on_disconnected,
+        )
         container.register("mqtt_client", self)
 
     def _setup_client(self):
         """Setup MQTT client with configuration"""
-        self.client = mqtt.Client(
-            client_id=f"device-{DEVICE_ID}",
-            clean_session=False,
-            protocol=mqtt.MQTTv311,
-            transport=BROKER_TRANSPORT
-        )
+        if self.v5:
+            # v5: session giữ qua Session Expiry Interval (ConnectionManager), không dùng clean_session
+            from .topic_alias import TopicAliasTable
+            self.client = mqtt.Client(
+                client_id=f"device-{DEVICE_ID}",
+                protocol=mqtt.MQTTv5,
+                transport=BROKER_TRANSPORT
+            )
+            self.topic_aliases = TopicAliasTable(_alias_topics())
+        else:
+            self.client = mqtt.Client(
+                client_id=f"device-{DEVICE_ID}",
+                clean_session=False,
+                protocol=mqtt.MQTTv311,
+                transport=BROKER_TRANSPORT
+            )
         
         # Tăng giới hạn kích thước tin nhắn và buffer
         self.client._max_inflight_messages = 100  # Tăng số lượng tin nhắn đang chờ xử lý
-        self.client._max_queued_messages = 0      # Không giới hạn hàng đợi
+        self.client._max_queued_messages = 0      # Hàng đợi paho được PublishPipeline giới hạn (window)
         self.client.max_inflight_messages_set(100)  # Tăng giới hạn tin nhắn đang bay
 
-        # Set callbacks
-        self.client.on_connect = self._on_connect
+        # Set callbacks (on_connect / on_disconnect do ConnectionManager quản lý)
         self.client.on_message = self._on_message
 
         # Authentication
@@ -52,33 +154,47 @@ class MQTTClient:
             self.client.tls_set()
 
 
-    def _on_connect(self, client, userdata, flags, rc, properties=None):
-        """Callback when MQTT connection is established"""
-        logger.info(f"✅ Connected to MQTT broker with result code: {rc}")
+    def _on_connected(self, session_present: bool):
+        """Callback when MQTT connection is established (đã subscribe)"""
+        if self.topic_aliases is not None:
+            self.topic_aliases.configure(self.connection.connack_properties)
+        self.publisher.set_connected(True)
+        if self.outbox:
+            self.outbox.set_online(True)
 
-        # Subscribe to server topics
-        client.subscribe(TOPICS['server_tts'], qos=1)
-        client.subscribe(TOPICS['server_command'], qos=1)
-        client.subscribe(TOPICS['server_pong'], qos=2)
-        
-        # Subscribe to WebRTC signaling from mobile
-        client.subscribe(TOPICS['mobile_offer'], qos=1)
-        client.subscribe(TOPICS['mobile_answer'], qos=1)
-        client.subscribe(TOPICS['mobile_candidate'], qos=0)
-        
-        logger.info("📡 Subscribed to all topics including WebRTC signaling")
+    def _on_disconnected(self, rc):
+        """Callback when MQTT connection is lost"""
+        self.publisher.set_connected(False)
+        if self.outbox:
+            self.outbox.set_online(False)
 
     def _on_message(self, client, userdata, msg):
         """Callback when MQTT message is received"""
         try:
+            # Binary audio frame: bỏ qua bước decode UTF-8/JSON
+            if is_binary_topic(msg.topic):
+                self.dispatcher.dispatch(msg.topic, msg.payload, binary=True)
+                return
+
+            # MQTT v5: audio thô, metadata trong ContentType / UserProperty
+            properties = getattr(msg, "properties", None)
+            if self.v5 and is_audio_properties(properties):
+                try:
+                    header = header_from_properties(properties)
+                except ValueError as e:
+                    logger.error(f"Invalid audio properties on {msg.topic}: {e}")
+                    return
+                frame = pack_audio_frame(header.stream_id, header.chunk_index, header.total_chunks,
+                                         header.sample_rate, msg.payload, codec=header.codec,
+                                         is_last=header.is_last, is_aborted=header.is_aborted)
+                self.dispatcher.dispatch(binary_topic(msg.topic), frame, binary=True)
+                return
+
             # Xử lý an toàn khi giải mã payload
             try:
                 payload_str = msg.payload.decode('utf-8')
                 payload = json.loads(payload_str)
-                if msg.topic.endswith("/audio"):
-                    logger.info(f"Received message on {msg.topic}")
-                else:
-                    logger.info(f"Received message on {msg.topic}: {payload}")
+                self._payload_log.log(msg.topic, payload)
             except UnicodeDecodeError:
                 # Xử lý trường hợp dữ liệu nhị phân không phải UTF-8
                 print(f"Warning: Received binary data on topic {msg.topic}, skipping JSON parsing")
@@ -87,29 +203,74 @@ class MQTTClient:
                 # Xử lý trường hợp chuỗi không phải JSON hợp lệ
                 print(f"Error decoding JSON: {je}, payload length: {len(msg.payload)}")
                 print(f"Payload: {msg.payload}")
+                return
                 
-            # Xử lý message
-            self.handler.handle_message(msg.topic, payload)
+            # Xử lý message trên worker của lớp topic (signaling / audio / commands)
+            self.dispatcher.dispatch(msg.topic, payload)
         except Exception as e:
             import traceback
             print(f"Error processing message: {e}")
             traceback.print_exc()
 
     def connect(self):
-        """Connect to MQTT broker"""
-        self.client.connect(BROKER_HOST, BROKER_PORT, keepalive=120)
-        self.client.loop_start()
+        """Connect to MQTT broker (không block: kết nối / reconnect trên network thread)"""
+        self.connection.start()
 
     def disconnect(self):
         """Disconnect from MQTT broker"""
-        self.client.loop_stop()
-        self.client.disconnect()
+        self.connection.stop()
+        logger.info(f"📊 Connection stats: {self.connection.get_stats()}")
+        self.dispatcher.stop()
+        self.publisher.stop()
+        logger.info(f"📊 Dispatcher stats: {self.dispatcher.get_stats()}")
+        logger.info(f"📊 Publisher stats: {self.publisher.get_stats()}")
+        if self.topic_aliases is not None:
+            logger.info(f"📊 Topic alias stats: {self.topic_aliases.get_stats()}")
+        if self.outbox:
+            self.outbox.close()
+            logger.info(f"📊 Outbox stats: {self.outbox.get_stats()}")
+
+    def publish(self, topic: str, payload: dict, qos: int = 0, retain: bool = False,
+                topic_class: Optional[str] = None, properties=None) -> bool:
+        """
+        Publish message to MQTT topic (qua hàng đợi ưu tiên, không block)
+
+        Returns:
+            False nếu message bị bỏ vì hàng đợi publish đã đầy
+        """
+        topic_class = topic_class or self.publisher.classify(topic, payload)
+        data = json.dumps(payload).encode('utf-8')
+        if self._should_persist(topic_class):
+            self.outbox.append(topic, data, qos=qos, retain=retain, topic_class=topic_class,
+                               durable=topic_class == CLASS_SAFETY)
+            return True
+        return self.publisher.submit(topic, data, qos=qos, retain=retain, topic_class=topic_class,
+                                     properties=properties)
+
+    def publish_bytes(self, topic: str, data: bytes, qos: int = 0, retain: bool = False,
+                      topic_class: Optional[str] = None, properties=None) -> bool:
+        """Publish raw bytes (binary audio frame, hoặc audio thô + properties với MQTT v5) lên MQTT topic"""
+        topic_class = topic_class or self.publisher.classify(topic)
+        return self.publisher.submit(topic, data, qos=qos, retain=retain, topic_class=topic_class,
+                                     properties=properties)
+
+    def _should_persist(self, topic_class: str) -> bool:
+        """
+        Ghi vào outbox khi mất kết nối; telemetry cũng đi qua outbox khi outbox
+        còn message chưa gửi để giữ thứ tự. Safety khi có kết nối luôn gửi ngay.
+        """
+        if self.outbox is None or topic_class not in OUTBOX_CLASSES:
+            return False
+        if not self.publisher.connected:
+            return True
+        return topic_class == CLASS_TELEMETRY and self.outbox.pending > 0
 
-    def publish(self, topic: str, payload: dict, qos: int = 0, retain: bool = False):
-        """Publish message to MQTT topic"""
-        self.client.publish(topic, json.dumps(payload), qos=qos, retain=retain)
+    def _send_outbox_record(self, record, callback) -> bool:
+        """Drain outbox: đưa record vào pipeline publish, callback khi PUBACK / thất bại"""
+        return self.publisher.submit(record.topic, record.data, qos=record.qos, retain=record.retain,
+                                     topic_class=record.topic_class, callback=callback)
 
     def loop(self, timeout: float = 0.1):
-        """Process MQTT messages"""
+        """Process MQTT messages (chỉ dùng khi không gọi `connect()`: network thread đã chạy loop)"""
         self.client.loop(timeout=timeout)
 
@@ -0,0 +1,233 @@
+"""
+Connection Manager
+==================
+
+Quản lý kết nối MQTT trên network thread của paho (`connect_async` +
+`loop_start`), để chỉ một thread ghi vào socket:
+
+- Kết nối không block caller: `start()` trả về ngay, thread của paho tự connect
+- Mất kết nối / connect lỗi: paho tự reconnect, thời gian chờ mỗi lần được
+  đặt qua `reconnect_delay_set` theo exponential backoff có jitter
+  (full jitter: chờ ngẫu nhiên trong [0, min(max_delay, base * 2^n)])
+- Subscribe tất cả topic trong một gói SUBSCRIBE; bỏ qua nếu broker báo
+  session còn (session present) và đã subscribe trong process này
+- MQTT v5: Session Expiry Interval để broker giữ session (subscription,
+  message QoS1) qua khoảng mất sóng
+- Metric: thời gian connect (tới CONNACK), số lần reconnect, tổng thời gian
+  mất kết nối
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class ConnectionManager:
+    """Kết nối + reconnect có backoff cho một paho `mqtt.Client` (network thread của paho)"""
+
+    def __init__(self, client: mqtt.Client, host: str, port: int, keepalive: int = 120,
+                 subscriptions: Iterable[Tuple[str, int]] = (), session_expiry: Optional[int] = None,
+                 base_delay: float = 0.5, max_delay: float = 60.0,
+                 on_connected: Optional[Callable[[bool], None]] = None,
+                 on_disconnected: Optional[Callable[[int], None]] = None):
+        """
+        Args:
+            client: paho client (callback on_connect / on_disconnect do manager gán)
+            host, port, keepalive: Thông số broker
+            subscriptions: Danh sách (topic, qos) subscribe sau khi kết nối
+            session_expiry: Session Expiry Interval (giây), chỉ dùng với MQTT v5
+            base_delay, max_delay: Tham số backoff (giây)
+            on_connected: callback(session_present) sau khi CONNACK thành công và đã subscribe
+            on_disconnected: callback(rc) khi mất kết nối
+        """
+        self.client = client
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.subscriptions: List[Tuple[str, int]] = list(subscriptions)
+        self.session_expiry = session_expiry
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_connected = on_connected
+        self.on_disconnected = on_disconnected
+        self.is_v5 = getattr(client, "_protocol", None) == mqtt.MQTTv5
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_connect_fail = self._on_connect_fail
+
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._started = False
+        self._subscribed = False
+        self._attempt_started: Optional[float] = None
+        self._disconnected_since: Optional[float] = None
+        self._failures = 0  # Số lần thất bại liên tiếp (cho backoff)
+
+        self.attempts = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.sessions_resumed = 0
+        self.last_connect_latency: Optional[float] = None
+        self._connect_latency_total = 0.0
+        self._connect_latency_max = 0.0
+        self._disconnected_total = 0.0
+        self._disconnected_max = 0.0
+        self.last_disconnect_rc: Optional[int] = None
+        self.connack_properties = None  # MQTT v5: TopicAliasMaximum, ReceiveMaximum, ...
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        """Bắt đầu kết nối (không block): connect_async + network thread của paho"""
+        if self._started:
+            return
+        self._started = True
+        self._stop.clear()
+        self._disconnected_since = time.monotonic()
+        self._schedule_retry(first=True)
+        self.attempts += 1
+        self._attempt_started = time.monotonic()
+        if self.is_v5:
+            from paho.mqtt.packettypes import PacketTypes
+            from paho.mqtt.properties import Properties
+            properties = None
+            if self.session_expiry:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.SessionExpiryInterval = self.session_expiry
+            self.client.connect_async(self.host, self.port, keepalive=self.keepalive,
+                                      clean_start=False, properties=properties)
+        else:
+            self.client.connect_async(self.host, self.port, keepalive=self.keepalive)
+        # Chỉ thread của paho ghi vào socket: publish()/subscribe() từ thread khác chỉ xếp gói
+        # vào hàng đợi của paho và đánh thức thread này
+        self.client.loop_start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        self.client.loop_stop()
+        self._started = False
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        return self._connected.wait(timeout)
+
+    def _backoff(self) -> float:
+        """Full jitter: random trong [0, min(max_delay, base * 2^failures)]"""
+        cap = min(self.max_delay, self.base_delay * (2 ** min(self._failures, 16)))
+        return random.uniform(0, cap)
+
+    def _schedule_retry(self, first: bool = False):
+        """
+        Đặt thời gian chờ trước lần reconnect kế tiếp của paho.
+
+        paho tự reconnect trong thread của nó với delay nhân đôi tới max_delay;
+        đặt min = max = giá trị jitter để mỗi lần chờ đúng bằng giá trị đó.
+        Gọi từ on_disconnect / on_connect_fail, trước khi paho chờ.
+        """
+        delay = self.base_delay if first else max(self._backoff(), 0.1)
+        self.client.reconnect_delay_set(min_delay=delay, max_delay=delay)
+        if not first:
+            self.attempts += 1
+            # Lần thử kế tiếp bắt đầu sau `delay` (paho không có callback trước khi connect)
+            self._attempt_started = time.monotonic() + delay
+        return delay
+
+    def _on_connect_fail(self, client, userdata):
+        """paho không mở được kết nối TCP / TLS tới broker"""
+        if self._stop.is_set():
+            return
+        self.failures += 1
+        self._failures += 1
+        delay = self._schedule_retry()
+        logger.warning(f"⚠️ MQTT connect to {self.host}:{self.port} failed - retry in {delay:.1f}s")
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        rc = getattr(rc, "value", rc)  # v5: ReasonCodes
+        if rc != 0:
+            # Broker đóng kết nối sau CONNACK lỗi; on_disconnect đặt backoff cho lần thử sau
+            self.failures += 1
+            self._failures += 1
+            logger.error(f"❌ MQTT broker refused connection (rc={rc})")
+            return
+        now = time.monotonic()
+        self.connack_properties = properties
+        session_present = bool(flags.get("session present")) if isinstance(flags, dict) else bool(getattr(flags, "session_present", False))
+
+        if self._attempt_started is not None:
+            latency = now - self._attempt_started
+            self.last_connect_latency = latency
+            self._connect_latency_total += latency
+            self._connect_latency_max = max(self._connect_latency_max, latency)
+        if self._disconnected_since is not None:
+            outage = now - self._disconnected_since
+            if self.connects:
+                self._disconnected_total += outage
+                self._disconnected_max = max(self._disconnected_max, outage)
+            self._disconnected_since = None
+        if self.connects:
+            self.reconnects += 1
+        self.connects += 1
+        self._failures = 0
+
+        if session_present and self._subscribed:
+            # Broker còn giữ session: subscription vẫn còn hiệu lực
+            self.sessions_resumed += 1
+        elif self.subscriptions:
+            client.subscribe(self.subscriptions)
+            self._subscribed = True
+
+        latency_ms = (self.last_connect_latency or 0) * 1000
+        logger.info(f"✅ Connected to MQTT broker in {latency_ms:.0f} ms "
+                    f"(session present: {session_present}, reconnects: {self.reconnects})")
+        self._connected.set()
+        if self.on_connected:
+            self.on_connected(session_present)
+
+    def _on_disconnect(self, client, userdata, *args):
+        # v3: (rc); v5: (rc, properties) / paho 2.x: (flags, rc, properties)
+        rc = next((a for a in args if isinstance(a, int) or hasattr(a, "value")), None)
+        rc = getattr(rc, "value", rc)
+        self.last_disconnect_rc = rc
+        was_connected = self.connected
+        self._connected.clear()
+        if self._stop.is_set():
+            return
+        delay = self._schedule_retry()
+        if was_connected:
+            self._disconnected_since = time.monotonic()
+            logger.warning(f"⚠️ Disconnected from MQTT broker (rc: {rc}) - reconnect in {delay:.1f}s")
+            if self.on_disconnected:
+                self.on_disconnected(rc)
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        current_outage = now - self._disconnected_since if self._disconnected_since is not None else 0.0
+        return {
+            'connected': self.connected,
+            'attempts': self.attempts,
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'sessions_resumed': self.sessions_resumed,
+            'connect_latency_last_ms': self.last_connect_latency * 1000 if self.last_connect_latency is not None else None,
+            'connect_latency_avg_ms': self._connect_latency_total / max(self.connects, 1) * 1000,
+            'connect_latency_max_ms': self._connect_latency_max * 1000,
+            'disconnected_total_s': self._disconnected_total + (current_outage if self.connects else 0.0),
+            'disconnected_max_s': max(self._disconnected_max, current_outage if self.connects else 0.0),
+            'disconnected_current_s': current_outage,
+            'last_disconnect_rc': self.last_disconnect_rc,
+        }
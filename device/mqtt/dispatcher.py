@@ -0,0 +1,188 @@
+"""
+Message Dispatcher
+==================
+
+Tách xử lý message khỏi network thread của paho.
+
+Network thread chỉ giải mã JSON rồi đưa message vào hàng đợi của lớp topic
+tương ứng; mỗi lớp có hàng đợi giới hạn và worker thread riêng:
+
+- signaling: WebRTC offer / answer / candidate - ưu tiên cao nhất
+- audio: TTS audio từ server (JSON / binary)
+- commands: lệnh từ server, pong, ...
+
+Worker audio / commands nhường cho signaling: trước mỗi message, nếu hàng đợi
+signaling còn message thì chờ (có giới hạn) cho nó xử lý xong.
+Hàng đợi đầy thì bỏ message mới (không bao giờ block network thread).
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+CLASS_SIGNALING = "signaling"
+CLASS_AUDIO = "audio"
+CLASS_COMMANDS = "commands"
+
+DEFAULT_QUEUE_SIZES = {
+    CLASS_SIGNALING: 128,
+    CLASS_AUDIO: 512,
+    CLASS_COMMANDS: 64,
+}
+
+
+def classify_topic(topic: str) -> str:
+    """Lớp xử lý của một topic"""
+    if "webrtc/" in topic:
+        return CLASS_SIGNALING
+    if topic.endswith("/audio") or topic.endswith("/audio/bin"):
+        return CLASS_AUDIO
+    return CLASS_COMMANDS
+
+
+class _WorkerQueue:
+    """Hàng đợi giới hạn + worker thread của một lớp topic, kèm metric"""
+
+    def __init__(self, name: str, maxsize: int, handle: Callable, yield_to: Optional["_WorkerQueue"] = None,
+                 max_yield: float = 0.05):
+        self.name = name
+        self.handle = handle
+        self.yield_to = yield_to
+        self.max_yield = max_yield
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name=f"mqtt-{name}", daemon=True)
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._handle_total = 0.0
+        self._handle_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, item: tuple) -> bool:
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def stop(self):
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            enqueued_at, item = entry
+
+            if self.yield_to is not None:
+                # Nhường signaling: chờ hàng đợi signaling trống (tối đa max_yield)
+                deadline = time.monotonic() + self.max_yield
+                while self.yield_to.depth > 0 and time.monotonic() < deadline:
+                    time.sleep(0.001)
+
+            started = time.monotonic()
+            wait = started - enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            try:
+                self.handle(*item)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Error handling {self.name} message: {e}", exc_info=True)
+            elapsed = time.monotonic() - started
+            self._handle_total += elapsed
+            self._handle_max = max(self._handle_max, elapsed)
+            self.processed += 1
+
+    def get_stats(self) -> dict:
+        n = max(self.processed, 1)
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'wait_avg_ms': self._wait_total / n * 1000,
+            'wait_max_ms': self._wait_max * 1000,
+            'handle_avg_ms': self._handle_total / n * 1000,
+            'handle_max_ms': self._handle_max * 1000,
+        }
+
+
+class MessageDispatcher:
+    """Định tuyến message theo lớp topic tới các worker queue riêng"""
+
+    def __init__(self, handle_message: Callable[[str, dict], None],
+                 handle_binary_message: Callable[[str, bytes], None],
+                 queue_sizes: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            handle_message: Handler cho message JSON (topic, payload)
+            handle_binary_message: Handler cho message binary (topic, data)
+            queue_sizes: Kích thước hàng đợi theo lớp (mặc định DEFAULT_QUEUE_SIZES)
+        """
+        self._handle_message = handle_message
+        self._handle_binary_message = handle_binary_message
+        sizes = dict(DEFAULT_QUEUE_SIZES)
+        sizes.update(queue_sizes or {})
+
+        signaling = _WorkerQueue(CLASS_SIGNALING, sizes[CLASS_SIGNALING], self._handle)
+        self._queues = {
+            CLASS_SIGNALING: signaling,
+            CLASS_AUDIO: _WorkerQueue(CLASS_AUDIO, sizes[CLASS_AUDIO], self._handle, yield_to=signaling),
+            CLASS_COMMANDS: _WorkerQueue(CLASS_COMMANDS, sizes[CLASS_COMMANDS], self._handle, yield_to=signaling),
+        }
+        for worker in self._queues.values():
+            worker.start()
+
+    def dispatch(self, topic: str, payload, binary: bool = False) -> bool:
+        """
+        Đưa message vào hàng đợi của lớp topic (gọi trên network thread, không block)
+
+        Returns:
+            False nếu hàng đợi đầy và message bị bỏ
+        """
+        topic_class = classify_topic(topic)
+        if not self._queues[topic_class].put((topic, payload, binary)):
+            logger.warning(f"⚠️ {topic_class} queue full, dropping message on {topic}")
+            return False
+        return True
+
+    def _handle(self, topic: str, payload, binary: bool):
+        if binary:
+            self._handle_binary_message(topic, payload)
+        else:
+            self._handle_message(topic, payload)
+
+    def stop(self):
+        for worker in self._queues.values():
+            worker.stop()
+
+    def get_stats(self) -> dict:
+        return {name: worker.get_stats() for name, worker in self._queues.items()}
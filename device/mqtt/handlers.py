@@ -11,13 +11,24 @@ import platform
 import numpy as np
 import time
 import threading
+import queue
 import soundfile as sf
 import asyncio
 import av
 import sounddevice as sd
-from config import BASE_DIR, DEVICE_ID
-from module.voice_speaker import VoiceSpeaker
+from config import BASE_DIR, DEVICE_ID, TOPICS
+from module.voice_speaker import VoiceSpeaker, get_speaker
+from module.audio_registry import get_audio_registry
+from module.audio_codec import OpusDecoder
+from module.audio_playback import PlaybackEngine
+from module.audio_device import PRIORITY_CALL, get_audio_device
+from module.audio_dsp import AudioDSPChain
+from module.debug_recorder import get_debug_recorder
+from module.tts_player import StreamingTTSPlayer
 from .gprs_connection import GPRSConnection
+from .audio_frame import binary_topic, unpack_audio_frame
+from .router import TopicRouter
+from .stream_reassembler import StreamReassembler
 from container import container
 
 from log import setup_logger
@@ -26,6 +37,11 @@ logger = setup_logger(__name__)
 
 from .webrtc_manager import WebRTCManager
 
+try:
+    from config import TTS_STREAMING_PLAYBACK
+except ImportError:
+    TTS_STREAMING_PLAYBACK = True
+
 
 class SuppressALSAErrors:
     """Context manager to suppress ALSA error messages"""
@@ -47,14 +63,42 @@ class SuppressALSAErrors:
         sys.stderr = self.stderr
 
    
-audio_stream_buffers = {}
 # Thời gian tối đa (giây) để chờ đợi tất cả các chunks
 STREAM_TIMEOUT = 15  # Tăng thời gian timeout lên 15 giây
+# Giới hạn bộ nhớ cho việc ghép stream audio từ server
+try:
+    from config import AUDIO_REASSEMBLY_MAX_BYTES
+except ImportError:
+    AUDIO_REASSEMBLY_MAX_BYTES = 8 * 1024 * 1024
+try:
+    from config import AUDIO_REASSEMBLY_MAX_STREAMS
+except ImportError:
+    AUDIO_REASSEMBLY_MAX_STREAMS = 16
 class MessageHandler:
     """Handle incoming MQTT messages"""
 
     def __init__(self, mqtt_client=None):
-        self.speaker = VoiceSpeaker("USB Audio Device")
+        self.speaker = get_speaker("USB Audio Device")
+
+        # Topic được subscribe và handler tương ứng - bảng định tuyến dựng một lần
+        self.subscriptions = [
+            (TOPICS['server_tts'], 1, self.handle_stt_audio),
+            (binary_topic(TOPICS['server_tts']), 1, self.handle_stt_audio_frame),
+            (TOPICS['server_command'], 1, self.handle_command),
+            (TOPICS['server_pong'], 2, self.handle_pong),
+            # WebRTC signaling from mobile
+            (TOPICS['mobile_offer'], 1, self.handle_webrtc_offer),
+            (TOPICS['mobile_answer'], 1, self.handle_webrtc_answer),
+            (TOPICS['mobile_candidate'], 0, self.handle_webrtc_candidate),
+        ]
+        self.router = TopicRouter()
+        for topic, _, handler in self.subscriptions:
+            self.router.add(topic, handler)
+        # Phát TTS từ server ngay khi đủ prefetch, không chờ nhận hết stream
+        # (cùng giới hạn bộ nhớ / timeout với StreamReassembler bên dưới)
+        self.tts_player = StreamingTTSPlayer(self.speaker, stream_timeout=STREAM_TIMEOUT,
+                                             max_bytes=AUDIO_REASSEMBLY_MAX_BYTES,
+                                             max_streams=AUDIO_REASSEMBLY_MAX_STREAMS) if TTS_STREAMING_PLAYBACK else None
         self.gprs = GPRSConnection()
         self._gprs_ready = False
         self.mqtt_client = mqtt_client
@@ -73,7 +117,7 @@ class MessageHandler:
         
         # PyAudio state for WebRTC playback (tương tự audio_handler.py)
         self._pyaudio_out = None
-        self._pyaudio_out_stream = None
+        self._playback: PlaybackEngine = None
         self._audio_frame_count = 0
         
         # Playback config (có thể lấy từ config.py nếu có)
@@ -86,9 +130,15 @@ class MessageHandler:
         self.PLAYBACK_COMPRESSOR_ENABLED = False
         self.PLAYBACK_COMPRESSOR_DRIVE = 2.0
         
-        # Khởi tạo luồng kiểm tra timeout cho audio streams
-        self.cleanup_thread = threading.Thread(target=self._cleanup_old_streams, daemon=True)
-        self.cleanup_thread.start()
+        # Ghép stream audio từ server (giới hạn bộ nhớ, timeout theo heap);
+        # stream hoàn tất được phát trên playback worker riêng
+        self._anon_stream_seq = 0
+        self._playback_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=8)
+        self.reassembler = StreamReassembler(self._enqueue_playback, timeout=STREAM_TIMEOUT,
+                                             max_bytes=AUDIO_REASSEMBLY_MAX_BYTES,
+                                             max_streams=AUDIO_REASSEMBLY_MAX_STREAMS)
+        self.playback_thread = threading.Thread(target=self._playback_worker, name="tts-playback", daemon=True)
+        self.playback_thread.start()
     
     def set_voice_mqtt(self, voice_mqtt):
         """Set VoiceMQTT instance để có thể pause/resume khi có cuộc gọi"""
@@ -106,8 +156,10 @@ class MessageHandler:
                 logger.info("⏸️ VAD paused for SOS call")
                 
                 # ✅ Đợi một chút để đảm bảo sounddevice đã close stream
-                await asyncio.sleep(0.5)  # 500ms để device được release
-                logger.info("✅ Device should be released now")
+                # (device dùng chung không bị đóng, không cần chờ)
+                if get_audio_device() is None:
+                    await asyncio.sleep(0.5)  # 500ms để device được release
+                    logger.info("✅ Device should be released now")
             except Exception as e:
                 logger.error(f"Error pausing VAD: {e}")
         
@@ -117,21 +169,17 @@ class MessageHandler:
 
     def handle_message(self, topic: str, payload: dict):
         """Route messages to appropriate handlers"""
-        if not topic.endswith("/audio"):
-            logger.info(f"Handling {topic}")
-
-        if topic.endswith("/audio"):
-            self.handle_stt_audio(payload)
-        elif topic.endswith("/command"):
-            self.handle_command(payload)
-        elif topic.endswith("webrtc/offer"):
-            self.handle_webrtc_offer(payload)
-        elif topic.endswith("webrtc/candidate"):
-            self.handle_webrtc_candidate(payload)
-        elif topic.endswith("webrtc/answer"):
-            self.handle_webrtc_answer(payload)
-        else:
+        if not self.router.route(topic, payload):
             logger.warning(f"No handler for {topic}")
+
+    def handle_binary_message(self, topic: str, data: bytes):
+        """Route binary messages (topic `.../audio/bin`)"""
+        if not self.router.route(topic, data):
+            logger.warning(f"No binary handler for {topic}")
+
+    def handle_pong(self, payload: dict):
+        """PONG từ server"""
+        logger.debug(f"PONG from server: {payload}")
     
     def handle_webrtc_offer(self, payload):
         """Xử lý WebRTC offer từ mobile"""
@@ -149,44 +197,48 @@ class MessageHandler:
             
             logger.info("📞 Handling WebRTC offer from mobile")
             
-            # Chạy trong thread riêng để không block MQTT
-            thread = threading.Thread(
-                target=self._run_async_offer_handler,
-                args=(sdp, offer_type),
-                daemon=True
-            )
-            thread.start()
+            # Chạy trên event loop của WebRTC, không chờ: worker signaling rảnh cho candidate / hangup
+            self._submit_webrtc(self._handle_offer_after_vad_pause(sdp, offer_type), "offer")
             
         except Exception as e:
             logger.error(f"❌ Error handling WebRTC offer: {e}", exc_info=True)
     
-    def _run_async_offer_handler(self, sdp: str, offer_type: str):
-        """Chạy async handler trong event loop riêng"""
-        try:
-            # ⚠️ CRITICAL: Pause VAD TRƯỚC KHI mở WebRTC mic
-            if self.voice_mqtt:
-                try:
-                    self.voice_mqtt.pause_vad()
-                    logger.info("⏸️ VAD paused BEFORE WebRTC initialization")
-                    
-                    # ✅ Đợi một chút để đảm bảo sounddevice đã close stream
-                    time.sleep(0.5)  # 500ms để device được release
+    async def _handle_offer_after_vad_pause(self, sdp: str, offer_type: str):
+        """Tạm dừng VAD rồi xử lý offer (chạy trên event loop của WebRTC)"""
+        # ⚠️ CRITICAL: Pause VAD TRƯỚC KHI mở WebRTC mic
+        if self.voice_mqtt:
+            try:
+                # stop_listening() join thread VAD: chạy trong executor để không chặn event loop
+                await asyncio.get_running_loop().run_in_executor(None, self.voice_mqtt.pause_vad)
+                logger.info("⏸️ VAD paused BEFORE WebRTC initialization")
+                
+                # ✅ Đợi một chút để đảm bảo sounddevice đã close stream
+                # (device dùng chung không bị đóng, không cần chờ)
+                if get_audio_device() is None:
+                    await asyncio.sleep(0.5)  # 500ms để device được release
                     logger.info("✅ Device should be released now")
-                except Exception as e:
-                    logger.error(f"Error pausing VAD: {e}")
-            
-            # Sử dụng event loop riêng của WebRTC Manager
-            future = self.webrtc.run_async(self.webrtc.handle_offer(sdp, offer_type))
-            
-            # Đợi kết quả (với timeout để tránh block vĩnh viễn)
-            if future:
-                try:
-                    future.result(timeout=30)  # Timeout 30 giây
-                except Exception as e:
-                    logger.error(f"❌ Error waiting for offer handler: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"❌ Error in async offer handler: {e}", exc_info=True)
+            except Exception as e:
+                logger.error(f"Error pausing VAD: {e}")
+        
+        await self.webrtc.handle_offer(sdp, offer_type)
+
+    def _submit_webrtc(self, coro, action: str):
+        """
+        Đưa coroutine lên event loop của WebRTC và trả về ngay; lỗi được log khi coroutine
+        kết thúc. Coroutine chạy theo thứ tự được gửi (offer trước candidate theo sau nó).
+        """
+        future = self.webrtc.run_async(coro)
+        if not hasattr(future, "add_done_callback"):
+            return  # run_async fallback đã chạy xong coroutine
 
+        def _done(f):
+            if f.cancelled():
+                return
+            error = f.exception()
+            if error is not None:
+                logger.error(f"❌ Error in WebRTC {action} handler: {error}", exc_info=error)
+
+        future.add_done_callback(_done)
     
     def handle_webrtc_candidate(self, payload):
         """Xử lý ICE candidate từ mobile"""
@@ -195,32 +247,12 @@ class MessageHandler:
             return
         
         try:
-            # Chạy async trong thread riêng
-            thread = threading.Thread(
-                target=self._run_async_candidate_handler,
-                args=(payload,),
-                daemon=True
-            )
-            thread.start()
+            # Candidate đến trước khi có peer connection được WebRTCManager buffer lại
+            self._submit_webrtc(self.webrtc.handle_ice_candidate(payload), "candidate")
             
         except Exception as e:
             logger.error(f"❌ Error handling ICE candidate: {e}")
     
-    def _run_async_candidate_handler(self, candidate_data: dict):
-        """Chạy async candidate handler"""
-        try:
-            # Sử dụng event loop riêng của WebRTC Manager
-            future = self.webrtc.run_async(self.webrtc.handle_ice_candidate(candidate_data))
-            
-            # Đợi kết quả (với timeout ngắn)
-            if future:
-                try:
-                    future.result(timeout=5)  # Timeout 5 giây
-                except Exception as e:
-                    logger.error(f"❌ Error waiting for candidate handler: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"❌ Error in async candidate handler: {e}", exc_info=True)
-    
     def handle_webrtc_answer(self, payload):
         """Xử lý WebRTC answer từ mobile khi device initiate call"""
         if not self.webrtc:
@@ -237,78 +269,54 @@ class MessageHandler:
             
             logger.info("📥 Handling WebRTC answer from mobile")
             
-            # Chạy trong thread riêng để không block MQTT
-            thread = threading.Thread(
-                target=self._run_async_answer_handler,
-                args=(sdp, answer_type),
-                daemon=True
-            )
-            thread.start()
+            self._submit_webrtc(self.webrtc.handle_answer(sdp, answer_type), "answer")
             
         except Exception as e:
             logger.error(f"❌ Error handling WebRTC answer: {e}", exc_info=True)
     
-    def _run_async_answer_handler(self, sdp: str, answer_type: str):
-        """Chạy async answer handler trong event loop riêng"""
-        try:
-            # Sử dụng event loop riêng của WebRTC Manager
-            future = self.webrtc.run_async(self.webrtc.handle_answer(sdp, answer_type))
-            
-            # Đợi kết quả (với timeout để tránh block vĩnh viễn)
-            if future:
-                try:
-                    future.result(timeout=30)  # Timeout 30 giây
-                except Exception as e:
-                    logger.error(f"❌ Error waiting for answer handler: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"❌ Error in async answer handler: {e}", exc_info=True)
-    
     async def _handle_incoming_audio(self, track):
         """Callback khi nhận audio track từ mobile - phát ra loa sử dụng PyAudio (tương tự audio_handler.py)"""
         try:
             logger.info(f"🎧 Receiving audio from mobile: {track.id}")
             
-            # Import PyAudio
-            try:
-                import pyaudio
-            except ImportError:
-                logger.warning("PyAudio not installed - falling back to VoiceSpeaker")
-                await self._handle_incoming_audio_fallback(track)
-                return
+            # Device dùng chung: audio cuộc gọi là một nguồn phát trong bộ trộn của AudioDeviceManager
+            audio_device = get_audio_device()
+            output_rate = audio_device.sample_rate if audio_device is not None else self.PLAYBACK_OUTPUT_RATE
+
+            if audio_device is None:
+                # Import PyAudio
+                try:
+                    import pyaudio
+                except ImportError:
+                    logger.warning("PyAudio not installed - falling back to VoiceSpeaker")
+                    await self._handle_incoming_audio_fallback(track)
+                    return
 
-            # Initialize PyAudio nếu chưa có
-            if self._pyaudio_out is None:
-                with SuppressALSAErrors():
-                    self._pyaudio_out = pyaudio.PyAudio()
+                # Initialize PyAudio nếu chưa có
+                if self._pyaudio_out is None:
+                    with SuppressALSAErrors():
+                        self._pyaudio_out = pyaudio.PyAudio()
 
             current_cfg = (None, None)  # (rate, channels)
+            dsp = AudioDSPChain(
+                frame_size=960,
+                gain=float(self.PLAYBACK_GAIN),
+                auto_gain=self.PLAYBACK_AUTO_GAIN,
+                target_rms=float(self.PLAYBACK_TARGET_RMS),
+                max_agc_gain=float(self.PLAYBACK_MAX_GAIN),
+                max_total_gain=float(self.PLAYBACK_MAX_GAIN_TOTAL),
+                compressor_drive=float(self.PLAYBACK_COMPRESSOR_DRIVE) if self.PLAYBACK_COMPRESSOR_ENABLED else 0.0,
+            )
             resampler = None
             resample_cfg = (None, None)  # (rate, channels)
             
             # 🔊 Jetson Nano: Tìm USB Audio Device (card 3) cho playback
             output_device_index = None
-            if platform.system() == "Linux":
-                with SuppressALSAErrors():
-                    try:
-                        info = self._pyaudio_out.get_host_api_info_by_index(0)
-                        numdevices = info.get('deviceCount', 0)
-                        for i in range(numdevices):
-                            try:
-                                device_info = self._pyaudio_out.get_device_info_by_host_api_device_index(0, i)
-                                name = device_info.get('name', '')
-                                max_out = device_info.get('maxOutputChannels', 0)
-                                
-                                # Tìm USB Audio Device hoặc hw:3,0
-                                if (max_out > 0 and 
-                                    ('USB Audio Device' in name or 'hw:3,0' in name)):
-                                    output_device_index = i
-                                    logger.info(f"🔊 Found USB speaker device: {name} (index={i})")
-                                    break
-                            except Exception:
-                                # Bỏ qua các device có vấn đề
-                                continue
-                    except Exception as e:
-                        logger.warning(f"Could not enumerate audio devices: {e}")
+            if audio_device is None and platform.system() == "Linux":
+                # Tra cứu trong registry đã dò sẵn - không enumerate lại mỗi track
+                output_device_index = get_audio_registry().find(("USB Audio Device", "hw:3,0"), kind='output')
+                if output_device_index is not None:
+                    logger.info(f"🔊 Found USB speaker device (index={output_device_index})")
             
             try:
                 while True:
@@ -327,14 +335,14 @@ class MessageHandler:
                     out_channels = 1  # ✅ FORCE MONO thay vì: 1 if in_channels == 1 else 2
 
                     # Tạo resampler nếu config thay đổi
-                    if resampler is None or resample_cfg != (self.PLAYBACK_OUTPUT_RATE, out_channels):
+                    if resampler is None or resample_cfg != (output_rate, out_channels):
                         layout = "mono" if out_channels == 1 else "stereo"
                         try:
                             resampler = av.audio.resampler.AudioResampler(
-                                format="s16", layout=layout, rate=self.PLAYBACK_OUTPUT_RATE
+                                format="s16", layout=layout, rate=output_rate
                             )
-                            resample_cfg = (self.PLAYBACK_OUTPUT_RATE, out_channels)
-                            logger.info(f"🎛️ Resampler configured -> rate={self.PLAYBACK_OUTPUT_RATE}, channels={out_channels}")
+                            resample_cfg = (output_rate, out_channels)
+                            logger.info(f"🎛️ Resampler configured -> rate={output_rate}, channels={out_channels}")
                         except Exception as e:
                             logger.warning(f"Failed to create resampler, using raw frames: {e}")
                             resampler = None
@@ -358,11 +366,11 @@ class MessageHandler:
                                         pcm_arr = arr.T.reshape(-1)
                                 chunks.append(pcm_arr)
                             pcm = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int16)
-                            rate = self.PLAYBACK_OUTPUT_RATE
+                            rate = output_rate
                             channels = out_channels
                         else:
                             # Fallback: dùng thuộc tính frame gốc
-                            rate = getattr(frame, "sample_rate", self.PLAYBACK_OUTPUT_RATE) or self.PLAYBACK_OUTPUT_RATE
+                            rate = getattr(frame, "sample_rate", output_rate) or output_rate
                             arr = frame.to_ndarray()
                             if arr.dtype == np.float32 or arr.dtype == np.float64:
                                 arr = np.clip(arr, -1.0, 1.0)
@@ -390,67 +398,30 @@ class MessageHandler:
                         continue
 
                     # Áp dụng gain: base gain + optional auto gain control (AGC), sau đó soft limiter
-                    applied_gain = float(self.PLAYBACK_GAIN)
-                    if self.PLAYBACK_AUTO_GAIN:
-                        rms = float(np.sqrt(np.mean(pcm.astype(np.float32) ** 2)) + 1e-6)
-                        if rms > 200.0:  # ngưỡng im lặng
-                            agc_gain = float(self.PLAYBACK_TARGET_RMS) / rms
-                            if agc_gain < 1.0:
-                                agc_gain = 1.0
-                            agc_gain = min(agc_gain, float(self.PLAYBACK_MAX_GAIN))
-                            applied_gain = min(applied_gain * agc_gain, float(self.PLAYBACK_MAX_GAIN_TOTAL))
-                    
-                    if applied_gain != 1.0 or self.PLAYBACK_COMPRESSOR_ENABLED:
-                        # Chuẩn hóa về float32 [-1, 1]
-                        x = pcm.astype(np.float32) / 32768.0
-                        # Preamp
-                        if applied_gain != 1.0:
-                            x = x * applied_gain
-                        # Soft limiter / compressor bằng tanh
-                        if self.PLAYBACK_COMPRESSOR_ENABLED:
-                            drive = float(self.PLAYBACK_COMPRESSOR_DRIVE)
-                            if drive > 0.0:
-                                x = np.tanh(drive * x) / np.tanh(drive)
-                        # Clip an toàn và chuyển về int16
-                        x = np.clip(x, -1.0, 1.0)
-                        amplified = (x * 32767.0).astype(np.int16)
-                        pcm_bytes = amplified.tobytes()
-                    else:
-                        pcm_bytes = pcm.tobytes()
-
-                    # Mở lại stream nếu config thay đổi
-                    if current_cfg != (rate, channels) or self._pyaudio_out_stream is None:
-                        try:
-                            if self._pyaudio_out_stream is not None:
-                                self._pyaudio_out_stream.stop_stream()
-                                self._pyaudio_out_stream.close()
-                        except Exception:
-                            pass
-                        
-                        # 🔊 Mở stream với USB Audio Device nếu tìm thấy
-                        stream_kwargs = {
-                            'format': pyaudio.paInt16,
-                            'channels': channels,
-                            'rate': rate,
-                            'output': True,
-                            'frames_per_buffer': 960,
-                        }
-                        if output_device_index is not None:
-                            stream_kwargs['output_device_index'] = output_device_index
+                    # (in-place trên buffer cấp phát sẵn, không tạo mảng tạm mỗi frame)
+                    pcm = dsp.process(pcm)
+
+                    # Mở lại playback engine nếu config thay đổi
+                    if current_cfg != (rate, channels) or self._playback is None:
+                        if self._playback is not None:
+                            self._playback.stop()
                         
-                        self._pyaudio_out_stream = self._pyaudio_out.open(**stream_kwargs)
-                        logger.info(f"🔊 Audio playback started (rate={rate}, channels={channels}, device={output_device_index})")
+                        if audio_device is not None:
+                            # Nguồn phát realtime trong device dùng chung (TTS bị giảm âm lượng, cảnh báo vẫn ưu tiên)
+                            self._playback = audio_device.open_stream_source("call", priority=PRIORITY_CALL)
+                        else:
+                            # 🔊 Callback stream với USB Audio Device nếu tìm thấy
+                            self._playback = PlaybackEngine(self._pyaudio_out, sample_rate=rate, channels=channels,
+                                                            frames_per_buffer=960, device_index=output_device_index)
+                            self._playback.start()
                         current_cfg = (rate, channels)
 
-                    try:
-                        self._pyaudio_out_stream.write(pcm_bytes)
-                        # Debug: Log mỗi 100 frames
-                        self._audio_frame_count += 1
-                        if self._audio_frame_count % 100 == 0:
-                            logger.info(f"🔊 Audio frames written: {self._audio_frame_count}, bytes: {len(pcm_bytes)}")
-                    except Exception as werr:
-                        logger.warning(f"Audio playback write issue: {werr}")
-                        await asyncio.sleep(0.01)
+                    # Chỉ ghi vào jitter buffer - không bao giờ block event loop trên audio I/O
+                    self._playback.write(pcm)
+                    # Debug: Log mỗi 100 frames
+                    self._audio_frame_count += 1
+                    if self._audio_frame_count % 100 == 0:
+                        logger.info(f"🔊 Audio frames queued: {self._audio_frame_count}, playback: {self._playback.get_stats()}")
                         
             except asyncio.CancelledError:
                 pass
@@ -461,13 +432,9 @@ class MessageHandler:
                     logger.warning(f"Audio playback stopped due to error: {e}")
             finally:
                 # Cleanup stream
-                try:
-                    if self._pyaudio_out_stream is not None:
-                        self._pyaudio_out_stream.stop_stream()
-                        self._pyaudio_out_stream.close()
-                        self._pyaudio_out_stream = None
-                except Exception:
-                    pass
+                if self._playback is not None:
+                    self._playback.stop()
+                    self._playback = None
                 logger.info("🔊 Audio playback finished")
                     
         except Exception as e:
@@ -575,104 +542,109 @@ class MessageHandler:
                 logger.error(f"Error decoding base64 data: {e}")
                 return
 
-            
-            # Tạo key duy nhất cho stream này
-            stream_key = f"{stream_id}"
-            
-            # Khởi tạo buffer cho stream nếu chưa tồn tại
-            if stream_key not in audio_stream_buffers:
-                audio_stream_buffers[stream_key] = {
-                    "chunks": {},
-                    "total_chunks": total_chunks,
-                    "received_chunks": 0,
-                    "format": format_audio,
-                    "sample_rate": sample_rate,
-                    "timestamp": time.time()
-                }
-            
-            # Lưu chunk vào buffer
-            audio_stream_buffers[stream_key]["chunks"][chunk_index] = audio_chunk
-            audio_stream_buffers[stream_key]["received_chunks"] += 1
-            
-            logger.debug(f"Received audio chunk {chunk_index+1}/{total_chunks} from server (stream: {stream_id})")
-            
-            # Kiểm tra xem đã nhận đủ chunks chưa hoặc đã nhận chunk cuối cùng
-            if is_last or audio_stream_buffers[stream_key]["received_chunks"] >= total_chunks:
-                # Xử lý ngay cả khi chưa nhận đủ tất cả các chunks
-                logger.info(f"Completed audio stream {stream_id} from server, processing...")
-                
-                # Kết hợp các chunks theo thứ tự
-                all_chunks = []
-                for i in range(total_chunks):
-                    if i in audio_stream_buffers[stream_key]["chunks"]:
-                        all_chunks.append(audio_stream_buffers[stream_key]["chunks"][i])
-                    else:
-                        logger.warning(f"Missing chunk {i} in stream {stream_id} from server")
-                
-                # Kết hợp tất cả chunks
-                combined_audio = b''.join(all_chunks)
-                logger.info(f"Playing audio from server (stream: {stream_id})")
-                file_path = os.path.join(
-                                    BASE_DIR, "debug", f"audio_response_from_server.wav")
-                try:
-                    audio_np = np.frombuffer(combined_audio, dtype=np.int16)
-                    sf.write(
-                        file_path, audio_np, audio_stream_buffers[stream_key]["sample_rate"], subtype='PCM_16')
-                    logger.debug(
-                        f"💾 Đã lưu file âm thanh: {file_path}")
-                except Exception as e:
-                    logger.error(
-                        f"❌ Lỗi khi lưu file âm thanh: {e}")
-                self.speaker.play_audio_data(combined_audio, audio_stream_buffers[stream_key]["sample_rate"])
-                # self.speaker.play_file(file_path)
-                    
-                # Xóa buffer sau khi xử lý xong
-                del audio_stream_buffers[stream_key]
+            self._store_audio_chunk(stream_id, chunk_index, total_chunks, is_last,
+                                    format_audio, sample_rate, audio_chunk)
                 
         except Exception as e:
             logger.error(f"Error processing audio from server: {e}")
             import traceback
             logger.error(traceback.format_exc())
 
-    def _cleanup_old_streams(self):
-        """Kiểm tra và xử lý các audio streams bị timeout"""
+    def handle_stt_audio_frame(self, data: bytes):
+        """
+        Xử lý binary audio frame từ server (topic `.../audio/bin`), không qua JSON/base64
+        """
+        try:
+            try:
+                header, audio_chunk = unpack_audio_frame(data)
+            except ValueError as e:
+                logger.error(f"Invalid binary audio frame: {e}")
+                return
+
+            if header.is_aborted:
+                logger.info(f"Audio stream {header.stream_id} aborted by server")
+                self.reassembler.discard(f"{header.stream_id}")
+                if self.tts_player is not None:
+                    self.tts_player.abort(header.stream_id)
+                return
+
+            if len(audio_chunk) == 0:
+                logger.error(f"Empty audio data for chunk {header.chunk_index}")
+                return
+
+            logger.debug(f"Received binary audio chunk {header.chunk_index} with sample rate {header.sample_rate} from server (stream: {header.stream_id})")
+
+            # total_chunks = 0 nghĩa là server chưa biết tổng số chunk, chờ cờ isLast
+            total_chunks = header.total_chunks
+            if header.is_last and not total_chunks:
+                total_chunks = header.chunk_index + 1
+            self._store_audio_chunk(header.stream_id, header.chunk_index, total_chunks,
+                                    header.is_last, header.format, header.sample_rate,
+                                    bytes(audio_chunk))
+
+        except Exception as e:
+            logger.error(f"Error processing binary audio from server: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+
+    def _store_audio_chunk(self, stream_id, chunk_index: int, total_chunks: int, is_last: bool,
+                           format_audio: str, sample_rate: int, audio_chunk: bytes):
+        """Lưu chunk vào buffer của stream và phát khi đã nhận đủ"""
+        stream_key = self._stream_key(stream_id, chunk_index)
+
+        if self.tts_player is not None:
+            # Phát progressive: bắt đầu sau prefetch, các chunk sau được nạp tiếp theo thứ tự
+            self.tts_player.add_chunk(stream_key, chunk_index, total_chunks, is_last,
+                                      format_audio, sample_rate, audio_chunk)
+            return
+
+        logger.debug(f"Received audio chunk {chunk_index+1}/{total_chunks} from server (stream: {stream_key})")
+        self.reassembler.add_chunk(stream_key, chunk_index, total_chunks, is_last,
+                                   format_audio, sample_rate, audio_chunk)
+
+    def _stream_key(self, stream_id, chunk_index: int) -> str:
+        """
+        Key của stream. Server không gửi serverStreamId: mỗi chunk 0 mở một stream
+        ẩn danh mới, thay vì dồn mọi stream vào key "None".
+        """
+        if stream_id is not None:
+            return f"{stream_id}"
+        if chunk_index == 0:
+            self._anon_stream_seq += 1
+        return f"anon-{self._anon_stream_seq}"
+
+    def _enqueue_playback(self, stream_key: str, data: bytes, format_audio: str, sample_rate: int, timed_out: bool):
+        """Callback của StreamReassembler: chỉ xếp hàng, không phát trên thread gọi"""
+        try:
+            self._playback_queue.put_nowait((stream_key, data, format_audio, sample_rate, timed_out))
+        except queue.Full:
+            logger.warning(f"Playback queue full, dropping audio stream {stream_key}")
+
+    def _playback_worker(self):
+        """Giải mã và phát lần lượt các stream đã ghép xong"""
         while True:
+            stream_key, data, format_audio, sample_rate, timed_out = self._playback_queue.get()
             try:
-                current_time = time.time()
-                streams_to_process = []
-                
-                # Kiểm tra các streams đã quá thời gian chờ
-                for stream_key, stream_data in list(audio_stream_buffers.items()):
-                    if current_time - stream_data["timestamp"] > STREAM_TIMEOUT:
-                        if stream_data["received_chunks"] > 0:
-                            logger.warning(f"Stream {stream_key} timed out with {stream_data['received_chunks']}/{stream_data['total_chunks']} chunks. Processing anyway.")
-                            streams_to_process.append(stream_key)
-                
-                # Xử lý các streams bị timeout
-                for stream_key in streams_to_process:
-                    stream_data = audio_stream_buffers[stream_key]
-                    
-                    # Kết hợp các chunks theo thứ tự
-                    all_chunks = []
-                    for i in range(stream_data["total_chunks"]):
-                        if i in stream_data["chunks"]:
-                            all_chunks.append(stream_data["chunks"][i])
-                    
-                    # Kết hợp tất cả chunks
-                    if all_chunks:
-                        combined_audio = b''.join(all_chunks)
-                        logger.info(f"Playing timed out audio from server (stream: {stream_key}, {len(all_chunks)}/{stream_data['total_chunks']} chunks)")
-                        self.speaker.play_audio_data(combined_audio, stream_data["sample_rate"])
-                    
-                    # Xóa buffer sau khi xử lý
-                    del audio_stream_buffers[stream_key]
-                
-                # Ngủ 1 giây trước khi kiểm tra lại
-                time.sleep(1)
+                combined_audio = self._decode_audio(data, {"format": format_audio, "sample_rate": sample_rate})
+                state = "timed out " if timed_out else ""
+                logger.info(f"Playing {state}audio from server (stream: {stream_key})")
+                # Dump debug chỉ khi bật DEBUG_AUDIO_DUMP, giới hạn tần suất, ghi ở thread riêng
+                get_debug_recorder().record("audio_response_from_server",
+                                            np.frombuffer(combined_audio, dtype=np.int16), sample_rate)
+                self.speaker.play_audio_data(combined_audio, sample_rate)
             except Exception as e:
-                logger.error(f"Error in cleanup thread: {e}")
-                time.sleep(5)  # Ngủ dài hơn nếu có lỗi
-    
+                logger.error(f"Error playing audio stream {stream_key}: {e}", exc_info=True)
+
+    def _decode_audio(self, data: bytes, stream_data: dict) -> bytes:
+        """Giải mã audio của stream về PCM int16 (server TTS có thể gửi Opus)"""
+        if stream_data["format"] == "opus":
+            try:
+                return OpusDecoder(stream_data["sample_rate"]).decode(data)
+            except Exception as e:
+                logger.error(f"❌ Opus decode failed: {e}", exc_info=True)
+                return b''
+        return data
+
     def handle_command(self, payload: dict):
         """Handle commands from server"""
         command = payload.get("command")
@@ -0,0 +1,462 @@
+"""
+MQTT Outbox
+===========
+
+Outbox ghi đĩa cho message publish khi mất kết nối (GPS, cảnh báo vật cản,
+message SOS), giữ được qua lần khởi động lại process.
+
+- Log append-only chia segment (`NNNNNNNN.seg`), mỗi record có CRC32; khi mở
+  lại, record ghi dở ở cuối (crash giữa chừng) bị cắt bỏ
+- fsync theo lô mỗi `fsync_interval`; record `durable` (safety) fsync ngay
+- Vị trí đã gửi xong (`cursor`) lưu riêng; segment đã gửi hết bị xoá
+- Vượt `max_bytes` thì compact: chỉ giữ record mới nhất của các topic
+  coalesce (GPS), rồi bỏ record cũ nhất không phải safety
+- Khi có kết nối, thread drain gửi lại theo đúng thứ tự, giới hạn tốc độ
+  (message/s và byte/s), theo lô; cursor chỉ tiến khi cả lô hoàn tất
+  (at-least-once: crash giữa lô thì lô đó được gửi lại)
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+try:
+    from config import MQTT_OUTBOX_DIR
+except ImportError:
+    try:
+        from config import BASE_DIR
+        MQTT_OUTBOX_DIR = os.path.join(BASE_DIR, "cache", "mqtt_outbox")
+    except ImportError:
+        MQTT_OUTBOX_DIR = None
+
+try:
+    from config import MQTT_OUTBOX_MAX_BYTES
+except ImportError:
+    MQTT_OUTBOX_MAX_BYTES = 8 * 1024 * 1024
+
+try:
+    from config import MQTT_OUTBOX_DRAIN_RATE
+except ImportError:
+    MQTT_OUTBOX_DRAIN_RATE = 20          # message/s
+
+try:
+    from config import MQTT_OUTBOX_DRAIN_BYTES
+except ImportError:
+    MQTT_OUTBOX_DRAIN_BYTES = 32 * 1024  # byte/s
+
+# payload_len, crc32, topic_len, qos, retain, class_len
+_HEADER = struct.Struct("<IIHBBB")
+_MAX_PAYLOAD = 4 * 1024 * 1024
+_SEGMENT_SUFFIX = ".seg"
+_CURSOR_FILE = "cursor.json"
+
+
+class OutboxRecord:
+    """Một message trong outbox"""
+
+    __slots__ = ("topic", "data", "qos", "retain", "topic_class", "segment", "end")
+
+    def __init__(self, topic: str, data: bytes, qos: int, retain: bool, topic_class: str,
+                 segment: int = 0, end: int = 0):
+        self.topic = topic
+        self.data = data
+        self.qos = qos
+        self.retain = retain
+        self.topic_class = topic_class
+        self.segment = segment   # Segment chứa record
+        self.end = end           # Offset ngay sau record
+
+    def encode(self) -> bytes:
+        topic = self.topic.encode("utf-8")
+        topic_class = self.topic_class.encode("utf-8")
+        body = topic + topic_class + self.data
+        crc = zlib.crc32(struct.pack("<HBBB", len(topic), self.qos, int(self.retain), len(topic_class)) + body)
+        return _HEADER.pack(len(self.data), crc, len(topic), self.qos, int(self.retain), len(topic_class)) + body
+
+
+def _read_record(f, segment: int) -> Optional[OutboxRecord]:
+    """Đọc một record tại vị trí hiện tại, None nếu hết file / record hỏng"""
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    payload_len, crc, topic_len, qos, retain, class_len = _HEADER.unpack(header)
+    if payload_len > _MAX_PAYLOAD or qos > 2:
+        return None
+    body = f.read(topic_len + class_len + payload_len)
+    if len(body) < topic_len + class_len + payload_len:
+        return None
+    if zlib.crc32(header[8:] + body) != crc:
+        return None
+    try:
+        topic = body[:topic_len].decode("utf-8")
+        topic_class = body[topic_len:topic_len + class_len].decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return OutboxRecord(topic, body[topic_len + class_len:], qos, bool(retain), topic_class, segment, f.tell())
+
+
+class MQTTOutbox:
+    """Outbox append-only trên đĩa, drain có giới hạn tốc độ khi có kết nối"""
+
+    def __init__(self, directory: str = MQTT_OUTBOX_DIR, max_bytes: int = MQTT_OUTBOX_MAX_BYTES,
+                 segment_bytes: int = 256 * 1024, fsync_interval: float = 0.5,
+                 coalesce_topics: Iterable[str] = (), drain_rate: float = MQTT_OUTBOX_DRAIN_RATE,
+                 drain_bytes: float = MQTT_OUTBOX_DRAIN_BYTES, batch: int = 8, ack_timeout: float = 30.0):
+        """
+        Args:
+            directory: Thư mục chứa segment và cursor
+            max_bytes: Dung lượng tối đa của các record chưa gửi (vượt quá thì compact)
+            segment_bytes: Kích thước tối đa một segment
+            fsync_interval: Chu kỳ fsync theo lô (giây)
+            coalesce_topics: Topic chỉ cần giữ record mới nhất khi compact
+            drain_rate: Số message tối đa mỗi giây khi drain
+            drain_bytes: Số byte payload tối đa mỗi giây khi drain
+            batch: Số record gửi mỗi lô trước khi lưu cursor
+            ack_timeout: Thời gian chờ một lô hoàn tất (giây)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.coalesce_topics = set(coalesce_topics)
+        self.drain_rate = drain_rate
+        self.drain_bytes = drain_bytes
+        self.batch = batch
+        self.ack_timeout = ack_timeout
+
+        self._cond = threading.Condition()
+        self._segments: List[int] = []
+        self._file = None
+        self._cursor: Tuple[int, int] = (0, 0)
+        self._pending = 0
+        self._pending_bytes = 0
+        self._generation = 0   # Tăng khi compact: lô đang drain không còn hợp lệ
+        self._dirty = False
+        self._online = False
+        self._running = True
+        self._send: Optional[Callable[[OutboxRecord, Callable[[bool], None]], bool]] = None
+        self._drain_thread: Optional[threading.Thread] = None
+
+        self.appended = 0
+        self.drained = 0
+        self.compactions = 0
+        self.dropped = 0
+        self.recovered = 0
+        self.truncated_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="mqtt-outbox-fsync", daemon=True)
+        self._flush_thread.start()
+
+    # ----- Segment / recovery -----
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}{_SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        """Quét segment, cắt record hỏng ở cuối, đọc cursor và đếm record chưa gửi"""
+        self._segments = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX) and name[:-len(_SEGMENT_SUFFIX)].isdigit()
+        )
+        for segment in self._segments:
+            path = self._segment_path(segment)
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                valid = 0
+                while _read_record(f, segment) is not None:
+                    valid = f.tell()
+            if valid < size:
+                logger.warning(f"⚠️ Outbox segment {segment} has {size - valid} corrupt/torn bytes, truncating")
+                self.truncated_bytes += size - valid
+                with open(path, "r+b") as f:
+                    f.truncate(valid)
+
+        cursor = self._load_cursor()
+        if not self._segments:
+            self._segments = [cursor[0] + 1 if cursor else 1]
+            open(self._segment_path(self._segments[0]), "ab").close()
+            cursor = (self._segments[0], 0)
+        elif cursor is None or cursor[0] < self._segments[0]:
+            cursor = (self._segments[0], 0)
+        elif cursor[0] not in self._segments:
+            later = [s for s in self._segments if s > cursor[0]]
+            cursor = (later[0], 0) if later else (self._segments[-1], os.path.getsize(self._segment_path(self._segments[-1])))
+        if cursor[0] in self._segments:
+            # Cursor không thể vượt quá phần log còn hợp lệ sau khi cắt
+            cursor = (cursor[0], min(cursor[1], os.path.getsize(self._segment_path(cursor[0]))))
+        self._cursor = cursor
+        self._delete_drained_segments()
+
+        for record in self._iter_pending():
+            self._pending += 1
+            self._pending_bytes += len(record.data)
+        self.recovered = self._pending
+        self._file = open(self._segment_path(self._segments[-1]), "ab", buffering=0)
+        if self._pending:
+            logger.info(f"📦 Outbox recovered {self._pending} pending messages ({self._pending_bytes} bytes)")
+
+    def _load_cursor(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(os.path.join(self.directory, _CURSOR_FILE)) as f:
+                data = json.load(f)
+            return int(data["segment"]), int(data["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save_cursor(self):
+        """Ghi cursor (atomic). Không fsync: mất cursor chỉ làm gửi lại, không mất message"""
+        path = os.path.join(self.directory, _CURSOR_FILE)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write outbox cursor: {e}")
+
+    def _iter_pending(self, start: Optional[Tuple[int, int]] = None) -> Iterator[OutboxRecord]:
+        """Các record từ `start` (mặc định cursor) tới cuối log"""
+        segment, offset = start or self._cursor
+        for seg in self._segments:
+            if seg < segment:
+                continue
+            with open(self._segment_path(seg), "rb") as f:
+                f.seek(offset if seg == segment else 0)
+                while True:
+                    record = _read_record(f, seg)
+                    if record is None:
+                        break
+                    yield record
+
+    def _delete_drained_segments(self):
+        """Xoá segment nằm hoàn toàn trước cursor"""
+        while len(self._segments) > 1 and self._segments[0] < self._cursor[0]:
+            segment = self._segments.pop(0)
+            try:
+                os.remove(self._segment_path(segment))
+            except OSError as e:
+                logger.warning(f"⚠️ Could not remove outbox segment {segment}: {e}")
+
+    def _roll(self):
+        """Đóng segment hiện tại, mở segment mới (gọi khi giữ lock)"""
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._file.close()
+        segment = self._segments[-1] + 1
+        self._segments.append(segment)
+        self._file = open(self._segment_path(segment), "ab", buffering=0)
+
+    # ----- Ghi -----
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def append(self, topic: str, data: bytes, qos: int = 0, retain: bool = False,
+               topic_class: str = "telemetry", durable: bool = False):
+        """
+        Ghi message vào outbox
+
+        Args:
+            durable: fsync ngay (message safety), thay vì chờ lô fsync kế tiếp
+        """
+        record = OutboxRecord(topic, data, qos, retain, topic_class)
+        encoded = record.encode()
+        with self._cond:
+            if self._pending_bytes + len(data) > self.max_bytes:
+                self._compact()
+            if self._file.tell() and self._file.tell() + len(encoded) > self.segment_bytes:
+                self._roll()
+            self._file.write(encoded)
+            self._pending += 1
+            self._pending_bytes += len(data)
+            self.appended += 1
+            if durable:
+                os.fsync(self._file.fileno())
+            else:
+                self._dirty = True
+            self._cond.notify_all()
+
+    def _flush_loop(self):
+        """fsync theo lô: tối đa một lần mỗi `fsync_interval`"""
+        while True:
+            with self._cond:
+                while self._running and not self._dirty:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            time.sleep(self.fsync_interval)
+            with self._cond:
+                if not self._dirty or self._file.closed:
+                    continue
+                self._dirty = False
+                # fsync ngoài lock: dup fd để segment có thể được roll trong lúc đó
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _compact(self):
+        """
+        Viết lại các record chưa gửi vào segment mới (gọi khi giữ lock):
+        bỏ record cũ của topic coalesce, rồi bỏ record cũ nhất không phải safety
+        cho tới khi còn <= 3/4 `max_bytes`
+        """
+        records = list(self._iter_pending())
+        latest = {r.topic: i for i, r in enumerate(records) if r.topic in self.coalesce_topics}
+        keep = [r for i, r in enumerate(records) if r.topic not in latest or latest[r.topic] == i]
+        size = sum(len(r.data) for r in keep)
+        target = self.max_bytes * 3 // 4
+        if size > target:
+            kept = []
+            for r in keep:
+                if size > target and r.topic_class != "safety":
+                    size -= len(r.data)
+                    continue
+                kept.append(r)
+            keep = kept
+        self.dropped += len(records) - len(keep)
+        self.compactions += 1
+
+        old_segments = self._segments
+        first = old_segments[-1] + 1
+        self._file.close()
+        self._segments = [first]
+        self._file = open(self._segment_path(first), "ab", buffering=0)
+        for r in keep:
+            if self._file.tell() and self._file.tell() + len(r.encode()) > self.segment_bytes:
+                self._roll()
+            self._file.write(r.encode())
+        os.fsync(self._file.fileno())
+        self._cursor = (first, 0)
+        self._save_cursor()
+        for segment in old_segments:
+            try:
+                os.remove(self._segment_path(segment))
+            except OSError:
+                pass
+        self._pending = len(keep)
+        self._pending_bytes = size
+        self._generation += 1
+        logger.warning(f"⚠️ Outbox compacted: kept {len(keep)}/{len(records)} messages ({size} bytes)")
+
+    # ----- Drain -----
+
+    def start_drain(self, send: Callable[[OutboxRecord, Callable[[bool], None]], bool]):
+        """
+        Bật drain
+
+        Args:
+            send: send(record, callback) đưa record vào pipeline publish;
+                callback(ok) được gọi khi message hoàn tất / thất bại
+        """
+        self._send = send
+        if self._drain_thread is None:
+            self._drain_thread = threading.Thread(target=self._drain_loop, name="mqtt-outbox-drain", daemon=True)
+            self._drain_thread.start()
+
+    def set_online(self, online: bool):
+        """Gọi từ on_connect / on_disconnect"""
+        with self._cond:
+            self._online = online
+            self._cond.notify_all()
+
+    def _drain_loop(self):
+        next_send = 0.0
+        while True:
+            with self._cond:
+                while self._running and not (self._online and self._pending):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                generation = self._generation
+                batch = []
+                for record in self._iter_pending():
+                    batch.append(record)
+                    if len(batch) >= self.batch:
+                        break
+            if not batch:
+                # Record chưa ghi xong (không nên xảy ra) - tránh vòng lặp bận
+                time.sleep(self.fsync_interval)
+                continue
+
+            results = []
+            done = threading.Semaphore(0)
+
+            def callback(ok, results=results, done=done):
+                results.append(ok)
+                done.release()
+
+            sent = 0
+            for record in batch:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send = time.monotonic() + max(1.0 / self.drain_rate, len(record.data) / self.drain_bytes)
+                if not self._online or not self._send(record, callback):
+                    break
+                sent += 1
+
+            deadline = time.monotonic() + self.ack_timeout
+            for _ in range(sent):
+                if not done.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    break
+
+            with self._cond:
+                if generation != self._generation:
+                    continue  # Đã compact trong lúc gửi: lô được gửi lại từ cursor mới
+                acked = sum(1 for ok in results if ok)
+                if acked < len(batch):
+                    # Mất kết nối / timeout: chỉ tiến cursor nếu cả lô thành công, gửi lại sau
+                    logger.warning(f"⚠️ Outbox drain interrupted ({acked}/{len(batch)} acked), retrying later")
+                    if self._online:
+                        self._cond.wait(timeout=1.0)
+                    continue
+                last = batch[-1]
+                self._cursor = (last.segment, last.end)
+                self._pending -= len(batch)
+                self._pending_bytes -= sum(len(r.data) for r in batch)
+                self.drained += len(batch)
+                self._save_cursor()
+                self._delete_drained_segments()
+                if not self._pending and self._file.tell() >= self.segment_bytes // 2:
+                    # Đã gửi hết: bắt đầu segment mới để segment cũ được xoá
+                    self._roll()
+                    self._cursor = (self._segments[-1], 0)
+                    self._save_cursor()
+                    self._delete_drained_segments()
+                if not self._pending:
+                    logger.info(f"📦 Outbox drained ({self.drained} messages total)")
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def get_stats(self) -> dict:
+        return {
+            'pending': self._pending,
+            'pending_bytes': self._pending_bytes,
+            'segments': len(self._segments),
+            'appended': self.appended,
+            'drained': self.drained,
+            'recovered': self.recovered,
+            'compactions': self.compactions,
+            'dropped': self.dropped,
+            'truncated_bytes': self.truncated_bytes,
+        }
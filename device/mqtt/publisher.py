@@ -0,0 +1,362 @@
+"""
+Publish Pipeline
+================
+
+Hàng đợi publish có ưu tiên giữa code gửi và paho.
+
+Message được xếp theo lớp ưu tiên, thread gửi luôn lấy lớp cao nhất trước:
+
+- safety: cảnh báo vật cản, cuộc gọi SOS
+- signaling: WebRTC offer / answer / candidate
+- telemetry: GPS, ping, ...
+- bulk: audio giọng nói gửi lên server
+
+Chỉ một số message telemetry / bulk được đưa vào paho cùng lúc (`window`),
+nên một bản ghi âm dài không thể xếp hàng trăm chunk QoS1 trước một cảnh báo.
+safety / signaling không bị giới hạn này.
+
+- Bộ nhớ giới hạn (`max_bytes`): vượt quá thì bỏ message cũ nhất của lớp thấp
+  nhất; nếu không còn lớp thấp hơn để bỏ thì message mới bị từ chối
+  (`publish` trả về False). Safety không bao giờ bị bỏ
+- Topic telemetry khai báo coalesce (ví dụ GPS): message mới thay message cũ
+  chưa gửi của cùng topic
+- Hoàn tất theo dõi qua `MQTTMessageInfo.mid` + `on_publish` (PUBACK với QoS1,
+  ghi xong socket với QoS0); metric latency theo lớp
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, Optional
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+CLASS_SAFETY = "safety"
+CLASS_SIGNALING = "signaling"
+CLASS_TELEMETRY = "telemetry"
+CLASS_BULK = "bulk"
+
+# Thứ tự ưu tiên (cao -> thấp)
+PRIORITY_ORDER = (CLASS_SAFETY, CLASS_SIGNALING, CLASS_TELEMETRY, CLASS_BULK)
+
+# Lớp không bị giới hạn bởi window
+_UNTHROTTLED = (CLASS_SAFETY, CLASS_SIGNALING)
+
+# paho: MQTT_ERR_SUCCESS = 0, MQTT_ERR_NO_CONN = 4 (QoS>0 vẫn được paho giữ lại để gửi lại)
+_MQTT_ERR_SUCCESS = 0
+_MQTT_ERR_NO_CONN = 4
+
+
+class _Outbound:
+    """Một message đang chờ gửi / chờ hoàn tất"""
+
+    __slots__ = ("topic", "data", "qos", "retain", "topic_class", "enqueued", "published", "mid", "callback",
+                 "properties")
+
+    def __init__(self, topic: str, data: bytes, qos: int, retain: bool, topic_class: str,
+                 callback: Optional[Callable[[bool], None]] = None, properties=None):
+        self.topic = topic
+        self.data = data
+        self.qos = qos
+        self.retain = retain
+        self.topic_class = topic_class
+        self.enqueued = time.monotonic()
+        self.published: Optional[float] = None
+        self.mid: Optional[int] = None
+        self.callback = callback
+        self.properties = properties  # MQTT v5 PUBLISH properties
+
+    def done(self, ok: bool):
+        if self.callback is not None:
+            self.callback(ok)
+
+
+class _ClassStats:
+    """Metric của một lớp ưu tiên"""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.published = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._ack_total = 0.0
+        self._ack_max = 0.0
+
+    def record_publish(self, wait: float):
+        self.published += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+
+    def record_complete(self, latency: float):
+        self.completed += 1
+        self._ack_total += latency
+        self._ack_max = max(self._ack_max, latency)
+
+    def as_dict(self) -> dict:
+        return {
+            'enqueued': self.enqueued,
+            'published': self.published,
+            'completed': self.completed,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'max_depth': self.max_depth,
+            'queue_wait_avg_ms': self._wait_total / max(self.published, 1) * 1000,
+            'queue_wait_max_ms': self._wait_max * 1000,
+            'puback_avg_ms': self._ack_total / max(self.completed, 1) * 1000,
+            'puback_max_ms': self._ack_max * 1000,
+        }
+
+
+class PublishPipeline:
+    """Hàng đợi publish theo lớp ưu tiên, giới hạn bộ nhớ, một thread gửi"""
+
+    def __init__(self, client, topic_classes: Optional[Dict[str, str]] = None,
+                 coalesce_topics: Iterable[str] = (), max_bytes: int = 2 * 1024 * 1024,
+                 window: int = 16, topic_aliases=None):
+        """
+        Args:
+            client: paho `mqtt.Client`
+            topic_classes: Lớp ưu tiên theo topic (topic không có trong bảng: xem `classify`)
+            coalesce_topics: Topic chỉ cần giữ message mới nhất chưa gửi
+            max_bytes: Tổng dung lượng payload tối đa đang chờ gửi
+            window: Số message telemetry / bulk tối đa đã đưa vào paho nhưng chưa hoàn tất
+            topic_aliases: `TopicAliasTable` (MQTT v5), áp dụng theo đúng thứ tự gửi
+        """
+        self.client = client
+        self.topic_classes = dict(topic_classes or {})
+        self.coalesce_topics = set(coalesce_topics)
+        self.max_bytes = max_bytes
+        self.window = window
+        self.topic_aliases = topic_aliases
+
+        self._queues: Dict[str, deque] = {name: deque() for name in PRIORITY_ORDER}
+        self._latest: "OrderedDict[str, _Outbound]" = OrderedDict()  # Message coalesce chưa gửi theo topic
+        self._inflight: Dict[int, _Outbound] = {}
+        self._early_acks = set()   # mid hoàn tất trước khi publish() trả về
+        self._throttled_inflight = 0
+        self._bytes = 0
+        self._connected = False
+        self._running = True
+        self._cond = threading.Condition()
+        self._stats = {name: _ClassStats() for name in PRIORITY_ORDER}
+
+        self._thread = threading.Thread(target=self._sender_loop, name="mqtt-publisher", daemon=True)
+        self._thread.start()
+
+    def classify(self, topic: str, payload=None) -> str:
+        """Lớp ưu tiên của một message"""
+        if isinstance(payload, dict) and payload.get("isEmergency"):
+            return CLASS_SAFETY
+        topic_class = self.topic_classes.get(topic)
+        if topic_class is not None:
+            return topic_class
+        if "webrtc/" in topic:
+            return CLASS_SIGNALING
+        return CLASS_TELEMETRY
+
+    # ----- Producer -----
+
+    def submit(self, topic: str, data: bytes, qos: int = 0, retain: bool = False,
+               topic_class: str = CLASS_TELEMETRY, callback: Optional[Callable[[bool], None]] = None,
+               properties=None) -> bool:
+        """
+        Xếp message vào hàng đợi (không block)
+
+        Args:
+            callback: callback(ok) khi message hoàn tất / bị bỏ (gọi khi giữ lock, phải nhanh)
+            properties: PUBLISH properties (MQTT v5)
+
+        Returns:
+            False nếu message bị từ chối vì vượt giới hạn bộ nhớ
+        """
+        message = _Outbound(topic, data, qos, retain, topic_class, callback, properties)
+        stats = self._stats[topic_class]
+        with self._cond:
+            if topic in self.coalesce_topics:
+                previous = self._latest.get(topic)
+                if previous is not None and previous.topic_class == topic_class:
+                    # Message mới lớn hơn: chỉ lấy chỗ từ lớp thấp hơn, như message không coalesce
+                    growth = len(data) - len(previous.data)
+                    if growth > 0 and not self._make_room(growth, topic_class):
+                        stats.dropped += 1
+                        logger.warning(f"⚠️ Publish budget full, dropping {topic_class} message on {topic}")
+                        message.done(False)
+                        return False
+                    # Thay message cũ chưa gửi, giữ vị trí trong hàng đợi
+                    queue = self._queues[previous.topic_class]
+                    queue[queue.index(previous)] = message
+                    self._bytes += len(data) - len(previous.data)
+                    self._latest[topic] = message
+                    previous.done(False)
+                    stats.enqueued += 1
+                    stats.coalesced += 1
+                    return True
+
+            if not self._make_room(len(data), topic_class):
+                stats.dropped += 1
+                logger.warning(f"⚠️ Publish budget full, dropping {topic_class} message on {topic}")
+                message.done(False)
+                return False
+
+            self._queues[topic_class].append(message)
+            self._bytes += len(data)
+            if topic in self.coalesce_topics:
+                self._latest[topic] = message
+            stats.enqueued += 1
+            stats.max_depth = max(stats.max_depth, len(self._queues[topic_class]))
+            self._cond.notify()
+        return True
+
+    def _make_room(self, size: int, topic_class: str) -> bool:
+        """
+        Bỏ message cũ nhất của các lớp thấp hơn cho tới khi đủ chỗ (gọi khi giữ lock).
+        Không bỏ message cùng lớp: lớp đã đầy thì message mới bị từ chối (back-pressure)
+        """
+        rank = PRIORITY_ORDER.index(topic_class)
+        self._evict_until(self._bytes + size, topic_class, min_rank=rank + 1)
+        # Safety luôn được nhận, kể cả khi vượt budget
+        return topic_class == CLASS_SAFETY or self._bytes + size <= self.max_bytes
+
+    def _evict_until(self, needed: int, topic_class: str, min_rank: int):
+        for name in reversed(PRIORITY_ORDER[min_rank:]):
+            queue = self._queues[name]
+            while queue and needed > self.max_bytes:
+                victim = queue.popleft()
+                needed -= len(victim.data)
+                self._bytes -= len(victim.data)
+                if self._latest.get(victim.topic) is victim:
+                    del self._latest[victim.topic]
+                self._stats[name].dropped += 1
+                victim.done(False)
+                logger.warning(f"⚠️ Publish budget full, dropped queued {name} message on {victim.topic} "
+                               f"for {topic_class}")
+
+    # ----- Trạng thái kết nối / callback paho -----
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def set_connected(self, connected: bool):
+        """Gọi từ on_connect / on_disconnect"""
+        with self._cond:
+            self._connected = connected
+            if self.topic_aliases is not None:
+                self.topic_aliases.reset()
+            if not connected:
+                # QoS0 đang bay bị mất; QoS>0 được paho gửi lại khi kết nối lại
+                for mid in [m for m, msg in self._inflight.items() if msg.qos == 0]:
+                    self._fail(self._inflight.pop(mid))
+            self._cond.notify()
+
+    def on_publish(self, client, userdata, mid, *args):
+        """Callback `on_publish` của paho (chạy trên network thread)"""
+        now = time.monotonic()
+        with self._cond:
+            message = self._inflight.pop(mid, None)
+            if message is None:
+                self._early_acks.add(mid)
+                return
+            self._complete(message, now)
+
+    def _complete(self, message: _Outbound, now: float):
+        self._stats[message.topic_class].record_complete(now - message.published)
+        message.done(True)
+        if message.topic_class not in _UNTHROTTLED:
+            self._throttled_inflight -= 1
+            self._cond.notify()
+
+    def _fail(self, message: _Outbound):
+        self._stats[message.topic_class].failed += 1
+        message.done(False)
+        if message.topic_class not in _UNTHROTTLED:
+            self._throttled_inflight -= 1
+
+    # ----- Thread gửi -----
+
+    def _next_message(self) -> Optional[_Outbound]:
+        """Message kế tiếp được phép gửi (gọi khi giữ lock)"""
+        if not self._connected:
+            return None
+        for name in PRIORITY_ORDER:
+            queue = self._queues[name]
+            if not queue:
+                continue
+            if name not in _UNTHROTTLED and self._throttled_inflight >= self.window:
+                return None
+            message = queue.popleft()
+            self._bytes -= len(message.data)
+            if self._latest.get(message.topic) is message:
+                del self._latest[message.topic]
+            return message
+        return None
+
+    def _sender_loop(self):
+        while True:
+            with self._cond:
+                message = self._next_message()
+                while message is None and self._running:
+                    self._cond.wait(timeout=1.0)
+                    message = self._next_message()
+                if message is None:
+                    return
+                if message.topic_class not in _UNTHROTTLED:
+                    self._throttled_inflight += 1
+            self._send(message)
+
+    def _send(self, message: _Outbound):
+        message.published = time.monotonic()
+        topic, properties = message.topic, message.properties
+        if self.topic_aliases is not None:
+            topic, properties = self.topic_aliases.apply(topic, message.qos, properties)
+        kwargs = {'properties': properties} if properties is not None else {}
+        try:
+            info = self.client.publish(topic, message.data, qos=message.qos, retain=message.retain, **kwargs)
+        except Exception as e:
+            logger.error(f"❌ Publish to {message.topic} failed: {e}")
+            with self._cond:
+                self._fail(message)
+            return
+
+        stats = self._stats[message.topic_class]
+        with self._cond:
+            stats.record_publish(message.published - message.enqueued)
+            if info.rc not in (_MQTT_ERR_SUCCESS, _MQTT_ERR_NO_CONN) or (info.rc == _MQTT_ERR_NO_CONN and message.qos == 0):
+                logger.warning(f"⚠️ Publish to {message.topic} failed (rc={info.rc})")
+                self._fail(message)
+                return
+            message.mid = info.mid
+            if info.mid in self._early_acks:
+                self._early_acks.discard(info.mid)
+                self._complete(message, time.monotonic())
+            else:
+                self._inflight[info.mid] = message
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            classes = {}
+            for name in PRIORITY_ORDER:
+                stats = self._stats[name].as_dict()
+                stats['depth'] = len(self._queues[name])
+                stats['inflight'] = sum(1 for m in self._inflight.values() if m.topic_class == name)
+                classes[name] = stats
+            return {
+                'connected': self._connected,
+                'queued_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'throttled_inflight': self._throttled_inflight,
+                'classes': classes,
+            }
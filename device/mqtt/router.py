@@ -0,0 +1,107 @@
+"""
+Topic Router
+============
+
+Bảng định tuyến topic -> handler dựng một lần khi đăng ký subscribe:
+
+- Topic cụ thể: tra dict O(1)
+- Topic filter có wildcard MQTT (`+`, `#`): so khớp một lần cho mỗi topic mới,
+  kết quả được cache lại
+
+Kèm `PayloadLogSampler`: log payload ở mức DEBUG, lấy mẫu 1/N message mỗi
+topic và chỉ format payload khi thực sự ghi log.
+"""
+
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+Handler = Callable[..., None]
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Topic có khớp filter MQTT (`+` một level, `#` mọi level còn lại) không"""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class TopicRouter:
+    """Định tuyến topic tới handler bằng dict dựng sẵn"""
+
+    def __init__(self, cache_size: int = 1024):
+        """
+        Args:
+            cache_size: Số topic tối đa được cache kết quả so khớp wildcard
+        """
+        self._exact: Dict[str, Handler] = {}
+        self._wildcards: List[Tuple[str, Handler]] = []
+        self._cache: Dict[str, Optional[Handler]] = {}
+        self.cache_size = cache_size
+
+    def add(self, topic_filter: str, handler: Handler):
+        """Đăng ký handler cho topic / topic filter"""
+        if "+" in topic_filter or "#" in topic_filter:
+            self._wildcards.append((topic_filter, handler))
+        else:
+            self._exact[topic_filter] = handler
+        self._cache.clear()
+
+    def resolve(self, topic: str) -> Optional[Handler]:
+        """Handler của topic (topic cụ thể được ưu tiên hơn wildcard), None nếu không có"""
+        handler = self._exact.get(topic)
+        if handler is not None:
+            return handler
+        try:
+            return self._cache[topic]
+        except KeyError:
+            pass
+        handler = None
+        for topic_filter, candidate in self._wildcards:
+            if topic_matches(topic_filter, topic):
+                handler = candidate
+                break
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[topic] = handler
+        return handler
+
+    def route(self, topic: str, *args) -> bool:
+        """Gọi handler của topic, trả về False nếu không có handler"""
+        handler = self.resolve(topic)
+        if handler is None:
+            return False
+        handler(*args)
+        return True
+
+    @property
+    def filters(self) -> List[str]:
+        return list(self._exact) + [f for f, _ in self._wildcards]
+
+
+class PayloadLogSampler:
+    """Log payload ở mức DEBUG, lấy mẫu mỗi `every` message của một topic, payload bị cắt ngắn"""
+
+    def __init__(self, logger: logging.Logger, every: int = 50, max_chars: int = 200):
+        self.logger = logger
+        self.every = max(1, every)
+        self.max_chars = max_chars
+        self._counts: Dict[str, int] = {}
+
+    def log(self, topic: str, payload):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        count = self._counts.get(topic, 0)
+        self._counts[topic] = count + 1
+        if count % self.every:
+            return
+        text = repr(payload)
+        if len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}... ({len(text)} chars)"
+        self.logger.debug(f"Received message #{count + 1} on {topic}: {text}")
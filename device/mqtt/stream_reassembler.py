@@ -0,0 +1,225 @@
+"""
+Stream Reassembler
+==================
+
+Ghép các chunk audio từ server thành stream hoàn chỉnh, có giới hạn bộ nhớ.
+
+- Mỗi stream dùng một bytearray cấp phát trước theo `totalChunks` (kích thước
+  chunk lấy từ chunk đầu tiên); chunk lệch kích thước được giữ riêng
+- Tổng dung lượng bị giới hạn (`max_bytes`, `max_streams`): vượt quá thì bỏ
+  stream ít được cập nhật gần đây nhất (LRU)
+- Timeout dùng min-heap theo deadline: thread hết hạn chỉ thức dậy khi có
+  stream tới hạn, không quét toàn bộ mỗi giây
+- Stream hoàn tất (hoặc hết hạn nhưng có dữ liệu) được chuyển cho callback
+  `on_complete` - caller đưa sang playback worker riêng, không phát trên thread này
+"""
+
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _Assembly:
+    """Buffer ghép của một stream"""
+
+    def __init__(self, key: str, format_audio: str, sample_rate: int, total_chunks: int, chunk_size: int):
+        self.key = key
+        self.format = format_audio
+        self.sample_rate = sample_rate
+        self.total_chunks = total_chunks
+        self.slot_size = chunk_size
+        # Cấp phát trước khi biết tổng số chunk; chunk cuối thường ngắn hơn
+        self.buffer = bytearray(total_chunks * chunk_size) if total_chunks > 0 else bytearray()
+        self.lengths: Dict[int, int] = {}
+        self.extra: Dict[int, bytes] = {}   # Chunk không vừa slot / ngoài vùng cấp phát
+        self.last_index: Optional[int] = total_chunks - 1 if total_chunks > 0 else None
+        self.generation = 0                  # Tăng mỗi lần cập nhật deadline (xoá lười trong heap)
+        self.created = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer) + sum(len(c) for c in self.extra.values())
+
+    @property
+    def received_chunks(self) -> int:
+        return len(self.lengths) + len(self.extra)
+
+    @property
+    def complete(self) -> bool:
+        return self.last_index is not None and self.received_chunks >= self.last_index + 1
+
+    def add(self, index: int, data: bytes) -> bool:
+        """Lưu chunk, trả về False nếu chunk bị lặp"""
+        if index in self.lengths or index in self.extra:
+            return False
+        offset = index * self.slot_size
+        if len(data) <= self.slot_size and offset + self.slot_size <= len(self.buffer):
+            self.buffer[offset:offset + len(data)] = data
+            self.lengths[index] = len(data)
+        else:
+            self.extra[index] = bytes(data)
+        return True
+
+    def assemble(self) -> bytes:
+        """Nối các chunk đã nhận theo thứ tự (bỏ qua chunk thiếu)"""
+        indices = sorted(set(self.lengths) | set(self.extra))
+        missing = (indices[-1] + 1 - len(indices)) if indices else 0
+        if missing:
+            logger.warning(f"Missing {missing} chunks in stream {self.key} from server")
+        view = memoryview(self.buffer)
+        parts = []
+        for index in indices:
+            if index in self.lengths:
+                offset = index * self.slot_size
+                parts.append(view[offset:offset + self.lengths[index]])
+            else:
+                parts.append(self.extra[index])
+        return b"".join(parts)
+
+
+class StreamReassembler:
+    """Ghép chunk theo stream với giới hạn bộ nhớ, LRU eviction và heap timeout"""
+
+    def __init__(self, on_complete: Callable[[str, bytes, str, int, bool], None],
+                 timeout: float = 15.0, max_bytes: int = 8 * 1024 * 1024, max_streams: int = 16):
+        """
+        Args:
+            on_complete: callback(key, data, format, sample_rate, timed_out) khi stream hoàn tất / hết hạn.
+                Gọi ngoài lock; phải nhanh (chỉ xếp hàng cho playback worker)
+            timeout: Thời gian tối đa giữa hai chunk của một stream (giây)
+            max_bytes: Tổng dung lượng buffer tối đa của mọi stream
+            max_streams: Số stream đang ghép tối đa
+        """
+        self.on_complete = on_complete
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_streams = max_streams
+
+        self._streams: "OrderedDict[str, _Assembly]" = OrderedDict()  # Thứ tự LRU
+        self._deadlines = []  # heap (deadline, generation, key)
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._expiry_loop, name="stream-reassembler", daemon=True)
+        self._thread.start()
+
+        self.completed = 0
+        self.timed_out = 0
+        self.evicted = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    def add_chunk(self, key: str, chunk_index: int, total_chunks: int, is_last: bool,
+                  format_audio: str, sample_rate: int, data: bytes):
+        """Thêm một chunk (total_chunks = 0 nếu chưa biết tổng số chunk)"""
+        done = None
+        with self._cond:
+            assembly = self._streams.get(key)
+            if assembly is None:
+                assembly = _Assembly(key, format_audio, sample_rate, total_chunks, len(data))
+                if len(assembly.buffer) > self.max_bytes:
+                    logger.warning(f"Stream {key} needs {len(assembly.buffer)} bytes > budget {self.max_bytes}, ignoring")
+                    self.rejected += 1
+                    return
+                self._streams[key] = assembly
+                self._bytes += assembly.nbytes
+            else:
+                self._streams.move_to_end(key)
+
+            before = assembly.nbytes
+            if not assembly.add(chunk_index, data):
+                self.duplicates += 1
+                return
+            self._bytes += assembly.nbytes - before
+            if total_chunks > 0:
+                assembly.last_index = max(assembly.last_index or 0, total_chunks - 1)
+            if is_last:
+                assembly.last_index = chunk_index
+
+            if assembly.complete:
+                done = self._pop(key)
+                self.completed += 1
+            else:
+                assembly.generation += 1
+                heapq.heappush(self._deadlines, (time.monotonic() + self.timeout, assembly.generation, key))
+                self._cond.notify()
+            self._enforce_budget(keep=key)
+
+        if done is not None:
+            logger.info(f"Completed audio stream {key} from server ({done.received_chunks} chunks)")
+            self.on_complete(key, done.assemble(), done.format, done.sample_rate, False)
+
+    def discard(self, key: str):
+        """Bỏ stream (ví dụ server báo aborted)"""
+        with self._cond:
+            self._pop(key)
+
+    def _pop(self, key: str) -> Optional[_Assembly]:
+        assembly = self._streams.pop(key, None)
+        if assembly is not None:
+            self._bytes -= assembly.nbytes
+        return assembly
+
+    def _enforce_budget(self, keep: str):
+        """Bỏ stream LRU cho tới khi nằm trong giới hạn (không bỏ stream vừa cập nhật)"""
+        while self._streams and (self._bytes > self.max_bytes or len(self._streams) > self.max_streams):
+            key = next(iter(self._streams))
+            if key == keep:
+                break
+            assembly = self._pop(key)
+            self.evicted += 1
+            logger.warning(f"Evicted audio stream {key} ({assembly.received_chunks} chunks, {assembly.nbytes} bytes) - reassembly budget exceeded")
+
+    def _expiry_loop(self):
+        while True:
+            expired = []
+            with self._cond:
+                while self._running:
+                    now = time.monotonic()
+                    # Bỏ các entry cũ (stream đã xong hoặc deadline đã được gia hạn)
+                    while self._deadlines:
+                        deadline, generation, key = self._deadlines[0]
+                        assembly = self._streams.get(key)
+                        if assembly is None or assembly.generation != generation:
+                            heapq.heappop(self._deadlines)
+                            continue
+                        break
+                    if not self._deadlines:
+                        self._cond.wait()
+                        continue
+                    deadline = self._deadlines[0][0]
+                    if deadline > now:
+                        self._cond.wait(timeout=deadline - now)
+                        continue
+                    _, _, key = heapq.heappop(self._deadlines)
+                    expired.append(self._pop(key))
+                    break
+                if not self._running:
+                    return
+            for assembly in expired:
+                self.timed_out += 1
+                if assembly.received_chunks > 0:
+                    logger.warning(f"Stream {assembly.key} timed out with {assembly.received_chunks}/{assembly.total_chunks} chunks. Processing anyway.")
+                    self.on_complete(assembly.key, assembly.assemble(), assembly.format, assembly.sample_rate, True)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        return {
+            'streams': len(self._streams),
+            'bytes': self._bytes,
+            'completed': self.completed,
+            'timed_out': self.timed_out,
+            'evicted': self.evicted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,69 @@
+"""
+Topic Alias
+===========
+
+MQTT v5 topic alias cho các topic publish tần suất cao (ICE candidate, GPS,
+audio STT): lần gửi đầu kèm topic đầy đủ + alias, các lần sau chỉ gửi alias
+(2 byte) với topic rỗng.
+
+- Số alias tối đa theo `Topic Alias Maximum` broker trả về trong CONNACK
+- Alias chỉ có hiệu lực trong một kết nối: reset khi kết nối / mất kết nối
+- Chỉ bỏ topic với message QoS0. Message QoS1/2 luôn kèm topic đầy đủ vì paho
+  gửi lại nguyên gói sau khi kết nối lại, lúc đó alias cũ không còn hợp lệ
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+
+class TopicAliasTable:
+    """Cấp và áp dụng topic alias cho một kết nối MQTT v5"""
+
+    def __init__(self, topics: Iterable[str]):
+        """
+        Args:
+            topics: Các topic được dùng alias (theo thứ tự ưu tiên cấp alias)
+        """
+        self.topics = [t for t in topics if t]
+        self.maximum = 0
+        self._aliases: Dict[str, int] = {}
+        self._announced = set()  # Alias đã được gửi kèm topic đầy đủ trong kết nối hiện tại
+        self.saved_bytes = 0
+
+    def configure(self, connack_properties=None):
+        """Đọc Topic Alias Maximum từ CONNACK (không có = broker không hỗ trợ alias)"""
+        self.maximum = getattr(connack_properties, "TopicAliasMaximum", 0) or 0
+        self._aliases = {topic: i + 1 for i, topic in enumerate(self.topics[:self.maximum])}
+        self.reset()
+
+    def reset(self):
+        """Alias cũ mất hiệu lực (kết nối mới / mất kết nối)"""
+        self._announced.clear()
+
+    def apply(self, topic: str, qos: int, properties: Optional[Properties] = None) -> Tuple[str, Optional[Properties]]:
+        """
+        Topic + properties dùng cho `client.publish`
+
+        Returns:
+            (topic hoặc "" nếu chỉ gửi alias, properties có TopicAlias)
+        """
+        alias = self._aliases.get(topic)
+        if alias is None:
+            return topic, properties
+        if properties is None:
+            properties = Properties(PacketTypes.PUBLISH)
+        properties.TopicAlias = alias
+        if alias in self._announced and qos == 0:
+            self.saved_bytes += len(topic.encode("utf-8"))
+            return "", properties
+        self._announced.add(alias)
+        return topic, properties
+
+    def get_stats(self) -> dict:
+        return {
+            'maximum': self.maximum,
+            'aliases': len(self._aliases),
+            'saved_bytes': self.saved_bytes,
+        }
@@ -5,15 +5,204 @@ Voice Streaming
 
 import base64
 import time
+from typing import List, Optional, Tuple
 from config import *
 from container import container
 from module.voice_mic import VoiceStreamer as BaseVoiceStreamer
 from log import setup_logger
 from module.voice_speaker import VoiceSpeaker
+from module.audio_codec import OpusEncoder, chunk_opus_packets
+from .audio_frame import CODEC_IDS, audio_frame_properties, binary_topic, new_stream_id, pack_audio_frame
+
+try:
+    from config import MQTT_AUDIO_BINARY
+except ImportError:
+    # Mặc định giữ định dạng JSON + base64 cho tới khi server hỗ trợ topic `.../audio/bin`
+    MQTT_AUDIO_BINARY = False
+
+try:
+    from config import AUDIO_UPLINK_FORMAT, AUDIO_OPUS_BITRATE
+except ImportError:
+    AUDIO_UPLINK_FORMAT = "pcm16le"  # "pcm16le" hoặc "opus"
+    AUDIO_OPUS_BITRATE = 24000
+
+try:
+    from config import VOICE_STREAMING_UPLOAD, AUDIO_STREAM_FLUSH_MS
+except ImportError:
+    VOICE_STREAMING_UPLOAD = False  # Gửi audio từng phần trong khi người dùng đang nói
+    AUDIO_STREAM_FLUSH_MS = 300     # Độ trễ tối đa trước khi gửi phần audio đang chờ
+
+AUDIO_CHUNK_BYTES = 1024 * 8  # 8KB per chunk
 
 logger = setup_logger(__name__)
 
 
+class SpeechUplinkStream:
+    """
+    Gửi một câu nói lên server theo từng phần trong khi người dùng còn đang nói.
+
+    Mỗi chunk được gửi khi đủ AUDIO_CHUNK_BYTES hoặc khi audio đang chờ dài hơn
+    AUDIO_STREAM_FLUSH_MS. Vì chưa biết trước tổng số chunk, các chunk trung gian
+    có totalChunks = 0; chunk cuối cùng (finish/abort) là marker "end of stream"
+    với isLast = True và totalChunks thực tế.
+
+    Opus encoder không khởi tạo / mã hoá được (thiếu PyAV, libopus) thì chuyển
+    sang pcm16le như `_encode_chunks`, nếu chưa gửi chunk nào; đã gửi rồi thì
+    huỷ stream để server không ghép lẫn hai định dạng.
+    """
+
+    def __init__(self, mqtt_client, format_audio: str = "pcm16le"):
+        self.mqtt_client = mqtt_client
+        self.format = format_audio
+        self.binary = MQTT_AUDIO_BINARY
+        # MQTT v5 (khi không dùng binary frame): audio thô, metadata trong properties
+        self.v5 = not self.binary and getattr(mqtt_client, "v5", False)
+        self.stream_id = new_stream_id() if self.binary or self.v5 else f"voice_{int(time.time() * 1000)}"
+        self._encoder = None
+        if format_audio == "opus":
+            try:
+                self._encoder = OpusEncoder(AUDIO_SAMPLE_RATE, bitrate=AUDIO_OPUS_BITRATE)
+            except Exception as e:
+                logger.error(f"❌ Opus encoder unavailable, streaming pcm16le: {e}", exc_info=True)
+                self.format = "pcm16le"
+        self._unsent_pcm = bytearray()  # PCM gốc của các packet Opus chưa gửi (để chuyển sang pcm16le)
+        self._pending = bytearray()
+        self._pending_packets: List[bytes] = []
+        self._pending_bytes = 0
+        self._pending_samples = 0
+        self._flush_samples = int(AUDIO_SAMPLE_RATE * AUDIO_STREAM_FLUSH_MS / 1000)
+        self._chunk_index = 0
+        self._closed = False
+        self.rejected = False  # Publisher từ chối chunk (back-pressure) - stream đã bị huỷ
+        self.started_at = time.time()
+
+    def write(self, pcm: bytes):
+        """Thêm PCM int16 vào stream, gửi ngay các chunk đã đủ điều kiện"""
+        if self._closed:
+            return
+        self._pending_samples += len(pcm) // 2
+        if self._encoder is not None:
+            try:
+                packets = self._encoder.encode(pcm)
+            except Exception as e:
+                self._encoder_failed(e)
+            else:
+                if self._chunk_index == 0:
+                    self._unsent_pcm.extend(pcm)
+                for packet in packets:
+                    self._pending_packets.append(packet)
+                    self._pending_bytes += len(packet)
+        if self._closed:
+            return
+        if self._encoder is None:
+            self._pending.extend(pcm)
+            self._pending_bytes = len(self._pending)
+
+        if self._pending_bytes >= AUDIO_CHUNK_BYTES or self._pending_samples >= self._flush_samples:
+            self._flush(is_last=False)
+
+    def finish(self):
+        """Gửi phần còn lại kèm marker kết thúc stream"""
+        if self._closed:
+            return
+        if self._encoder is not None:
+            try:
+                self._pending_packets.extend(self._encoder.flush())
+            except Exception as e:
+                self._encoder_failed(e)
+                if self._closed:
+                    return
+        self._flush(is_last=True)
+        if self._closed:
+            return  # Bị huỷ vì publisher từ chối chunk
+        self._closed = True
+        logger.info(f"Streamed {self._chunk_index} chunks to MQTT "
+                    f"({time.time() - self.started_at:.1f}s after speech start)")
+
+    def abort(self):
+        """Huỷ stream (câu nói quá ngắn hoặc VAD bị tạm dừng giữa chừng)"""
+        if self._closed:
+            return
+        self._pending.clear()
+        self._pending_packets.clear()
+        self._unsent_pcm.clear()
+        self._closed = True
+        if not self._send(b"", is_last=True, is_aborted=True):
+            logger.warning(f"⚠️ Abort marker of speech stream {self.stream_id} was not queued")
+        logger.info(f"Aborted speech stream {self.stream_id}")
+
+    def _encoder_failed(self, error: Exception):
+        """Opus lỗi giữa chừng: chuyển sang pcm16le nếu chưa gửi chunk nào, nếu không thì huỷ stream"""
+        self._encoder = None
+        self._pending_packets.clear()
+        if self._chunk_index == 0:
+            logger.error(f"❌ Opus encode failed, streaming pcm16le: {error}", exc_info=True)
+            self.format = "pcm16le"
+            self._pending.extend(self._unsent_pcm)
+            self._unsent_pcm.clear()
+            return
+        logger.error(f"❌ Opus encode failed mid-stream, aborting {self.stream_id}: {error}", exc_info=True)
+        self.abort()
+
+    def _flush(self, is_last: bool):
+        if self._encoder is not None:
+            chunks = chunk_opus_packets(self._pending_packets, AUDIO_CHUNK_BYTES)
+            self._pending_packets = []
+            if chunks:
+                self._unsent_pcm.clear()
+        else:
+            data = bytes(self._pending)
+            chunks = [data[i:i + AUDIO_CHUNK_BYTES] for i in range(0, len(data), AUDIO_CHUNK_BYTES)]
+            self._pending.clear()
+        self._pending_bytes = 0
+        self._pending_samples = 0
+
+        if is_last and not chunks:
+            chunks = [b""]
+        for i, chunk in enumerate(chunks):
+            if not self._send(chunk, is_last=is_last and i == len(chunks) - 1):
+                # Không gửi tiếp phần sau: server sẽ ghép audio bị thủng ở giữa
+                self.rejected = True
+                self._chunk_index -= 1  # Marker huỷ dùng lại index của chunk bị từ chối
+                logger.warning(f"⚠️ Publish queue full, aborting speech stream {self.stream_id} "
+                               f"at chunk {self._chunk_index}")
+                self.abort()
+                return
+
+    def _send(self, chunk: bytes, is_last: bool, is_aborted: bool = False) -> bool:
+        """Publish một chunk; False nếu publisher từ chối (vượt giới hạn bộ nhớ)"""
+        index = self._chunk_index
+        self._chunk_index += 1
+        total_chunks = self._chunk_index if is_last else 0
+
+        if self.binary:
+            frame = pack_audio_frame(
+                self.stream_id, index, total_chunks, AUDIO_SAMPLE_RATE, chunk,
+                codec=CODEC_IDS[self.format], is_last=is_last, is_aborted=is_aborted)
+            return self.mqtt_client.publish_bytes(binary_topic(TOPICS['device_stt']), frame, qos=1)
+
+        if self.v5:
+            properties = audio_frame_properties(
+                self.stream_id, index, total_chunks, AUDIO_SAMPLE_RATE,
+                codec=CODEC_IDS[self.format], is_last=is_last, is_aborted=is_aborted)
+            return self.mqtt_client.publish_bytes(TOPICS['device_stt'], chunk, qos=1, properties=properties)
+
+        payload = {
+            "deviceId": DEVICE_ID,
+            "streamId": self.stream_id,
+            "chunkIndex": index,
+            "totalChunks": total_chunks,
+            "isLast": is_last,
+            "timestamp": int(time.time() * 1000),
+            "format": self.format,
+            "sampleRate": AUDIO_SAMPLE_RATE,
+            "data": base64.b64encode(chunk).decode()
+        }
+        if is_aborted:
+            payload["aborted"] = True
+        return self.mqtt_client.publish(TOPICS['device_stt'], payload, qos=1)
+
+
 class VoiceMQTT:
     """Voice recording and streaming via MQTT"""
 
@@ -21,6 +210,8 @@ class VoiceMQTT:
         self.mqtt_client = mqtt_client
         self.base_streamer = BaseVoiceStreamer(
             MIC_INDEX, sample_rate=AUDIO_SAMPLE_RATE, chunk_duration_ms=AUDIO_CHUNK_MS)
+        self._uplink: Optional[SpeechUplinkStream] = None
+        self.rejected_streams = 0  # Câu nói bị huỷ vì publisher từ chối chunk (back-pressure)
 
     def set_mqtt_client(self, mqtt_client):
         """Set MQTT client for sending audio"""
@@ -28,15 +219,56 @@ class VoiceMQTT:
 
     def start_continuous_listening(self):
         """Start continuous voice listening with VAD"""
+        if VOICE_STREAMING_UPLOAD:
+            self._start_streaming_listening()
+            return
+
         def on_speech_complete(audio_data, duration):
             logger.info(f"Speech detected: {duration:.1f}s")
             speaker: VoiceSpeaker = container.get("speaker")
-            speaker.play_file(os.path.join(BASE_DIR, "audio", "processing.wav"))
+            speaker.play_cue("processing")
             self._send_audio_chunks(audio_data)
 
         self.base_streamer.set_callbacks(on_speech_complete=on_speech_complete)
         self.base_streamer.start_listening()
 
+    def _start_streaming_listening(self):
+        """Lắng nghe với VAD và gửi audio lên server ngay trong khi người dùng đang nói"""
+        def on_speech_start():
+            self._abort_uplink()
+            if self.mqtt_client:
+                self._uplink = SpeechUplinkStream(self.mqtt_client, AUDIO_UPLINK_FORMAT)
+
+        def on_speech_data(audio_chunk, timestamp, status):
+            if self._uplink:
+                self._uplink.write(audio_chunk.tobytes())
+
+        def on_speech_complete(audio_data, duration):
+            logger.info(f"Speech detected: {duration:.1f}s")
+            if self._uplink:
+                self._uplink.finish()
+                if self._uplink.rejected:
+                    self.rejected_streams += 1
+                self._uplink = None
+            speaker: VoiceSpeaker = container.get("speaker")
+            speaker.play_cue("processing")
+
+        def on_speech_discarded(duration):
+            self._abort_uplink()
+
+        self.base_streamer.set_callbacks(
+            on_speech_start=on_speech_start,
+            on_speech_complete=on_speech_complete,
+            on_speech_data=on_speech_data,
+            on_speech_discarded=on_speech_discarded)
+        self.base_streamer.start_listening()
+
+    def _abort_uplink(self):
+        """Huỷ stream đang gửi dở (nếu có)"""
+        if self._uplink:
+            self._uplink.abort()
+            self._uplink = None
+
     def stop_continuous_listening(self):
         """Stop continuous voice listening"""
         self.base_streamer.stop_listening()
@@ -45,6 +277,7 @@ class VoiceMQTT:
         """Tạm dừng VAD (Voice Activity Detection) - Dùng khi có cuộc gọi WebRTC"""
         logger.info("⏸️ Pausing VAD for WebRTC call")
         self.base_streamer.stop_listening()
+        self._abort_uplink()
     
     def resume_vad(self):
         """Tiếp tục VAD sau khi cuộc gọi WebRTC kết thúc"""
@@ -56,30 +289,97 @@ class VoiceMQTT:
         if not self.mqtt_client:
             return
 
-        stream_id = f"voice_{int(time.time() * 1000)}"
-        chunk_size = 1024 * 8  # 8KB per chunk  
-        total_chunks = (len(audio_data) + chunk_size - 1) // chunk_size
+        format_audio, chunks = self._encode_chunks(audio_data)
+        if MQTT_AUDIO_BINARY:
+            self._send_audio_frames(format_audio, chunks)
+            return
+        if getattr(self.mqtt_client, "v5", False):
+            self._send_audio_properties(format_audio, chunks)
+            return
 
-        for i in range(total_chunks):
-            start = i * chunk_size
-            end = min(start + chunk_size, len(audio_data))
-            chunk_data = audio_data[start:end]
+        stream_id = f"voice_{int(time.time() * 1000)}"
 
+        def send(index, total_chunks, chunk_data, is_last, is_aborted):
             payload = {
                 "deviceId": DEVICE_ID,
                 "streamId": stream_id,
-                "chunkIndex": i,
+                "chunkIndex": index,
                 "totalChunks": total_chunks,
-                "isLast": (i == total_chunks - 1),
+                "isLast": is_last,
                 "timestamp": int(time.time() * 1000),
-                "format": "pcm16le",
+                "format": format_audio,
                 "sampleRate": AUDIO_SAMPLE_RATE,
                 "data": base64.b64encode(chunk_data).decode()
             }
+            if is_aborted:
+                payload["aborted"] = True
+            return self.mqtt_client.publish(TOPICS['device_stt'], payload, qos=1)
+
+        if self._publish_chunks(stream_id, chunks, send):
+            logger.info(f"Sent {len(chunks)} chunks to MQTT")
+
+    def _send_audio_frames(self, format_audio: str, chunks: List[bytes]):
+        """Send audio chunks as binary frames via MQTT (topic `.../audio/bin`)"""
+        stream_id = new_stream_id()
+        topic = binary_topic(TOPICS['device_stt'])
+        codec = CODEC_IDS[format_audio]
+
+        def send(index, total_chunks, chunk_data, is_last, is_aborted):
+            frame = pack_audio_frame(
+                stream_id, index, total_chunks, AUDIO_SAMPLE_RATE, chunk_data,
+                codec=codec, is_last=is_last, is_aborted=is_aborted)
+            return self.mqtt_client.publish_bytes(topic, frame, qos=1)
+
+        if self._publish_chunks(stream_id, chunks, send):
+            logger.info(f"Sent {len(chunks)} binary frames to MQTT")
 
-            self.mqtt_client.publish(TOPICS['device_stt'], payload, qos=1)
-        logger.info(f"Sent {total_chunks} chunks to MQTT")
+    def _send_audio_properties(self, format_audio: str, chunks: List[bytes]):
+        """Send raw audio chunks via MQTT v5, metadata in ContentType / UserProperty"""
+        stream_id = new_stream_id()
+        codec = CODEC_IDS[format_audio]
+
+        def send(index, total_chunks, chunk_data, is_last, is_aborted):
+            properties = audio_frame_properties(
+                stream_id, index, total_chunks, AUDIO_SAMPLE_RATE,
+                codec=codec, is_last=is_last, is_aborted=is_aborted)
+            return self.mqtt_client.publish_bytes(TOPICS['device_stt'], chunk_data, qos=1, properties=properties)
+
+        if self._publish_chunks(stream_id, chunks, send):
+            logger.info(f"Sent {len(chunks)} raw audio chunks (MQTT v5 properties) to MQTT")
+
+    def _publish_chunks(self, stream_id, chunks: List[bytes], send) -> bool:
+        """
+        Gửi lần lượt các chunk qua `send(index, total_chunks, data, is_last, is_aborted) -> bool`.
+        Publisher từ chối một chunk (back-pressure) thì dừng và gửi marker huỷ stream thay
+        cho chunk đó, để server không ghép audio bị thủng ở giữa.
+        """
+        total_chunks = len(chunks)
+        for i, chunk_data in enumerate(chunks):
+            if send(i, total_chunks, chunk_data, i == total_chunks - 1, False):
+                continue
+            self.rejected_streams += 1
+            logger.warning(f"⚠️ Publish queue full at chunk {i}/{total_chunks}, aborting speech stream {stream_id}")
+            if not send(i, i + 1, b"", True, True):
+                logger.warning(f"⚠️ Abort marker of speech stream {stream_id} was not queued")
+            return False
+        return True
+
+    def _encode_chunks(self, audio_data: bytes) -> Tuple[str, List[bytes]]:
+        """Mã hoá audio theo AUDIO_UPLINK_FORMAT và cắt thành các chunk để gửi"""
+        if AUDIO_UPLINK_FORMAT == "opus":
+            try:
+                packets = OpusEncoder(AUDIO_SAMPLE_RATE, bitrate=AUDIO_OPUS_BITRATE).encode_all(audio_data)
+                chunks = chunk_opus_packets(packets, AUDIO_CHUNK_BYTES)
+                logger.info(f"Opus encoded {len(audio_data)} -> {sum(len(c) for c in chunks)} bytes")
+                return "opus", chunks
+            except Exception as e:
+                logger.error(f"❌ Opus encode failed, falling back to pcm16le: {e}", exc_info=True)
+
+        view = memoryview(audio_data)
+        chunks = [view[i:i + AUDIO_CHUNK_BYTES] for i in range(0, len(view), AUDIO_CHUNK_BYTES)]
+        return "pcm16le", chunks
         
     def stop(self):
         """Stop voice streaming"""
-        self.base_streamer.stop_listening()
\ No newline at end of file
+        self.base_streamer.stop_listening()
+        self._abort_uplink()
\ No newline at end of file
@@ -13,7 +13,6 @@ import sys
 import platform
 from typing import Optional, Callable
 from collections import deque
-import queue
 import cv2
 import aiohttp
 
@@ -34,6 +33,15 @@ import numpy as np
 
 from log import setup_logger
 from container import container
+from .bitrate_controller import VideoQualityController
+from module.audio_dsp import AudioDSPChain
+from module.audio_device import get_audio_device
+from module.audio_registry import get_audio_registry
+
+try:
+    from config import VIDEO_ADAPTIVE_QUALITY
+except ImportError:
+    VIDEO_ADAPTIVE_QUALITY = True
 
 logger = setup_logger(__name__)
 
@@ -61,65 +69,159 @@ class SuppressALSAErrors:
 class CameraVideoTrack(MediaStreamTrack):
     """
     Video track từ CameraDirect (OpenCV)
+    
+    Chờ frame mới thật sự từ camera (event-driven) thay vì sleep rồi lấy frame mới nhất:
+    - Không gửi cùng một frame hai lần khi camera chậm hơn FPS mục tiêu
+      (trừ keep-alive khi camera không có frame mới quá `max_frame_wait` giây)
+    - Dùng lại VideoFrame trước đó thay vì convert lại frame không đổi
+    - Đếm số frame trùng (duplicate) và số frame camera bị bỏ qua (dropped)
+    
+    Độ phân giải / FPS có thể đổi lúc đang gọi qua `set_quality()` (VideoQualityController).
     """
     kind = "video"
     
-    def __init__(self, camera, fps=30):
+    def __init__(self, camera, fps=30, max_frame_wait=1.0):
         super().__init__()
         self.camera = camera
         self._pts = 0
         self._fps = fps
         self._time_base = fractions.Fraction(1, 90000)  # 90kHz clock
         self._frame_interval = 1.0 / fps
+        self._size = (640, 480)
+        self._video_enabled = True
+        self._quality_name = None
+        self._black_frame = None
+        self._max_frame_wait = max_frame_wait
         self._last_frame_time = 0
+        self._start_time = None
+        
+        # Frame đã gửi gần nhất
+        self._last_seq = 0
+        self._last_video_frame = None
+        
+        # Thống kê
+        self._frames_sent = 0
+        self._duplicate_frames = 0
+        self._dropped_frames = 0
         logger.info(f"🎥 CameraVideoTrack initialized with {fps} FPS")
     
+    def set_quality(self, step):
+        """
+        Đổi độ phân giải / FPS gửi đi
+        
+        Args:
+            step: QualityStep (width, height, fps, video_enabled)
+        """
+        self._size = (step.width, step.height)
+        self._fps = step.fps
+        self._frame_interval = 1.0 / step.fps
+        self._video_enabled = step.video_enabled
+        self._quality_name = step.name
+        self._last_video_frame = None  # Không gửi lại frame của độ phân giải cũ
+        if not step.video_enabled:
+            self._black_frame = av.VideoFrame.from_ndarray(
+                np.zeros((step.height, step.width, 3), dtype=np.uint8), format='rgb24')
+        logger.info(f"🎥 Video quality: {step.name} ({step.width}x{step.height}@{step.fps})")
+    
+    def _next_pts(self) -> int:
+        """PTS theo thời gian thực (90kHz), luôn tăng"""
+        now = time.monotonic()
+        if self._start_time is None:
+            self._start_time = now
+        pts = int((now - self._start_time) * 90000)
+        self._pts = max(pts, self._pts + 1)
+        return self._pts
+    
     async def recv(self):
-        """Nhận frame từ camera và convert sang VideoFrame"""
-        # FPS control
+        """Chờ frame mới từ camera và convert sang VideoFrame"""
+        # Giới hạn FPS tối đa
         current_time = time.time()
         elapsed = current_time - self._last_frame_time
         if elapsed < self._frame_interval:
             await asyncio.sleep(self._frame_interval - elapsed)
         
-        # Lấy frame từ camera
-        frame_bgr = self.camera.get_latest_frame()
-        if frame_bgr is None:
-            # Return white frame nếu chưa có frame
-            frame_bgr = np.full((480, 640, 3), 255, dtype=np.uint8)
-            if self._pts % 90 == 0:  # Log mỗi 3 giây (30fps * 3)
-                logger.warning("⚠️ Camera frame is None, sending white frame")
+        if not self._video_enabled:
+            # Audio-only: frame đen rất nhỏ để giữ track, bỏ qua frame camera
+            self._last_seq = self.camera.frame_seq
+            return self._stamp(self._black_frame)
         
-        # Convert BGR (OpenCV) sang RGB (WebRTC)
-        frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+        # Chờ frame mới hơn frame đã gửi - view được camera cache, chỉ tính một lần mỗi frame
+        views = await self.camera.wait_for_frame_async(self._last_seq, timeout=self._max_frame_wait)
         
-        # Resize nếu cần (để đảm bảo kích thước phù hợp)
-        height, width = frame_rgb.shape[:2]
-        if width != 640 or height != 480:
-            frame_rgb = cv2.resize(frame_rgb, (640, 480))
+        if views is not None:
+            if self._last_seq:
+                # Các frame camera ra đời giữa hai lần gửi mà không được gửi
+                self._dropped_frames += max(0, views.seq - self._last_seq - 1)
+            self._last_seq = views.seq
+            # Camera YUV: yuv420p trực tiếp; camera BGR: rgb24 như cũ
+            video_frame = views.video_frame(self._size)
+            self._last_video_frame = video_frame
+        elif self._last_video_frame is not None:
+            # Camera không có frame mới: gửi lại frame trước (keep-alive), không convert lại
+            video_frame = self._last_video_frame
+            self._duplicate_frames += 1
+        else:
+            # Return white frame nếu chưa có frame
+            video_frame = av.VideoFrame.from_ndarray(
+                np.full((480, 640, 3), 255, dtype=np.uint8), format='rgb24')
+            if self._frames_sent % 3 == 0:
+                logger.warning("⚠️ Camera frame is None, sending white frame")
         
-        # Tạo VideoFrame từ numpy array
-        video_frame = av.VideoFrame.from_ndarray(frame_rgb, format='rgb24')
-        video_frame.pts = self._pts
+        return self._stamp(video_frame)
+    
+    def _stamp(self, video_frame):
+        """Gán PTS và cập nhật thống kê cho frame sắp gửi"""
+        video_frame.pts = self._next_pts()
         video_frame.time_base = self._time_base
-        
-        # Tăng timestamp
-        self._pts += int(self._frame_interval * 90000)  # 90kHz clock
         self._last_frame_time = time.time()
+        self._frames_sent += 1
         
-        # Debug log mỗi 30 frames (1 giây)
-        if self._pts % (90000 * 1) == 0:
-            logger.debug(f"📹 Video frame sent: pts={self._pts}, size={width}x{height}")
+        # Debug log mỗi 30 frames
+        if self._frames_sent % 30 == 0:
+            logger.debug(f"📹 Video frames sent: {self._frames_sent}, pts={self._pts}, "
+                         f"duplicate={self._duplicate_frames}, dropped={self._dropped_frames}")
         
         return video_frame
+    
+    def get_stats(self) -> dict:
+        """Thống kê frame đã gửi / trùng / bị bỏ qua"""
+        return {
+            'frames_sent': self._frames_sent,
+            'duplicate_frames': self._duplicate_frames,
+            'dropped_frames': self._dropped_frames,
+            'last_seq': self._last_seq,
+            'target_fps': self._fps,
+            'size': self._size,
+            'quality': self._quality_name
+        }
 
 
 class PyAudioSourceTrack(MediaStreamTrack):
-    """Audio track sử dụng PyAudio (tương tự audio_handler.py)"""
+    """
+    Audio track sử dụng PyAudio (tương tự audio_handler.py)
+    
+    Callback PortAudio chuyển dữ liệu sang event loop bằng `call_soon_threadsafe`
+    vào một asyncio.Queue (không dùng thread pool). Queue đầy thì bỏ chunk cũ nhất.
+    PTS lấy theo `input_buffer_adc_time` của PortAudio (đồng hồ capture thật),
+    fallback về bộ đếm mẫu nếu driver không cung cấp.
+
+    Nếu có `device_manager` (AudioDeviceManager dùng chung), track chỉ đăng ký
+    làm subscriber của stream duplex thay vì tự mở device.
+    """
     kind = "audio"
+    
+    # Lệch quá mức này giữa PTS theo ADC và bộ đếm mẫu thì đồng bộ lại (giây)
+    MAX_CLOCK_DRIFT = 1.0
 
-    def __init__(self, rate=48000, channels=1, frames_per_buffer=960, device_index=None, gain=1.0, noise_gate=0):
+    def __init__(self, rate=48000, channels=1, frames_per_buffer=960, device_index=None, gain=1.0, noise_gate=0,
+                 device_manager=None):
         super().__init__()
+        self._device_manager = device_manager
+        if device_manager is not None:
+            # Stream dùng chung quyết định định dạng: mono, sample rate / block của manager
+            rate = device_manager.sample_rate
+            channels = 1
+            frames_per_buffer = device_manager.blocksize
         self._rate = rate
         self._channels = channels
         self._chunk = frames_per_buffer
@@ -127,8 +229,24 @@ class PyAudioSourceTrack(MediaStreamTrack):
         self._pts = 0
         self._gain = gain
         self._noise_gate = noise_gate
-        self._queue = queue.Queue(maxsize=100)
+        self._dsp = AudioDSPChain(frame_size=frames_per_buffer * channels, gain=gain, noise_gate=noise_gate)
+        self._queue = asyncio.Queue(maxsize=100)
         self._frame_count = 0
+        self._dropped_chunks = 0
+        # Event loop nhận dữ liệu từ callback (track được tạo trong event loop của WebRTC)
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        # Mốc đồng hồ capture: (adc_time đầu tiên, pts tương ứng)
+        self._adc_origin = None
+        self._last_pts = -1
+        self._subscriber_name = f"webrtc-mic-{id(self)}"
+
+        if device_manager is not None:
+            device_manager.subscribe(self._subscriber_name, self._on_shared_audio)
+            logger.info(f"🎤 Using shared audio device with gain={self._gain}x, rate={self._rate}, noise_gate={self._noise_gate}")
+            return
 
         try:
             import pyaudio
@@ -139,37 +257,15 @@ class PyAudioSourceTrack(MediaStreamTrack):
             selected_rate = rate
             
             if device_index is not None:
-                # Test requested rate first
-                rate_supported = False
-                try:
-                    if self._pa.is_format_supported(
-                        rate,
-                        input_device=device_index,
-                        input_channels=channels,
-                        input_format=pyaudio.paInt16
-                    ):
-                        rate_supported = True
-                except Exception:
-                    pass
-                
-                # If not supported, try alternatives
-                if not rate_supported:
+                # Sample rate hỗ trợ lấy từ registry (đã dò khi khởi động), không hỏi lại PortAudio
+                device_rates = get_audio_registry().supported_rates(device_index, kind='input')
+                if device_rates and rate not in device_rates:
                     for test_rate in supported_rates:
-                        if test_rate == rate:
-                            continue
-                        try:
-                            if self._pa.is_format_supported(
-                                test_rate,
-                                input_device=device_index,
-                                input_channels=channels,
-                                input_format=pyaudio.paInt16
-                            ):
-                                selected_rate = test_rate
-                                logger.info(f"⚠️ Rate {rate} not supported, using {selected_rate}")
-                                self._rate = selected_rate
-                                break
-                        except Exception:
-                            continue
+                        if test_rate != rate and test_rate in device_rates:
+                            selected_rate = test_rate
+                            logger.info(f"⚠️ Rate {rate} not supported, using {selected_rate}")
+                            self._rate = selected_rate
+                            break
             
             stream_kwargs = {
                 'format': pyaudio.paInt16,
@@ -193,55 +289,75 @@ class PyAudioSourceTrack(MediaStreamTrack):
             raise
 
     def _on_audio(self, in_data, frame_count, time_info, status_flags):
-        try:
-            self._queue.put_nowait(in_data)
-        except queue.Full:
-            # Drop oldest to make room
+        # Chạy trên thread của PortAudio: chỉ chuyển dữ liệu sang event loop
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            adc_time = (time_info or {}).get('input_buffer_adc_time', 0.0)
             try:
-                _ = self._queue.get_nowait()
-            except Exception:
-                pass
+                loop.call_soon_threadsafe(self._enqueue, in_data, adc_time)
+            except RuntimeError:
+                pass  # Event loop đã đóng
+        return (None, 0)
+
+    def _on_shared_audio(self, pcm, adc_time):
+        # Chạy trên thread audio của AudioDeviceManager: pcm chỉ hợp lệ trong callback nên copy ra bytes
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._enqueue, pcm.tobytes(), adc_time)
+            except RuntimeError:
+                pass  # Event loop đã đóng
+
+    def _enqueue(self, data, adc_time):
+        """Chạy trong event loop: đưa chunk vào queue, bỏ chunk cũ nhất khi đầy"""
+        if self._queue.full():
             try:
-                self._queue.put_nowait(in_data)
-            except Exception:
+                self._queue.get_nowait()
+                self._dropped_chunks += 1
+            except asyncio.QueueEmpty:
                 pass
-        return (None, 0)
+        self._queue.put_nowait((data, adc_time))
+
+    def _capture_pts(self, adc_time: float) -> int:
+        """PTS theo đồng hồ capture của PortAudio, luôn tăng"""
+        counter_pts = self._pts
+        if adc_time and adc_time > 0:
+            if self._adc_origin is None:
+                self._adc_origin = (adc_time, counter_pts)
+            origin_time, origin_pts = self._adc_origin
+            pts = origin_pts + int(round((adc_time - origin_time) * self._rate))
+            if abs(pts - counter_pts) > self.MAX_CLOCK_DRIFT * self._rate:
+                # Đồng hồ nhảy (ví dụ stream bị restart): đồng bộ lại mốc
+                self._adc_origin = (adc_time, counter_pts)
+                pts = counter_pts
+        else:
+            pts = counter_pts
+        return max(pts, self._last_pts + 1)
 
     async def recv(self):
         # Wait for next chunk of audio from the callback
-        loop = asyncio.get_running_loop()
-        data = await loop.run_in_executor(None, self._queue.get)
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        data, adc_time = await self._queue.get()
         
         self._frame_count += 1
         
-        # Apply gain and noise gate
-        if self._gain != 1.0 or self._noise_gate > 0:
-            # Convert to numpy for processing
-            samples = np.frombuffer(data, dtype=np.int16).copy()
+        # Apply gain and noise gate (in-place trên buffer cấp phát sẵn của DSP chain)
+        if self._dsp.is_active:
+            samples = np.frombuffer(data, dtype=np.int16)
             
             # Log audio levels every 100 frames (~2 seconds at 48kHz/960 buffer)
             if self._frame_count % 100 == 1:
-                rms_before = np.sqrt(np.mean(samples.astype(np.float32) ** 2))
-                max_before = np.max(np.abs(samples))
+                rms_before, max_before = self._dsp.levels(samples)
                 logger.info(f"🎤 Audio levels BEFORE gain: RMS={rms_before:.0f}, Max={max_before}, Gain={self._gain}x")
             
-            # Apply gain
-            if self._gain != 1.0:
-                samples = samples.astype(np.float32) * self._gain
-            
-            # Noise gate: suppress very quiet signals (reduce hiss/noise)
-            if self._noise_gate > 0:
-                samples[np.abs(samples) < self._noise_gate] = 0
+            # Gain -> noise gate -> clip
+            data = self._dsp.process(samples)
             
             # Log audio levels after gain
             if self._frame_count % 100 == 1:
-                rms_after = np.sqrt(np.mean(samples ** 2))
-                max_after = np.max(np.abs(samples))
+                rms_after, max_after = self._dsp.levels(data)
                 logger.info(f"🔊 Audio levels AFTER gain: RMS={rms_after:.0f}, Max={max_after:.0f}, NoiseGate={self._noise_gate}")
-            
-            # Clip to prevent distortion
-            samples = np.clip(samples, -32768, 32767).astype(np.int16)
-            data = samples.tobytes()
         
         # Create an AudioFrame from raw int16 PCM
         frame = av.AudioFrame(
@@ -249,15 +365,18 @@ class PyAudioSourceTrack(MediaStreamTrack):
             layout="mono" if self._channels == 1 else "stereo",
             samples=self._chunk,
         )
-        frame.pts = self._pts
+        frame.pts = self._capture_pts(adc_time)
         frame.sample_rate = self._rate
         frame.time_base = self._time_base
         # Update plane with raw bytes
         frame.planes[0].update(data)
-        self._pts += self._chunk
+        self._last_pts = frame.pts
+        self._pts = frame.pts + self._chunk
         return frame
 
     def stop(self):
+        if self._device_manager is not None:
+            self._device_manager.unsubscribe(self._subscriber_name)
         try:
             if hasattr(self, "_stream") and self._stream:
                 self._stream.stop_stream()
@@ -302,6 +421,9 @@ class WebRTCManager:
         self.video_player = None
         self.audio_player = None
         
+        # Điều chỉnh chất lượng video theo đường truyền
+        self.quality_controller: Optional[VideoQualityController] = None
+        
         # ICE candidates buffer
         self.pending_ice_candidates = deque()
         
@@ -423,6 +545,13 @@ class WebRTCManager:
             }
             logger.info(f"{emoji.get(state, '❓')} Connection state: {state}")
             
+            if state == "connected" and VIDEO_ADAPTIVE_QUALITY and self.video_player and not self.quality_controller:
+                self.quality_controller = VideoQualityController(self.pc, self.video_player)
+                self.quality_controller.start()
+            elif state in ("failed", "closed") and self.quality_controller:
+                self.quality_controller.stop()
+                self.quality_controller = None
+            
             if self.on_connection_state_change:
                 try:
                     if asyncio.iscoroutinefunction(self.on_connection_state_change):
@@ -617,40 +746,23 @@ class WebRTCManager:
                     mic_gain = 1  # Giảm gain xuống 60% để tránh distortion/noise
                     noise_gate = 0  # Lọc noise dưới 200 (giảm tiếng hú/hiss)
                 
+                audio_device = get_audio_device()
+                if audio_device is not None:
+                    # Device dùng chung đã mở sẵn: không cần tìm device hay retry khi device bận
+                    audio_track = PyAudioSourceTrack(gain=mic_gain, noise_gate=noise_gate,
+                                                     device_manager=audio_device)
+                    self.pc.addTrack(audio_track)
+                    self.audio_player = audio_track
+                    logger.info(f"✅ Audio track added from shared audio device (rate={audio_device.sample_rate}, gain={mic_gain}x)")
+                    return
+
                 # 🎤 Jetson Nano: Tìm USB Audio Device (card 3) cho microphone
                 mic_device_index = None
                 if platform.system() == "Linux":
-                    try:
-                        import pyaudio
-                        pa = pyaudio.PyAudio()
-                        
-                        # Find USB Audio Device with input channels
-                        with SuppressALSAErrors():
-                            try:
-                                info = pa.get_host_api_info_by_index(0)
-                                numdevices = info.get('deviceCount', 0)
-                                for i in range(numdevices):
-                                    try:
-                                        device_info = pa.get_device_info_by_host_api_device_index(0, i)
-                                        name = device_info.get('name', '')
-                                        max_in = device_info.get('maxInputChannels', 0)
-                                        
-                                        # Look for USB Audio Device or hw:3,0 with input
-                                        if (max_in > 0 and 
-                                            ('USB Audio Device' in name or 'hw:3,0' in name)):
-                                            mic_device_index = i
-                                            logger.info(f"🎤 Found USB mic device: {name} (index={i})")
-                                            break
-                                    except Exception:
-                                        continue
-                            except Exception as e:
-                                logger.warning(f"Could not enumerate audio devices: {e}")
-                        
-                        pa.terminate()
-                    except ImportError:
-                        logger.warning("PyAudio not available, cannot find USB mic device")
-                    except Exception as e:
-                        logger.warning(f"Error finding USB mic device: {e}")
+                    # Tra cứu trong registry đã dò sẵn - không enumerate PyAudio mỗi cuộc gọi
+                    mic_device_index = get_audio_registry().find(("USB Audio Device", "hw:3,0"), kind='input')
+                    if mic_device_index is not None:
+                        logger.info(f"🎤 Found USB mic device (index={mic_device_index})")
                 
                 # ✅ Tạo audio track với retry logic nếu device bận
                 max_retries = 3
@@ -1059,6 +1171,10 @@ class WebRTCManager:
     async def close(self):
         """Đóng peer connection"""
         try:
+            if self.quality_controller:
+                self.quality_controller.stop()
+                self.quality_controller = None
+            
             if self.pc and self.pc.connectionState != "closed":
                 await self.pc.close()
                 logger.info("🔒 Peer connection closed")
@@ -0,0 +1,115 @@
+"""
+Benchmark Audio DSP
+===================
+
+So sánh chi phí mỗi frame 20 ms của chuỗi gain / AGC / compressor / limiter:
+code cũ trong `_handle_incoming_audio` (mảng tạm mỗi bước) và AudioDSPChain
+(buffer cấp phát sẵn, ufunc `out=`).
+
+Cấp phát mỗi frame được đo bằng tracemalloc (numpy báo cáo cấp phát buffer
+dữ liệu cho tracemalloc): byte cấp phát tạm tối đa trong khi xử lý một frame
+và số mảng mới còn được giữ sau frame (kết quả trả về).
+
+Chạy (từ thư mục device/):
+    python scripts/bench_audio_dsp.py [--frames 5000] [--frame-size 960]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.audio_dsp import AudioDSPChain
+
+GAIN = 0.3
+TARGET_RMS = 5000.0
+MAX_GAIN = 2.0
+MAX_GAIN_TOTAL = 3.0
+DRIVE = 2.0
+
+
+def legacy_process(pcm):
+    """Code cũ của MessageHandler._handle_incoming_audio (AGC + compressor bật)"""
+    applied_gain = GAIN
+    rms = float(np.sqrt(np.mean(pcm.astype(np.float32) ** 2)) + 1e-6)
+    if rms > 200.0:
+        agc_gain = TARGET_RMS / rms
+        if agc_gain < 1.0:
+            agc_gain = 1.0
+        agc_gain = min(agc_gain, MAX_GAIN)
+        applied_gain = min(applied_gain * agc_gain, MAX_GAIN_TOTAL)
+    x = pcm.astype(np.float32) / 32768.0
+    x = x * applied_gain
+    x = np.tanh(DRIVE * x) / np.tanh(DRIVE)
+    x = np.clip(x, -1.0, 1.0)
+    return (x * 32767.0).astype(np.int16)
+
+
+def count_allocations(fn, frames):
+    """
+    (số block còn giữ / frame, KiB cấp phát tạm tối đa / frame) theo tracemalloc.
+
+    Mảng tạm được giải phóng ngay trong frame nên không còn trong snapshot; dùng
+    peak của tracemalloc (reset mỗi frame) để đo tổng byte cấp phát đồng thời.
+    """
+    fn(frames[0])  # warm-up: buffer cấp phát sẵn không tính
+    sample = frames[:500]
+    tracemalloc.start()
+    blocks = 0
+    peak_total = 0
+    for pcm in sample:
+        before = tracemalloc.take_snapshot()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn(pcm)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - current
+        after = tracemalloc.take_snapshot()
+        blocks += sum(stat.count_diff for stat in after.compare_to(before, "lineno") if stat.count_diff > 0)
+        del result
+    tracemalloc.stop()
+    n = len(sample)
+    return blocks / n, peak_total / n / 1024
+
+
+def time_per_frame(fn, frames):
+    fn(frames[0])
+    start = time.perf_counter()
+    for pcm in frames:
+        fn(pcm)
+    return (time.perf_counter() - start) / len(frames) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark playback DSP chain")
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--frame-size", type=int, default=960, help="Số mẫu mỗi frame (960 = 20 ms @ 48 kHz)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [np.clip(rng.normal(0, 3000, args.frame_size), -32768, 32767).astype(np.int16)
+              for _ in range(64)]
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+
+    chain = AudioDSPChain(frame_size=args.frame_size, gain=GAIN, auto_gain=True,
+                          target_rms=TARGET_RMS, max_agc_gain=MAX_GAIN,
+                          max_total_gain=MAX_GAIN_TOTAL, compressor_drive=DRIVE)
+
+    # Kết quả phải khớp code cũ (sai khác tối đa 1 LSB do làm tròn float32)
+    diff = int(np.max(np.abs(legacy_process(frames[0]).astype(np.int32) - chain.process(frames[0]))))
+    print(f"Max difference vs legacy: {diff} LSB")
+
+    print(f"Frame: {args.frame_size} samples, AGC + compressor + limiter")
+    for name, fn in (("legacy", legacy_process), ("dsp chain", chain.process)):
+        us = time_per_frame(fn, frames)
+        blocks, kib = count_allocations(fn, frames)
+        print(f"{name:<10} {us:8.1f} µs/frame  {kib:7.1f} KiB allocated/frame  {blocks:5.1f} new arrays kept/frame")
+
+
+if __name__ == "__main__":
+    main()
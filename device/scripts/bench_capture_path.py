@@ -0,0 +1,100 @@
+"""
+Benchmark Capture Path
+======================
+
+So sánh CPU time mỗi frame từ lúc camera trả frame tới khi có av.VideoFrame
+yuv420p 640x480 cho encoder VP8/H264:
+
+- bgr  (cũ): YUYV -> BGR (OpenCV CONVERT_RGB) -> RGB -> resize -> rgb24 VideoFrame -> yuv420p (aiortc)
+- yuyv (mới): YUYV -> yuyv422 VideoFrame -> reformat yuv420p 640x480 (một lần swscale)
+- i420 (mới): I420 (GStreamer jpegdec) -> yuv420p VideoFrame -> reformat 640x480
+
+Chạy trên thiết bị (từ thư mục device/):
+    python scripts/bench_capture_path.py [--frames 300] [--width 1920 --height 1080]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import av
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.camera.frame_views import FrameViews, PIXEL_FORMAT_BGR, PIXEL_FORMAT_I420, PIXEL_FORMAT_YUYV
+
+OUT_SIZE = (640, 480)
+
+
+def make_yuyv(width, height, seed):
+    rng = np.random.default_rng(seed)
+    # Ảnh có cấu trúc (gradient + nhiễu) để resize / convert không bị tối ưu bất thường
+    gradient = np.linspace(16, 235, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    y = np.clip(gradient + rng.normal(0, 8, (height, width)), 0, 255).astype(np.uint8)
+    uv = rng.integers(96, 160, (height, width), dtype=np.uint8)
+    return np.dstack([y, uv])
+
+
+def legacy_path(yuyv):
+    """Đường cũ: OpenCV convert sang BGR, track convert BGR->RGB, resize, aiortc convert sang yuv420p"""
+    bgr = cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV)
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    rgb = cv2.resize(rgb, OUT_SIZE)
+    frame = av.VideoFrame.from_ndarray(rgb, format="rgb24")
+    return frame.reformat(format="yuv420p")
+
+
+def bgr_views_path(yuyv):
+    """Camera BGR với FrameViews (OpenCV vẫn convert sang BGR khi capture)"""
+    bgr = cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV)
+    return FrameViews(bgr, pixel_format=PIXEL_FORMAT_BGR).video_frame(OUT_SIZE).reformat(format="yuv420p")
+
+
+def yuyv_path(yuyv):
+    return FrameViews(yuyv, pixel_format=PIXEL_FORMAT_YUYV).video_frame(OUT_SIZE)
+
+
+def i420_path(i420):
+    return FrameViews(i420, pixel_format=PIXEL_FORMAT_I420).video_frame(OUT_SIZE)
+
+
+def bench(name, fn, frames):
+    fn(frames[0])  # warm-up
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for frame in frames:
+        fn(frame)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    n = len(frames)
+    print(f"{name:<14} {cpu / n * 1000:8.2f} ms CPU/frame  {wall / n * 1000:8.2f} ms wall/frame")
+    return cpu / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark camera capture -> VideoFrame path")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+
+    distinct = 8  # Vài frame khác nhau lặp lại, tránh cache CPU quá "đẹp" mà không tốn bộ nhớ
+    yuyv_frames = [make_yuyv(args.width, args.height, seed) for seed in range(distinct)]
+    i420_frames = [cv2.cvtColor(cv2.cvtColor(f, cv2.COLOR_YUV2BGR_YUYV), cv2.COLOR_BGR2YUV_I420)
+                   for f in yuyv_frames]
+    yuyv_frames = [yuyv_frames[i % distinct] for i in range(args.frames)]
+    i420_frames = [i420_frames[i % distinct] for i in range(args.frames)]
+
+    print(f"Capture {args.width}x{args.height} -> yuv420p {OUT_SIZE[0]}x{OUT_SIZE[1]}, {args.frames} frames")
+    legacy = bench("bgr (legacy)", legacy_path, yuyv_frames)
+    bench("bgr (views)", bgr_views_path, yuyv_frames)
+    yuyv = bench("yuyv", yuyv_path, yuyv_frames)
+    i420 = bench("i420", i420_path, i420_frames)
+    print(f"Speedup vs legacy: yuyv x{legacy / yuyv:.1f}, i420 x{legacy / i420:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark MQTT v5 Overhead
+==========================
+
+So sánh số byte gói PUBLISH (uplink, tính cả fixed header, topic, packet id,
+properties) giữa:
+
+- v3.1.1 JSON: metadata + base64 trong JSON (đường mặc định hiện tại)
+- v3.1.1 binary frame: header 26 byte + audio thô (MQTT_AUDIO_BINARY)
+- v5: audio thô, metadata trong ContentType / UserProperty; topic alias cho
+  message QoS0 (GPS)
+
+cho hai kịch bản:
+
+1. Một phiên gửi giọng nói: N câu nói, streaming upload (flush mỗi
+   AUDIO_STREAM_FLUSH_MS, chunk tối đa 8 KB), PCM16 hoặc Opus
+2. GPS trace 10 phút (QoS0, mỗi `--gps-interval` giây)
+
+Kích thước gói được tính theo đặc tả MQTT, không cần broker.
+
+Chạy (từ thư mục device/):
+    python scripts/bench_mqtt_v5_overhead.py [--utterances 10] [--seconds 4] [--format opus] [--gps-interval 5]
+"""
+
+import argparse
+import base64
+import json
+import time
+
+AUDIO_CHUNK_BYTES = 1024 * 8
+FRAME_HEADER_BYTES = 26  # mqtt/audio_frame.py AUDIO_FRAME_HEADER
+FLAG_LAST = 0x0001
+
+
+def varint_len(value: int) -> int:
+    length = 1
+    while value >= 128:
+        value >>= 7
+        length += 1
+    return length
+
+
+def publish_size(topic: str, payload_len: int, qos: int, v5: bool = False, properties_len: int = 0) -> int:
+    """Kích thước một gói PUBLISH"""
+    remaining = 2 + len(topic.encode()) + (2 if qos else 0) + payload_len
+    if v5:
+        remaining += varint_len(properties_len) + properties_len
+    return 1 + varint_len(remaining) + remaining
+
+
+def string_property_len(value: str) -> int:
+    return 1 + 2 + len(value.encode())
+
+
+def user_property_len(key: str, value: str) -> int:
+    return 1 + 2 + len(key.encode()) + 2 + len(value.encode())
+
+
+TOPIC_ALIAS_PROPERTY_LEN = 3
+
+
+def audio_chunks(utterances: int, seconds: float, sample_rate: int, fmt: str, bitrate: int, flush_ms: int):
+    """Kích thước các chunk của mỗi câu nói khi streaming upload"""
+    if fmt == "opus":
+        bytes_per_second = bitrate // 8 + 50 * 2  # + length prefix 2 byte mỗi packet 20 ms
+    else:
+        bytes_per_second = sample_rate * 2
+    flush_bytes = max(1, bytes_per_second * flush_ms // 1000)
+    for _ in range(utterances):
+        total = int(bytes_per_second * seconds)
+        sizes = []
+        while total > 0:
+            pending = min(total, flush_bytes)
+            total -= pending
+            while pending > 0:
+                sizes.append(min(pending, AUDIO_CHUNK_BYTES))
+                pending -= sizes[-1]
+        yield sizes
+
+
+def voice_session(args):
+    topic = f"device/{args.device_id}/stt"
+    stream_id = int(time.time() * 1000)
+    results = {"v3 JSON": 0, "v3 binary frame": 0, "v5 properties": 0}
+    messages = 0
+    for sizes in audio_chunks(args.utterances, args.seconds, args.rate, args.format, args.bitrate, args.flush_ms):
+        # Chunk cuối (isLast) là marker rỗng khi streaming
+        sizes = sizes + [0]
+        for index, size in enumerate(sizes):
+            is_last = index == len(sizes) - 1
+            total_chunks = len(sizes) if is_last else 0
+            messages += 1
+
+            payload = {
+                "deviceId": args.device_id,
+                "streamId": f"voice_{stream_id}",
+                "chunkIndex": index,
+                "totalChunks": total_chunks,
+                "isLast": is_last,
+                "timestamp": stream_id + index * args.flush_ms,
+                "format": args.format,
+                "sampleRate": args.rate,
+                "data": base64.b64encode(bytes(size)).decode(),
+            }
+            results["v3 JSON"] += publish_size(topic, len(json.dumps(payload)), qos=1)
+            results["v3 binary frame"] += publish_size(topic + "/bin", FRAME_HEADER_BYTES + size, qos=1)
+
+            # QoS1: luôn gửi topic đầy đủ (alias chỉ dùng cho QoS0), alias property vẫn kèm theo
+            props = (TOPIC_ALIAS_PROPERTY_LEN
+                     + string_property_len(f"audio/{args.format};rate={args.rate}")
+                     + user_property_len("s", str(stream_id))
+                     + user_property_len("i", str(index))
+                     + user_property_len("n", str(total_chunks))
+                     + user_property_len("f", str(FLAG_LAST if is_last else 0)))
+            results["v5 properties"] += publish_size(topic, size, qos=1, v5=True, properties_len=props)
+        stream_id += 10000
+    audio_bytes = sum(sum(s) for s in audio_chunks(args.utterances, args.seconds, args.rate, args.format,
+                                                    args.bitrate, args.flush_ms))
+    return messages, audio_bytes, results
+
+
+def gps_trace(args):
+    topic = f"device/{args.device_id}/gps"
+    count = int(600 / args.gps_interval)
+    results = {"v3 JSON": 0, "v5 topic alias": 0}
+    lat, lng = 10.772109, 106.698298
+    for i in range(count):
+        lat += 0.00001
+        lng += 0.00001
+        payload = json.dumps({"latitude": lat, "longitude": lng, "speed_kmh": 4.2, "pin": 85})
+        results["v3 JSON"] += publish_size(topic, len(payload), qos=0)
+        # Lần đầu: topic đầy đủ + alias; sau đó topic rỗng + alias
+        alias_topic = topic if i == 0 else ""
+        results["v5 topic alias"] += publish_size(alias_topic, len(payload), qos=0, v5=True,
+                                                  properties_len=TOPIC_ALIAS_PROPERTY_LEN)
+    return count, results
+
+
+def print_results(title: str, messages: int, results: dict, baseline: str):
+    print(f"\n{title} ({messages} messages)")
+    base = results[baseline]
+    for name, total in results.items():
+        print(f"  {name:18s} {total:10d} bytes  {total / messages:8.1f} B/msg  {total / base * 100:6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT v3.1.1 vs v5 byte overhead")
+    parser.add_argument("--device-id", default="device-001")
+    parser.add_argument("--utterances", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=4.0, help="Độ dài mỗi câu nói")
+    parser.add_argument("--format", choices=["pcm16le", "opus"], default="pcm16le")
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--bitrate", type=int, default=24000, help="Opus bitrate")
+    parser.add_argument("--flush-ms", type=int, default=300, help="AUDIO_STREAM_FLUSH_MS")
+    parser.add_argument("--gps-interval", type=float, default=5.0, help="Chu kỳ publish GPS (giây)")
+    args = parser.parse_args()
+
+    messages, audio_bytes, results = voice_session(args)
+    print_results(f"Voice session: {args.utterances} x {args.seconds}s {args.format}, "
+                  f"{audio_bytes} audio bytes", messages, results, "v3 JSON")
+
+    count, results = gps_trace(args)
+    print_results(f"GPS trace: 10 min every {args.gps_interval}s", count, results, "v3 JSON")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark Opus Uplink
+=====================
+
+So sánh số byte truyền qua MQTT cho một câu nói (device_stt) giữa các định dạng:
+pcm16le / opus, JSON+base64 / binary frame, và đo CPU time mã hoá Opus
+trên mỗi giây audio.
+
+Chạy trên thiết bị (từ thư mục device/):
+    python scripts/bench_opus_uplink.py [speech.wav] [--rate 48000] [--bitrate 24000]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.audio_codec import OpusEncoder, chunk_opus_packets
+from mqtt.audio_frame import AUDIO_FRAME_HEADER
+
+CHUNK_BYTES = 1024 * 8
+
+
+def load_pcm(path: str, rate: int, seconds: float) -> (bytes, int):
+    """Đọc WAV mono int16, hoặc tạo tín hiệu giống giọng nói nếu không có file"""
+    if path:
+        with wave.open(path, "rb") as wf:
+            if wf.getsampwidth() != 2:
+                raise SystemExit("Chỉ hỗ trợ WAV PCM 16-bit")
+            data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+            if wf.getnchannels() > 1:
+                data = data.reshape(-1, wf.getnchannels())[:, 0]
+            return data.tobytes(), wf.getframerate()
+
+    t = np.arange(int(rate * seconds)) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+    noise = np.random.default_rng(0).normal(0, 0.02, t.size)
+    signal = (0.3 * voiced * envelope + noise) * 32767 * 0.5
+    return np.clip(signal, -32768, 32767).astype(np.int16).tobytes(), rate
+
+
+def json_bytes(chunks, format_audio: str, rate: int) -> int:
+    total = 0
+    for i, chunk in enumerate(chunks):
+        payload = {
+            "deviceId": "device-000000",
+            "streamId": "voice_1700000000000",
+            "chunkIndex": i,
+            "totalChunks": len(chunks),
+            "isLast": i == len(chunks) - 1,
+            "timestamp": 1700000000000,
+            "format": format_audio,
+            "sampleRate": rate,
+            "data": base64.b64encode(chunk).decode(),
+        }
+        total += len(json.dumps(payload))
+    return total
+
+
+def binary_bytes(chunks) -> int:
+    return sum(AUDIO_FRAME_HEADER.size + len(c) for c in chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="?", help="File WAV mono 16-bit (mặc định: tín hiệu tổng hợp)")
+    parser.add_argument("--rate", type=int, default=48000, help="Sample rate cho tín hiệu tổng hợp")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Độ dài tín hiệu tổng hợp")
+    parser.add_argument("--bitrate", type=int, default=24000, help="Opus bitrate (bps)")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần lặp để đo CPU time")
+    args = parser.parse_args()
+
+    pcm, rate = load_pcm(args.wav, args.rate, args.seconds)
+    duration = len(pcm) / 2 / rate
+
+    pcm_chunks = [pcm[i:i + CHUNK_BYTES] for i in range(0, len(pcm), CHUNK_BYTES)]
+
+    cpu = []
+    packets = []
+    for _ in range(args.repeat):
+        start = time.process_time()
+        packets = OpusEncoder(rate, bitrate=args.bitrate).encode_all(pcm)
+        cpu.append(time.process_time() - start)
+    opus_chunks = chunk_opus_packets(packets, CHUNK_BYTES)
+
+    rows = [
+        ("pcm16le json+base64", json_bytes(pcm_chunks, "pcm16le", rate), len(pcm_chunks)),
+        ("pcm16le binary", binary_bytes(pcm_chunks), len(pcm_chunks)),
+        ("opus json+base64", json_bytes(opus_chunks, "opus", rate), len(opus_chunks)),
+        ("opus binary", binary_bytes(opus_chunks), len(opus_chunks)),
+    ]
+
+    print(f"Audio: {duration:.2f}s @ {rate}Hz, raw PCM {len(pcm)} bytes, Opus {args.bitrate} bps")
+    print(f"{'format':<22}{'bytes':>10}{'bytes/s':>10}{'chunks':>8}{'vs json':>9}")
+    baseline = rows[0][1]
+    for name, total, count in rows:
+        print(f"{name:<22}{total:>10}{total / duration:>10.0f}{count:>8}{baseline / total:>8.1f}x")
+
+    best = min(cpu)
+    print(f"Opus encode CPU: {best * 1000:.1f} ms total, "
+          f"{best / duration * 1000:.2f} ms per second of audio (best of {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
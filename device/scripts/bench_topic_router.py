@@ -0,0 +1,145 @@
+"""
+Benchmark Topic Router
+======================
+
+So sánh chi phí định tuyến mỗi message:
+
+- legacy: log INFO ở `_on_message` (kèm payload với message không phải audio),
+  log "Handling ..." rồi chuỗi `topic.endswith(...)` như MessageHandler cũ
+- router: TopicRouter (dict dựng sẵn + wildcard cache) và PayloadLogSampler
+  (DEBUG, lấy mẫu)
+
+Log được ghi ra /dev/null ở mức INFO, giống thiết bị chạy thật.
+
+Mặc định dùng hỗn hợp message tổng hợp (audio chunk, ICE candidate, command,
+SDP offer). Có thể replay message đã capture: file JSON lines, mỗi dòng
+{"topic": ..., "payload": ...}.
+
+Chạy (từ thư mục device/):
+    python scripts/bench_topic_router.py [--messages 100000] [--capture messages.jsonl]
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mqtt"))
+
+from router import PayloadLogSampler, TopicRouter
+
+DEVICE = "device-001"
+TOPICS = {
+    "server_tts": f"server/{DEVICE}/audio",
+    "server_command": f"server/{DEVICE}/command",
+    "server_pong": f"server/{DEVICE}/pong",
+    "mobile_offer": f"mobile/{DEVICE}/webrtc/offer",
+    "mobile_answer": f"mobile/{DEVICE}/webrtc/answer",
+    "mobile_candidate": f"mobile/{DEVICE}/webrtc/candidate",
+}
+
+
+def make_logger(name):
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [logging.FileHandler(os.devnull)]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def synthetic_mix(count, seed=0):
+    """~70% audio chunk, ~20% ICE candidate, ~9% command / pong, ~1% SDP offer"""
+    rng = random.Random(seed)
+    audio = {"serverStreamId": 42, "chunkIndex": 0, "totalChunks": 0, "isLast": False,
+             "format": "pcm16le", "sampleRate": 16000,
+             "data": base64.b64encode(bytes(3200)).decode()}
+    candidate = {"candidate": "candidate:842163049 1 udp 1677729535 203.0.113.7 54321 typ srflx "
+                              "raddr 192.168.1.20 rport 54321 generation 0 ufrag abcd network-cost 999",
+                 "sdpMid": "0", "sdpMLineIndex": 0}
+    command = {"command": "send_sms", "phone_number": "+84000000000", "message": "test"}
+    offer = {"type": "offer", "sdp": "v=0\r\n" + "a=candidate:1 1 udp 2122260223 10.0.0.1 5000 typ host\r\n" * 60}
+    messages = []
+    for _ in range(count):
+        r = rng.random()
+        if r < 0.70:
+            messages.append((TOPICS["server_tts"], audio))
+        elif r < 0.90:
+            messages.append((TOPICS["mobile_candidate"], candidate))
+        elif r < 0.95:
+            messages.append((TOPICS["server_command"], command))
+        elif r < 0.99:
+            messages.append((TOPICS["server_pong"], {"data": "PONG"}))
+        else:
+            messages.append((TOPICS["mobile_offer"], offer))
+    return messages
+
+
+def load_capture(path):
+    with open(path) as f:
+        return [(m["topic"], m["payload"]) for m in map(json.loads, f) if m]
+
+
+def noop(payload):
+    pass
+
+
+def legacy_route(logger, topic, payload):
+    """Code cũ: MQTTClient._on_message + MessageHandler.handle_message"""
+    if topic.endswith("/audio"):
+        logger.info(f"Received message on {topic}")
+    else:
+        logger.info(f"Received message on {topic}: {payload}")
+    if not topic.endswith("/audio"):
+        logger.info(f"Handling {topic}")
+    if topic.endswith("/audio"):
+        noop(payload)
+    elif topic.endswith("/command"):
+        noop(payload)
+    elif topic.endswith("webrtc/offer"):
+        noop(payload)
+    elif topic.endswith("webrtc/candidate"):
+        noop(payload)
+    elif topic.endswith("webrtc/answer"):
+        noop(payload)
+    else:
+        logger.warning(f"No handler for {topic}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MQTT topic routing")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--capture", help="File JSON lines {topic, payload} để replay")
+    args = parser.parse_args()
+
+    messages = load_capture(args.capture) if args.capture else synthetic_mix(args.messages)
+    print(f"Messages: {len(messages)} ({'capture ' + args.capture if args.capture else 'synthetic mix'})")
+
+    legacy_logger = make_logger("bench.legacy")
+    start = time.perf_counter()
+    for topic, payload in messages:
+        legacy_route(legacy_logger, topic, payload)
+    legacy_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    router = TopicRouter()
+    for topic in TOPICS.values():
+        router.add(topic, noop)
+    router.add("server/+/status/#", noop)  # Một filter wildcard để tính cả đường so khớp
+    sampler = PayloadLogSampler(make_logger("bench.router"))
+    router_logger = make_logger("bench.router.warn")
+    start = time.perf_counter()
+    for topic, payload in messages:
+        sampler.log(topic, payload)
+        if not router.route(topic, payload):
+            router_logger.warning(f"No handler for {topic}")
+    router_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    print(f"legacy  {legacy_us:8.2f} µs/message")
+    print(f"router  {router_us:8.2f} µs/message  ({legacy_us / router_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
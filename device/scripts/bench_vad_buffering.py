@@ -0,0 +1,110 @@
+"""
+Benchmark VAD Buffering
+=======================
+
+Đo chi phí mỗi chunk của VoiceActivityDetector khi lắng nghe liên tục,
+so với cách buffer bằng list cũ (list slicing + np.concatenate).
+
+Chạy trên thiết bị (từ thư mục device/):
+    python scripts/bench_vad_buffering.py [--seconds 60] [--chunk-ms 100]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.vad import VoiceActivityDetector
+
+
+class LegacyListBuffering:
+    """Cách buffer cũ của VoiceActivityDetector, giữ lại để so sánh"""
+
+    def __init__(self):
+        self.audio_buffer = []
+
+    def idle(self, chunk):
+        if len(self.audio_buffer) < 10:
+            self.audio_buffer.append(chunk)
+        else:
+            self.audio_buffer = self.audio_buffer[1:] + [chunk]
+
+    def speak(self, chunk):
+        self.audio_buffer.append(chunk)
+
+    def finish(self):
+        audio = np.concatenate(self.audio_buffer).flatten()
+        self.audio_buffer = []
+        return audio
+
+
+def make_chunks(n, samples, level, seed):
+    rng = np.random.default_rng(seed)
+    return [(rng.normal(0, level, (samples, 1))).astype(np.float32) for _ in range(n)]
+
+
+def bench_legacy(idle_chunks, speech_chunks):
+    legacy = LegacyListBuffering()
+    start = time.perf_counter()
+    for chunk in idle_chunks:
+        np.sqrt(np.mean(chunk.astype(np.float32) ** 2))
+        legacy.idle(chunk)
+    idle_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for chunk in speech_chunks:
+        np.sqrt(np.mean(chunk.astype(np.float32) ** 2))
+        legacy.speak(chunk)
+    legacy.finish()
+    speech_time = time.perf_counter() - start
+    return idle_time, speech_time
+
+
+def bench_vad(idle_chunks, speech_chunks, rate):
+    vad = VoiceActivityDetector(sample_rate=rate, silence_threshold=0.02,
+                                silence_duration=0.0, min_speech_duration=0.0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for chunk in idle_chunks:
+            vad.process_audio_chunk(chunk)
+        idle_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for chunk in speech_chunks:
+            vad.process_audio_chunk(chunk)
+        # Một chunk im lặng để kết thúc câu nói (silence_duration = 0)
+        vad.process_audio_chunk(idle_chunks[0])
+        vad.process_audio_chunk(idle_chunks[0])
+        speech_time = time.perf_counter() - start
+    return idle_time, speech_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=60.0, help="Thời lượng mỗi kịch bản")
+    args = parser.parse_args()
+
+    samples = int(args.rate * args.chunk_ms / 1000)
+    n = int(args.seconds * 1000 / args.chunk_ms)
+    idle_chunks = make_chunks(n, samples, 0.002, seed=1)
+    speech_chunks = make_chunks(n, samples, 0.2, seed=2)
+
+    legacy = bench_legacy(idle_chunks, speech_chunks)
+    current = bench_vad(idle_chunks, speech_chunks, args.rate)
+
+    print(f"{n} chunks x {args.chunk_ms} ms @ {args.rate}Hz per scenario")
+    print(f"{'scenario':<12}{'legacy us/chunk':>18}{'ring us/chunk':>16}")
+    for name, old, new in (("idle", legacy[0], current[0]), ("speaking", legacy[1], current[1])):
+        print(f"{name:<12}{old / n * 1e6:>18.1f}{new / n * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
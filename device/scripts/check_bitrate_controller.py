@@ -0,0 +1,108 @@
+"""
+Check Bitrate Controller
+========================
+
+Kiểm tra VideoQualityController với stats report giả lập theo aiortc:
+`RTCRemoteInboundRtpStreamStats.fractionLost` là giá trị 8 bit của RTCP
+receiver report (0-255), controller phải đổi sang tỉ lệ 0-1 trước khi so với
+`loss_high` / `loss_low`.
+
+- Mất gói ~1% (fractionLost=3): giữ nguyên bậc
+- Mất gói ~16% (fractionLost=40): hạ bậc sau `degrade_samples` mẫu
+- Mất gói ~0.4% (fractionLost=1), RTT thấp: nâng bậc lại
+
+Chạy (từ thư mục device/):
+    python scripts/check_bitrate_controller.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+DEVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DEVICE_DIR)
+sys.path.insert(0, os.path.join(DEVICE_DIR, "mqtt"))
+
+from bitrate_controller import QUALITY_LADDER, VideoQualityController
+
+
+class StubPeerConnection:
+    """RTCPeerConnection giả: getStats() trả report dựng sẵn"""
+
+    connectionState = "connected"
+
+    def __init__(self):
+        self.fraction_lost = 0
+        self.rtt = 0.05
+        self.bytes_sent = 0
+
+    async def getStats(self):
+        self.bytes_sent += 50_000
+        return {
+            "remote-inbound-rtp-audio": SimpleNamespace(type="remote-inbound-rtp", kind="audio",
+                                                        roundTripTime=self.rtt, fractionLost=0),
+            "remote-inbound-rtp-video": SimpleNamespace(type="remote-inbound-rtp", kind="video",
+                                                        roundTripTime=self.rtt, fractionLost=self.fraction_lost),
+            "outbound-rtp-video": SimpleNamespace(type="outbound-rtp", kind="video", bytesSent=self.bytes_sent),
+        }
+
+
+class StubVideoTrack:
+    def __init__(self):
+        self.steps = []
+
+    def set_quality(self, step):
+        self.steps.append(step.name)
+
+
+async def feed(controller, pc, fraction_lost, samples):
+    pc.fraction_lost = fraction_lost
+    for _ in range(samples):
+        sample = await controller._sample()
+        controller._last_sample = sample
+        controller._evaluate(sample)
+    return controller.current_step.name
+
+
+async def run_checks():
+    failures = []
+    pc = StubPeerConnection()
+    track = StubVideoTrack()
+    controller = VideoQualityController(pc, track, QUALITY_LADDER, min_hold=0)
+    controller._apply(controller.step_index)
+
+    pc.fraction_lost = 128
+    sample = await controller._sample()
+    if abs(sample.fraction_lost - 0.5) > 1e-9:
+        failures.append(f"fractionLost=128 read as {sample.fraction_lost}, expected 0.5")
+
+    step = await feed(controller, pc, 3, 10)
+    if step != "high":
+        failures.append(f"~1% loss moved quality to {step}, expected high")
+
+    step = await feed(controller, pc, 40, controller.degrade_samples)
+    if step != "medium":
+        failures.append(f"~16% loss left quality at {step}, expected medium")
+
+    step = await feed(controller, pc, 1, controller.upgrade_samples)
+    if step != "high":
+        failures.append(f"~0.4% loss left quality at {step}, expected upgrade to high")
+
+    print(f"steps applied: {' -> '.join(track.steps)}")
+    return failures
+
+
+def main():
+    argparse.ArgumentParser(description="Check VideoQualityController loss handling with stub stats").parse_args()
+    failures = asyncio.run(run_checks())
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
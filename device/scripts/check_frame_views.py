@@ -0,0 +1,130 @@
+"""
+Check Frame Views
+=================
+
+Kiểm tra hồi quy cho cache view của FrameViews: gọi `video_frame()` và
+`jpeg()` (các view gọi lồng sang `rgb()` / `bgr`) trên frame BGR, YUYV và
+I420, cả tuần tự lẫn từ nhiều thread cùng lúc. Mỗi lần gọi chạy trong thread
+riêng có timeout - nếu cache giữ lock chung trong lúc tính view thì lời gọi
+lồng sẽ tự deadlock và script báo lỗi thay vì treo.
+
+Chạy (từ thư mục device/):
+    python scripts/check_frame_views.py [--width 1280 --height 720] [--timeout 5]
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.camera.frame_views import FrameViews, PIXEL_FORMAT_BGR, PIXEL_FORMAT_I420, PIXEL_FORMAT_YUYV
+
+OUT_SIZE = (640, 480)
+
+
+def make_frames(width, height):
+    rng = np.random.default_rng(0)
+    bgr = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    yuyv = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV)
+    # YUYV packed: kênh 0 = Y, kênh 1 xen kẽ U / V
+    packed = np.empty((height, width, 2), dtype=np.uint8)
+    packed[:, :, 0] = yuyv[:, :, 0]
+    packed[:, 0::2, 1] = yuyv[:, 0::2, 1]
+    packed[:, 1::2, 1] = yuyv[:, 1::2, 2]
+    i420 = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+    return {
+        PIXEL_FORMAT_BGR: bgr,
+        PIXEL_FORMAT_YUYV: packed,
+        PIXEL_FORMAT_I420: i420,
+    }
+
+
+def call_with_timeout(fn, timeout):
+    """Chạy fn trong thread riêng; trả về (ok, kết quả hoặc lỗi)"""
+    result = {}
+
+    def run():
+        try:
+            result['value'] = fn()
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        return False, "timeout (deadlock?)"
+    if 'error' in result:
+        return False, repr(result['error'])
+    return True, result['value']
+
+
+def check_sequential(name, raw, pixel_format, timeout):
+    failures = []
+    for order in (("video_frame", "jpeg"), ("jpeg", "video_frame")):
+        views = FrameViews(raw, pixel_format=pixel_format)
+        for method in order:
+            call = (lambda: views.video_frame(OUT_SIZE)) if method == "video_frame" else views.jpeg
+            ok, value = call_with_timeout(call, timeout)
+            if not ok:
+                failures.append(f"{name}: {' -> '.join(order)}: {method}() {value}")
+                break
+            if method == "video_frame" and (value.width, value.height) != OUT_SIZE:
+                failures.append(f"{name}: video_frame() size {value.width}x{value.height}")
+            if method == "jpeg" and not value:
+                failures.append(f"{name}: jpeg() returned no data")
+    return failures
+
+
+def check_concurrent(name, raw, pixel_format, timeout, threads=8):
+    """Nhiều consumer yêu cầu view cùng lúc: mỗi view chỉ được tính một lần"""
+    views = FrameViews(raw, pixel_format=pixel_format)
+    results = []
+
+    def worker(index):
+        value = views.video_frame(OUT_SIZE) if index % 2 else views.jpeg()
+        results.append((index % 2, id(value)))
+
+    def run_all():
+        workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    ok, value = call_with_timeout(run_all, timeout)
+    if not ok:
+        return [f"{name}: concurrent {value}"]
+    distinct = {kind: {obj for k, obj in results if k == kind} for kind in (0, 1)}
+    if len(results) != threads or any(len(ids) != 1 for ids in distinct.values()):
+        return [f"{name}: concurrent calls returned different objects for the same view"]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regression check for FrameViews nested cached views")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--timeout", type=float, default=5.0, help="Giây cho mỗi lần gọi")
+    args = parser.parse_args()
+
+    failures = []
+    for pixel_format, raw in make_frames(args.width, args.height).items():
+        failures += check_sequential(pixel_format, raw, pixel_format, args.timeout)
+        failures += check_concurrent(pixel_format, raw, pixel_format, args.timeout)
+        print(f"{pixel_format:<5} checked")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+VAD Evaluation
+==============
+
+Chạy các VAD engine offline trên file WAV và báo cáo tỉ lệ kích hoạt sai
+(false trigger) cùng CPU time.
+
+- File nhiễu (--noise): mọi lần chuyển từ im lặng sang speech đều là false trigger
+- File giọng nói (--speech): đo tỉ lệ file được phát hiện và tỉ lệ chunk speech
+
+Chạy trên thiết bị hoặc máy dev (từ thư mục device/):
+    python scripts/eval_vad.py --noise recordings/street/*.wav --speech recordings/speech/*.wav
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.vad_engine import VAD_ENGINES, create_vad_engine
+
+
+def load_wav(path: str):
+    """Đọc WAV PCM 16-bit, trả về (float32 mono [-1, 1], sample_rate)"""
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: chỉ hỗ trợ WAV PCM 16-bit")
+        data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        if wf.getnchannels() > 1:
+            data = data.reshape(-1, wf.getnchannels())[:, 0]
+        return data.astype(np.float32) / 32768.0, wf.getframerate()
+
+
+def run_engine(name: str, audio: np.ndarray, rate: int, chunk_ms: int, threshold: float):
+    """Chạy engine trên toàn bộ file theo chunk, trả về (decisions, cpu_seconds)"""
+    engine = create_vad_engine(name, rate, threshold)
+    chunk = int(rate * chunk_ms / 1000)
+    decisions = []
+    start = time.process_time()
+    for offset in range(0, len(audio) - chunk + 1, chunk):
+        is_speech, _ = engine.process(audio[offset:offset + chunk])
+        decisions.append(is_speech)
+    return np.array(decisions, dtype=bool), time.process_time() - start
+
+
+def count_triggers(decisions: np.ndarray) -> int:
+    """Số lần chuyển từ non-speech sang speech (mỗi lần VAD bắt đầu thu âm)"""
+    if decisions.size == 0:
+        return 0
+    return int(decisions[0]) + int(np.count_nonzero(decisions[1:] & ~decisions[:-1]))
+
+
+def expand(patterns):
+    files = []
+    for pattern in patterns or []:
+        files.extend(sorted(glob.glob(pattern)) or [pattern])
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--noise", nargs="*", help="WAV chỉ có nhiễu (không có giọng nói)")
+    parser.add_argument("--speech", nargs="*", help="WAV có giọng nói")
+    parser.add_argument("--engines", default=",".join(VAD_ENGINES), help="Danh sách engine, phân cách bởi dấu phẩy")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--threshold", type=float, default=0.02, help="Ngưỡng cho engine rms")
+    args = parser.parse_args()
+
+    noise_files = expand(args.noise)
+    speech_files = expand(args.speech)
+    if not noise_files and not speech_files:
+        parser.error("cần ít nhất một file --noise hoặc --speech")
+
+    clips = [(path, "noise", *load_wav(path)) for path in noise_files]
+    clips += [(path, "speech", *load_wav(path)) for path in speech_files]
+
+    print(f"{'engine':<10}{'false trig/min':>16}{'noise spch%':>13}{'speech det%':>13}"
+          f"{'speech spch%':>14}{'cpu ms/s':>10}")
+    for name in args.engines.split(","):
+        stats = {"noise": [0, 0, 0, 0.0], "speech": [0, 0, 0, 0.0]}  # triggers, speech chunks, chunks, seconds
+        detected = 0
+        cpu_total = 0.0
+        audio_total = 0.0
+        for path, kind, audio, rate in clips:
+            decisions, cpu = run_engine(name, audio, rate, args.chunk_ms, args.threshold)
+            triggers = count_triggers(decisions)
+            s = stats[kind]
+            s[0] += triggers
+            s[1] += int(np.count_nonzero(decisions))
+            s[2] += decisions.size
+            s[3] += len(audio) / rate
+            if kind == "speech" and triggers > 0:
+                detected += 1
+            cpu_total += cpu
+            audio_total += len(audio) / rate
+
+        noise, speech = stats["noise"], stats["speech"]
+        false_rate = noise[0] / (noise[3] / 60) if noise[3] else float("nan")
+        noise_ratio = 100 * noise[1] / noise[2] if noise[2] else float("nan")
+        detect_ratio = 100 * detected / len(speech_files) if speech_files else float("nan")
+        speech_ratio = 100 * speech[1] / speech[2] if speech[2] else float("nan")
+        cpu_per_s = 1000 * cpu_total / audio_total if audio_total else float("nan")
+        print(f"{name:<10}{false_rate:>16.2f}{noise_ratio:>13.1f}{detect_ratio:>13.1f}"
+              f"{speech_ratio:>14.1f}{cpu_per_s:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Outbox Crash Recovery Test
+==========================
+
+Kiểm tra MQTT outbox qua các lần crash, với một broker MQTT 3.1.1 giả lập
+(chỉ CONNECT / PUBLISH / PUBACK / SUBSCRIBE / PING) chạy trong process:
+
+1. writer: ghi N message GPS (+ cảnh báo vật cản mỗi 10 message) khi mất
+   kết nối, rồi crash (os._exit) giữa lúc ghi một record
+2. drainer: kết nối tới broker, drain outbox qua PublishPipeline và bị
+   SIGKILL sau khi broker đã nhận một phần message
+3. drainer lần hai: drain phần còn lại
+
+Kiểm tra: record ghi dở bị cắt bỏ, broker nhận đủ mọi message đã fsync theo
+đúng thứ tự (cho phép gửi lại tối đa một lô sau crash), outbox trống ở cuối.
+
+Chạy (từ thư mục device/):
+    python scripts/outbox_crash_recovery.py [--messages 200] [--kill-after 60]
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GPS_TOPIC = "device/test/gps"
+OBSTACLE_TOPIC = "device/test/obstacle"
+BATCH = 8
+
+
+# ----- Broker giả lập -----
+
+def _read_exact(conn, n):
+    data = b""
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("closed")
+        data += chunk
+    return data
+
+
+def _read_packet(conn):
+    first = _read_exact(conn, 1)[0]
+    length, shift = 0, 0
+    while True:
+        byte = _read_exact(conn, 1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return first, _read_exact(conn, length)
+
+
+class FakeBroker:
+    """Broker MQTT tối thiểu: ghi lại (topic, payload) của mọi PUBLISH, trả PUBACK cho QoS1"""
+
+    def __init__(self):
+        self.received = []
+        self._lock = threading.Lock()
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(4)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def count(self):
+        with self._lock:
+            return len(self.received)
+
+    def _accept_loop(self):
+        while True:
+            conn, _ = self._server.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            while True:
+                first, body = _read_packet(conn)
+                packet_type = first >> 4
+                if packet_type == 1:      # CONNECT
+                    conn.sendall(b"\x20\x02\x00\x00")
+                elif packet_type == 3:    # PUBLISH
+                    qos = (first >> 1) & 0x03
+                    topic_len = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + topic_len].decode()
+                    pos = 2 + topic_len
+                    if qos:
+                        packet_id = body[pos:pos + 2]
+                        pos += 2
+                    with self._lock:
+                        self.received.append((topic, body[pos:]))
+                    if qos == 1:
+                        conn.sendall(b"\x40\x02" + packet_id)
+                elif packet_type == 8:    # SUBSCRIBE
+                    conn.sendall(b"\x90\x03" + body[:2] + b"\x00")
+                elif packet_type == 12:   # PINGREQ
+                    conn.sendall(b"\xd0\x00")
+                elif packet_type == 14:   # DISCONNECT
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+# ----- Các phase chạy trong process con -----
+
+def phase_write(directory, count):
+    from mqtt.outbox import MQTTOutbox
+
+    outbox = MQTTOutbox(directory, coalesce_topics=[GPS_TOPIC], fsync_interval=0.05)
+    for seq in range(count):
+        if seq % 10 == 9:
+            data = json.dumps({"seq": seq, "distance": 0.8}).encode()
+            outbox.append(OBSTACLE_TOPIC, data, qos=1, topic_class="safety", durable=True)
+        else:
+            data = json.dumps({"seq": seq, "latitude": 10.77, "longitude": 106.69}).encode()
+            outbox.append(GPS_TOPIC, data, qos=1, topic_class="telemetry")
+    time.sleep(0.2)  # Chờ lô fsync cuối
+    # Crash giữa lúc ghi một record: chỉ nửa đầu được ghi ra đĩa
+    partial = b'{"seq": %d}' % count
+    outbox._file.write(struct.pack("<IIHBBB", len(partial), 0, len(GPS_TOPIC), 1, 0, 9) + GPS_TOPIC.encode()[:5])
+    os.fsync(outbox._file.fileno())
+    os._exit(9)
+
+
+def phase_drain(directory, port):
+    import paho.mqtt.client as mqtt
+    from mqtt.outbox import MQTTOutbox
+    from mqtt.publisher import PublishPipeline
+
+    client = mqtt.Client(client_id="outbox-test", clean_session=True, protocol=mqtt.MQTTv311)
+    publisher = PublishPipeline(client, window=BATCH)
+    outbox = MQTTOutbox(directory, coalesce_topics=[GPS_TOPIC], drain_rate=200, drain_bytes=1024 * 1024,
+                        batch=BATCH)
+    print(f"  recovered: {outbox.get_stats()}", flush=True)
+    client.on_publish = publisher.on_publish
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        publisher.set_connected(True)
+        outbox.set_online(True)
+
+    client.on_connect = on_connect
+    outbox.start_drain(lambda record, callback: publisher.submit(
+        record.topic, record.data, qos=record.qos, retain=record.retain,
+        topic_class=record.topic_class, callback=callback))
+    client.connect("127.0.0.1", port, keepalive=30)
+    client.loop_start()
+
+    deadline = time.monotonic() + 60
+    while outbox.pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+    print(f"  drained: {outbox.get_stats()}", flush=True)
+    outbox.close()
+    client.disconnect()
+    client.loop_stop()
+    sys.exit(0 if not outbox.pending else 1)
+
+
+# ----- Điều phối -----
+
+def run_phase(*args):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), *args])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT outbox crash recovery test")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--kill-after", type=int, default=60, help="SIGKILL drainer sau khi broker nhận N message")
+    parser.add_argument("--phase", choices=["write", "drain"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase == "write":
+        return phase_write(args.dir, args.messages)
+    if args.phase == "drain":
+        return phase_drain(args.dir, args.port)
+
+    broker = FakeBroker()
+    with tempfile.TemporaryDirectory(prefix="outbox-") as directory:
+        print(f"1. writer: {args.messages} messages, crash mid-record")
+        code = run_phase("--phase", "write", "--dir", directory, "--messages", str(args.messages)).wait()
+        assert code == 9, f"writer exited with {code}"
+
+        print(f"2. drainer: SIGKILL after {args.kill_after} messages")
+        proc = run_phase("--phase", "drain", "--dir", directory, "--port", str(broker.port))
+        while broker.count() < args.kill_after and proc.poll() is None:
+            time.sleep(0.001)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+        received_before_kill = broker.count()
+        print(f"  broker received {received_before_kill} before kill")
+
+        print("3. drainer: finish")
+        code = run_phase("--phase", "drain", "--dir", directory, "--port", str(broker.port)).wait()
+        assert code == 0, f"drainer exited with {code}"
+
+    seqs = [json.loads(payload)["seq"] for _, payload in broker.received]
+    expected = list(range(args.messages))
+    missing = sorted(set(expected) - set(seqs))
+    duplicates = len(seqs) - len(set(seqs))
+    # Thứ tự: bỏ các lần gửi lại, dãy lần nhận đầu tiên phải tăng dần
+    first_seen = []
+    for seq in seqs:
+        if seq not in first_seen:
+            first_seen.append(seq)
+
+    print(f"\nReceived {len(seqs)} messages, {duplicates} duplicates, {len(missing)} missing")
+    assert args.messages not in seqs, "torn record was delivered"
+    assert not missing, f"missing messages: {missing[:20]}"
+    assert first_seen == expected, "messages delivered out of order"
+    assert duplicates <= BATCH, f"too many redeliveries: {duplicates}"
+    print("✅ Outbox crash recovery OK")
+
+
+if __name__ == "__main__":
+    main()